@@ -3,72 +3,125 @@ import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.dates as mdates
 import os
+from API_Engine import compute_api, monthly_mean, api_sweep_summary, sweep_to_frames, station_name
+from Date_Parser import parse_dates
+from API_Spells import extract_spells
+from Instrumentation import stage
 
 # Define file paths
 input_file_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Pdata_Petacciato.txt")
 output_file_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Output_API_mean.csv")
+sweep_mean_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Output_API_sweep_mean.csv")
+sweep_exceedance_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Output_API_sweep_exceedance.csv")
+spells_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Output_API_spells.csv")
 
-# Load the dataset
-data = pd.read_csv(input_file_path, sep='\s+', header=None, names=['Date', 'Precipitation'])
 
-# Convert 'Date' to datetime and 'Precipitation' to numeric
-data['Date'] = pd.to_datetime(data['Date'], format='%d/%m/%Y', errors='coerce')
-data['Precipitation'] = pd.to_numeric(data['Precipitation'], errors='coerce')
+def load_precipitation(input_file_path, start='2011-01-01', end='2022-12-31'):
+    """Load a whitespace 'dd/mm/yyyy value' gauge file as a sorted Date / Precipitation DataFrame."""
+    # Load the dataset
+    with stage('read_precipitation') as s:
+        data = pd.read_csv(input_file_path, sep='\s+', header=None, names=['Date', 'Precipitation'])
+        s.count(rows=len(data))
 
-# Drop rows with NaT or NaN values
-data = data.dropna().sort_values('Date').reset_index(drop=True)
+    # Convert 'Date' to datetime and 'Precipitation' to numeric
+    with stage('parse_dates') as s:
+        data['Date'] = parse_dates(data['Date'], formats=['%d/%m/%Y'])
+        data['Precipitation'] = pd.to_numeric(data['Precipitation'], errors='coerce')
+        s.count(rows=len(data))
 
-# Subset data from 2011 to 2022
-data = data[(data['Date'] >= '2011-01-01') & (data['Date'] <= '2022-12-31')]
+    # Drop rows with NaT or NaN values
+    data = data.dropna().sort_values('Date').reset_index(drop=True)
 
-# Define decay factor
-k = 0.85  # Adjust as needed
+    # Subset data from 2011 to 2022
+    return data[(data['Date'] >= start) & (data['Date'] <= end)]
 
-# Initialize API calculation
-data['API'] = 0.0
-for i in range(1, len(data)):
-    data.iloc[i, data.columns.get_loc('API')] = (
-        data.iloc[i, data.columns.get_loc('Precipitation')] + k * data.iloc[i-1, data.columns.get_loc('API')]
+
+def add_api(data, k=0.85):
+    """Add the API column: a linear filter over the whole series (API[0] = 0, as before)."""
+    with stage('api'):
+        data['API'] = compute_api(data['Precipitation'].to_numpy(), k)
+    return data
+
+
+def high_api_spells(data, threshold, station):
+    """High API spells of one station as events (start, end, duration, peak, cumulative excess)."""
+    with stage('spells'):
+        return extract_spells(data['Date'], data['API'].to_numpy(), threshold, stations=[station])
+
+
+def monthly_api(data):
+    """Monthly mean API as a Date (month end) / API DataFrame, like resample('M').mean()."""
+    with stage('monthly_mean'):
+        months, means = monthly_mean(data['Date'], data['API'].to_numpy())
+    return pd.DataFrame({'Date': months, 'API': means})
+
+
+def plot_api_spells(data, threshold):
+    """Scatter plot of the daily API with the high API spells shaded; returns the figure."""
+    fig = plt.figure(figsize=(16, 10))
+    sc = plt.scatter(
+        data['Date'], data['API'], c=data['API'], cmap='coolwarm', edgecolor='k', alpha=0.7, s=80
     )
 
-# Define threshold for high API values
-threshold = 100  # Adjust as needed
+    # Add color bar
+    cbar = plt.colorbar(sc)
+    cbar.set_label('API Level (mm)', fontsize=14)
+
+    # Highlight threshold line
+    plt.axhline(y=threshold, color='red', linestyle='--', linewidth=1.5, label=f'Threshold = {threshold} mm')
+
+    # Shade regions with high API
+    plt.fill_between(data['Date'], threshold, data['API'], where=(data['API'] > threshold), color='red', alpha=0.2, label='High API Spells')
+
+    # Format plot
+    plt.title('Enhanced API Spells Plot', fontsize=18)
+    plt.xlabel('Date', fontsize=14)
+    plt.ylabel('API (mm)', fontsize=14)
+    plt.grid(True, linestyle='--', alpha=0.5)
+    plt.legend(loc='upper left')
+
+    # Format x-axis with month/year ticks
+    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
+
 
-data['High_API'] = data['API'] > threshold
+if __name__ == "__main__":
+    data = load_precipitation(input_file_path)
 
-# Compute monthly mean API
-data_monthly = data.resample('M', on='Date')['API'].mean().reset_index()
+    # Define decay factor
+    k = 0.85  # Adjust as needed
+    add_api(data, k)
 
-# Export monthly mean API data to CSV
-data_monthly.to_csv(output_file_path, index=False)
-print(f"API monthly average data exported to {output_file_path}")
+    # Define threshold for high API values
+    threshold = 100  # Adjust as needed
 
-# Plot the API values
-plt.figure(figsize=(16, 10))
-sc = plt.scatter(
-    data['Date'], data['API'], c=data['API'], cmap='coolwarm', edgecolor='k', alpha=0.7, s=80
-)
+    data['High_API'] = data['API'] > threshold
 
-# Add color bar
-cbar = plt.colorbar(sc)
-cbar.set_label('API Level (mm)', fontsize=14)
+    spells = high_api_spells(data, threshold, station_name(input_file_path))
+    spells.to_csv(spells_path, index=False)
+    print(f"{len(spells)} high API spells exported to {spells_path}")
 
-# Highlight threshold line
-plt.axhline(y=threshold, color='red', linestyle='--', linewidth=1.5, label=f'Threshold = {threshold} mm')
+    # Compute monthly mean API
+    data_monthly = monthly_api(data)
 
-# Shade regions with high API
-plt.fill_between(data['Date'], threshold, data['API'], where=(data['API'] > threshold), color='red', alpha=0.2, label='High API Spells')
+    # Export monthly mean API data to CSV
+    data_monthly.to_csv(output_file_path, index=False)
+    print(f"API monthly average data exported to {output_file_path}")
 
-# Format plot
-plt.title('Enhanced API Spells Plot', fontsize=18)
-plt.xlabel('Date', fontsize=14)
-plt.ylabel('API (mm)', fontsize=14)
-plt.grid(True, linestyle='--', alpha=0.5)
-plt.legend(loc='upper left')
+    # Optional decay-factor sweep for calibrating k (set to None to skip)
+    k_sweep = None  # e.g. np.arange(0.80, 0.99 + 1e-9, 0.005)
+    sweep_thresholds = [60, 80, 90, 100]
 
-# Format x-axis with month/year ticks
-plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
-plt.xticks(rotation=45)
-plt.tight_layout()
+    if k_sweep is not None:
+        # All k values are computed in one batched pass over the parsed series
+        sweep = api_sweep_summary(data['Date'], data['Precipitation'].to_numpy(), k_sweep, sweep_thresholds)
+        sweep_monthly, sweep_exceedance = sweep_to_frames(sweep)
+        sweep_monthly.to_csv(sweep_mean_path, index=False)
+        sweep_exceedance.to_csv(sweep_exceedance_path, index=False)
+        print(f"API sweep over {len(sweep['k'])} decay factors exported to {sweep_mean_path} and {sweep_exceedance_path}")
 
-plt.show()
+    # Plot the API values
+    plot_api_spells(data, threshold)
+    plt.show()
@@ -0,0 +1,205 @@
+"""
+Vectorized Antecedent Precipitation Index (API) engine.
+
+The recursion API[i] = P[i] + k * API[i-1] is a first-order linear filter,
+so it is evaluated with scipy.signal.lfilter over whole NumPy arrays instead
+of a row-by-row Python loop. A (time x station) array is filtered in one call.
+"""
+import os
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from Date_Parser import parse_dates
+
+
+def compute_api(precipitation, k=0.85, api0=0.0):
+    """Compute API along axis 0 of a 1-D series or a (time x station) array.
+
+    The first row is set to api0 and the recursion starts at the second row,
+    exactly like the original loop in API_Calculation.py (data['API'] = 0.0,
+    then i = 1 .. n-1), so the results match it bit for bit.
+    """
+    P = np.asarray(precipitation, dtype=float)
+    squeeze = P.ndim == 1
+    if squeeze:
+        P = P[:, None]
+
+    api = np.empty_like(P)
+    if len(P) > 0:
+        api[0] = api0
+    if len(P) > 1:
+        # Initial filter state carries k * API[0] into the first step
+        zi = np.full((1, P.shape[1]), k * api0)
+        api[1:], _ = lfilter([1.0], [1.0, -k], P[1:], axis=0, zi=zi)
+
+    return api[:, 0] if squeeze else api
+
+
+def extend_api(precipitation, k, last_api):
+    """Continue the API recursion from a previous value over newly arrived rows.
+
+    Every output row is a recursion step, API[i] = P[i] + k * API[i-1] with
+    API[-1] = last_api, so appending rows gives the same values a full rerun
+    of compute_api would.
+    """
+    P = np.asarray(precipitation, dtype=float)
+    if len(P) == 0:
+        return P.copy()
+    zi = np.full((1,) + P.shape[1:], k * np.asarray(last_api, dtype=float))
+    api, _ = lfilter([1.0], [1.0, -k], P, axis=0, zi=zi)
+    return api
+
+
+def compute_api_frame(precipitation_df, k=0.85, api0=0.0, fill_value=0.0):
+    """Compute API for every station column of a wide (date x station) DataFrame.
+
+    Missing precipitation is replaced by fill_value (a dry day by default);
+    pass fill_value=None to let NaN propagate through the recursion instead.
+    """
+    P = precipitation_df.to_numpy(dtype=float)
+    if fill_value is not None:
+        P = np.where(np.isnan(P), fill_value, P)
+    api = compute_api(P, k=k, api0=api0)
+    return pd.DataFrame(api, index=precipitation_df.index, columns=precipitation_df.columns)
+
+
+def read_precipitation_file(file_path, start='2011-01-01', end='2022-12-31'):
+    """Load a whitespace 'Date Precipitation' gauge file the way API_Calculation.py does."""
+    data = pd.read_csv(file_path, sep=r'\s+', header=None, names=['Date', 'Precipitation'])
+    data['Date'] = parse_dates(data['Date'], formats=['%d/%m/%Y'])
+    data['Precipitation'] = pd.to_numeric(data['Precipitation'], errors='coerce')
+    data = data.dropna().sort_values('Date').reset_index(drop=True)
+    if start is not None:
+        data = data[data['Date'] >= start]
+    if end is not None:
+        data = data[data['Date'] <= end]
+    return data
+
+
+def station_name(file_path):
+    """Derive a station name from a gauge file name (Pdata_Petacciato.txt -> Petacciato)."""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return name[len('Pdata_'):] if name.startswith('Pdata_') else name
+
+
+def read_precipitation_table(file_paths, start='2011-01-01', end='2022-12-31'):
+    """Load several gauge files into one wide (date x station) DataFrame."""
+    columns = {}
+    for path in file_paths:
+        data = read_precipitation_file(path, start=start, end=end)
+        # Keep the last value if a date is duplicated within one gauge file
+        series = data.drop_duplicates('Date', keep='last').set_index('Date')['Precipitation']
+        columns[station_name(path)] = series
+    table = pd.DataFrame(columns).sort_index()
+    table.index.name = 'Date'
+    return table
+
+
+def compute_api_sweep(precipitation, k_values, api0=0.0):
+    """Compute API for a whole grid of decay factors in one batched pass.
+
+    precipitation is a 1-D series (or a time x station array); the result
+    gains a trailing k axis, e.g. (time x k). The recursion is unrolled as a
+    log-depth prefix scan (add k**s times the rows s steps back, s = 1, 2,
+    4, ...), so the cost is O(log T) array operations for any number of k
+    values. Results agree with compute_api to floating-point rounding.
+    """
+    P = np.asarray(precipitation, dtype=float)
+    k = np.asarray(k_values, dtype=float).ravel()
+
+    api = np.repeat(P[..., None], len(k), axis=-1)
+    if len(api) == 0:
+        return api
+    api[0] = api0
+
+    power = k.copy()
+    shift = 1
+    while shift < len(api):
+        api[shift:] += power * api[:-shift]
+        power = power * power
+        shift *= 2
+    return api
+
+
+def month_codes(dates):
+    """Return integer month codes (months since 1970-01) for an array of dates."""
+    months = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[M]')
+    return months.astype(np.int64)
+
+
+def monthly_mean(dates, values):
+    """Monthly mean of values along axis 0, like resample('M').mean().
+
+    Returns (month_end_dates, means). Every calendar month between the first
+    and last date is present; months without data are NaN, as with resample.
+    """
+    codes = month_codes(dates)
+    values = np.asarray(values, dtype=float)
+    if len(codes) == 0:
+        return np.array([], dtype='datetime64[D]'), values[:0]
+
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    counts = np.add.reduceat(valid, starts, axis=0)
+
+    first = codes[0]
+    means = np.full((codes[-1] - first + 1,) + values.shape[1:], np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means[codes[starts] - first] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    months = np.arange(first, codes[-1] + 1).astype('datetime64[M]')
+    month_ends = (months + 1).astype('datetime64[D]') - np.timedelta64(1, 'D')
+    return month_ends, means
+
+
+def api_sweep_summary(dates, precipitation, k_values, thresholds):
+    """Run a k sweep and summarise it for every (k, threshold) pair.
+
+    Returns a dict with:
+        'k', 'thresholds'      - the grids as arrays
+        'api'                  - daily API, (time x k)
+        'months'               - month-end dates of the monthly means
+        'monthly_mean'         - monthly mean API, (month x k)
+        'exceedance_days'      - days with API > threshold, (k x threshold)
+        'exceedance_months'    - months with mean API > threshold, (k x threshold)
+    """
+    k = np.asarray(k_values, dtype=float).ravel()
+    thresholds = np.asarray(thresholds, dtype=float).ravel()
+
+    api = compute_api_sweep(precipitation, k)
+    months, means = monthly_mean(dates, api)
+
+    # High API is strictly above the threshold, as in data['High_API']
+    exceedance_days = (api[:, :, None] > thresholds).sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        exceedance_months = (means[:, :, None] > thresholds).sum(axis=0)
+
+    return {
+        'k': k,
+        'thresholds': thresholds,
+        'api': api,
+        'months': months,
+        'monthly_mean': means,
+        'exceedance_days': exceedance_days,
+        'exceedance_months': exceedance_months,
+    }
+
+
+def sweep_to_frames(summary):
+    """Convert api_sweep_summary output to (monthly_mean_df, exceedance_df) for export."""
+    k_labels = [f"k={k:.3f}" for k in summary['k']]
+    monthly_df = pd.DataFrame(summary['monthly_mean'], columns=k_labels)
+    monthly_df.insert(0, 'Date', pd.to_datetime(summary['months']))
+
+    kk, tt = np.meshgrid(summary['k'], summary['thresholds'], indexing='ij')
+    exceedance_df = pd.DataFrame({
+        'k': kk.ravel(),
+        'Threshold': tt.ravel(),
+        'Exceedance_Days': summary['exceedance_days'].ravel(),
+        'Exceedance_Months': summary['exceedance_months'].ravel(),
+    })
+    return monthly_df, exceedance_df
@@ -0,0 +1,215 @@
+"""
+Incremental API updater for appended precipitation rows.
+
+A small JSON state file per station keeps the last API value and date, the
+running sum/count of the current (partial) month, how far the precipitation
+file has been read and where the current month's row starts in the output
+CSV. New rows are folded in at O(new rows) cost and Output_API_mean.csv is
+updated in place; the first run (or --rebuild) computes everything once.
+
+Usage:
+    python API_Incremental.py Pdata_Petacciato.txt --output Output_API_mean.csv
+    python API_Incremental.py Pdata_*.txt --output "API/Output_API_mean_{station}.csv"
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+from API_Engine import compute_api, extend_api, month_codes, station_name
+from Date_Parser import parse_dates
+
+STATE_VERSION = 1
+
+# Default file paths (same as API_Calculation.py)
+input_file_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Pdata_Petacciato.txt")
+output_file_path = os.path.join("D:", "PhD_Main", "STPD", "STPD", "Output_API_mean.csv")
+
+
+def parse_precipitation(text, start=None):
+    """Parse 'Date Precipitation' rows the way API_Calculation.py does (coerce, drop, sort)."""
+    if not text.strip():
+        return pd.DataFrame({'Date': pd.Series(dtype='datetime64[ns]'), 'Precipitation': pd.Series(dtype=float)})
+    data = pd.read_csv(io.StringIO(text), sep=r'\s+', header=None, names=['Date', 'Precipitation'])
+    data['Date'] = parse_dates(data['Date'], formats=['%d/%m/%Y'])
+    data['Precipitation'] = pd.to_numeric(data['Precipitation'], errors='coerce')
+    data = data.dropna().sort_values('Date', kind='stable').reset_index(drop=True)
+    if start is not None:
+        data = data[data['Date'] >= start].reset_index(drop=True)
+    return data
+
+
+def read_complete_lines(file_path, offset=0):
+    """Read the complete lines after a byte offset; return (text, offset after the last newline)."""
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b'\n') + 1
+    # A file without a trailing newline is still read in full on a rebuild
+    text = chunk.decode() if offset == 0 else chunk[:end].decode()
+    return text, offset + end
+
+
+def month_row(code, total, count):
+    """Format one output row: month-end date and the monthly mean API (empty if no data)."""
+    month_end = (np.datetime64(int(code) + 1, 'M').astype('datetime64[D]') - np.timedelta64(1, 'D'))
+    value = repr(float(total) / int(count)) if count else ''
+    return f"{month_end},{value}\n".encode()
+
+
+def monthly_totals(dates, api):
+    """Return (month codes, sums, counts) of consecutive months present in sorted data."""
+    codes = month_codes(dates)
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    return codes[starts], np.add.reduceat(api, starts), np.diff(np.r_[starts, len(codes)])
+
+
+def load_state(state_path):
+    """Load a station state file, or return None if there is none."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def save_state(state_path, state):
+    """Write the state file atomically so an interrupted run never leaves it half-written."""
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def rebuild(file_path, output_path, state_path, k=0.85, start='2011-01-01'):
+    """Compute API and monthly means from the whole file and write output and state."""
+    text, source_offset = read_complete_lines(file_path)
+    data = parse_precipitation(text, start=start)
+    if data.empty:
+        raise ValueError(f"No valid precipitation rows in {file_path}")
+
+    api = compute_api(data['Precipitation'].to_numpy(), k)
+    codes, sums, counts = monthly_totals(data['Date'], api)
+
+    # Every month between the first and last one gets a row, as with resample('M')
+    totals = dict(zip(codes.tolist(), zip(sums.tolist(), counts.tolist())))
+    with open(output_path, 'wb') as f:
+        f.write(b"Date,API\n")
+        for code in range(codes[0], codes[-1]):
+            f.write(month_row(code, *totals.get(code, (0.0, 0))))
+        output_offset = f.tell()
+        f.write(month_row(codes[-1], sums[-1], counts[-1]))
+
+    state = {
+        'version': STATE_VERSION,
+        'station': station_name(file_path),
+        'k': k,
+        'start': start,
+        'last_date': data['Date'].iloc[-1].strftime('%Y-%m-%d'),
+        'last_api': float(api[-1]),
+        'month_code': int(codes[-1]),
+        'month_sum': float(sums[-1]),
+        'month_count': int(counts[-1]),
+        'source_offset': source_offset,
+        'output_offset': output_offset,
+    }
+    save_state(state_path, state)
+    return len(data), state
+
+
+def update(file_path, output_path, state_path, k=0.85, start='2011-01-01', force_rebuild=False):
+    """Fold rows appended since the last run into the API state and the output CSV.
+
+    Returns (number of rows processed, new state). Falls back to a full
+    rebuild when there is no usable state, the parameters changed, or the
+    source file was truncated/replaced.
+    """
+    state = load_state(state_path)
+    if (force_rebuild or state is None or state['k'] != k or state['start'] != start
+            or not os.path.exists(output_path)
+            or os.path.getsize(file_path) < state['source_offset']
+            or os.path.getsize(output_path) < state['output_offset']):
+        return rebuild(file_path, output_path, state_path, k=k, start=start)
+
+    text, source_offset = read_complete_lines(file_path, state['source_offset'])
+    data = parse_precipitation(text, start=start)
+
+    # Rows at or before the last processed date cannot be folded in incrementally
+    last_date = pd.Timestamp(state['last_date'])
+    late = int((data['Date'] < last_date).sum())
+    if late:
+        print(f"Warning: {late} out-of-order rows in {file_path} ignored; run with --rebuild to include them.")
+    data = data[data['Date'] > last_date]
+
+    state['source_offset'] = source_offset
+    if data.empty:
+        save_state(state_path, state)
+        return 0, state
+
+    api = extend_api(data['Precipitation'].to_numpy(), k, state['last_api'])
+    codes, sums, counts = monthly_totals(data['Date'], api)
+
+    # Close the current month if new months started, then rewrite from its row
+    current, total, count = state['month_code'], state['month_sum'], state['month_count']
+    rows = []
+    for code, month_sum, month_count in zip(codes.tolist(), sums.tolist(), counts.tolist()):
+        if code == current:
+            total, count = total + month_sum, count + month_count
+            continue
+        rows.append(month_row(current, total, count))
+        rows.extend(month_row(gap, 0.0, 0) for gap in range(current + 1, code))
+        current, total, count = code, month_sum, month_count
+
+    with open(output_path, 'r+b') as f:
+        f.seek(state['output_offset'])
+        f.truncate()
+        for row in rows:
+            f.write(row)
+        output_offset = f.tell()
+        f.write(month_row(current, total, count))
+
+    state.update({
+        'last_date': data['Date'].iloc[-1].strftime('%Y-%m-%d'),
+        'last_api': float(api[-1]),
+        'month_code': int(current),
+        'month_sum': float(total),
+        'month_count': int(count),
+        'output_offset': output_offset,
+    })
+    save_state(state_path, state)
+    return len(data), state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally update monthly mean API from appended precipitation rows.")
+    parser.add_argument('inputs', nargs='*', default=[input_file_path],
+                        help="Precipitation files (glob patterns allowed)")
+    parser.add_argument('--output', default=output_file_path,
+                        help="Output CSV; use {station} in the name when updating several stations")
+    parser.add_argument('--state-dir', default=None,
+                        help="Directory for state files (default: next to each output file)")
+    parser.add_argument('-k', type=float, default=0.85, help="Decay factor")
+    parser.add_argument('--start', default='2011-01-01', help="Ignore precipitation before this date")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute from the full files")
+    args = parser.parse_args()
+
+    inputs = [path for pattern in args.inputs for path in (sorted(glob.glob(pattern)) or [pattern])]
+    if len(inputs) > 1 and '{station}' not in args.output:
+        parser.error("--output must contain {station} when several input files are given")
+
+    for file_path in inputs:
+        if not os.path.exists(file_path):
+            print(f"Error: File {file_path} not found.")
+            continue
+        station = station_name(file_path)
+        output_path = args.output.format(station=station)
+        state_dir = args.state_dir or os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(state_dir, exist_ok=True)
+        state_path = os.path.join(state_dir, f"{station}.api_state.json")
+
+        rows, state = update(file_path, output_path, state_path, k=args.k, start=args.start,
+                             force_rebuild=args.rebuild)
+        print(f"{station}: {rows} rows processed, last date {state['last_date']}, "
+              f"API = {state['last_api']:.2f} mm -> {output_path}")
@@ -1,53 +1,72 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from API_Spells import extract_spells
 
 # File path to your API dataset
 apipath = "D:/PhD_Main/STPD/STPD/Output_API_mean.csv"
+save_path = "D:/PhD_Main/STPD/STPD/RESULTS/Paper/API_PLOT.png"
 
-# Load the dataset
-df = pd.read_csv(apipath)
+# Set the API threshold for high spells
+api_threshold = 90  # Adjusted threshold to 60 mm
 
-# Ensure correct column names (Modify based on your dataset)
-df.columns = ['Date', 'API']  # Assuming the second column contains API values
 
-# Convert Date column to datetime format
-df['Date'] = pd.to_datetime(df['Date'])
+def read_api(apipath):
+    """Load the monthly API CSV as a Date / API DataFrame sorted by date."""
+    df = pd.read_csv(apipath)
 
-# Sort data by date
-df = df.sort_values(by='Date')
+    # Ensure correct column names (Modify based on your dataset)
+    df.columns = ['Date', 'API']  # Assuming the second column contains API values
 
-# Set the API threshold for high spells
-api_threshold = 90  # Adjusted threshold to 60 mm
+    # Convert Date column to datetime format
+    df['Date'] = pd.to_datetime(df['Date'])
 
-# Identify high API spells
-df['High_Spell'] = df['API'] >= api_threshold  # Boolean column for high API spells
+    # Sort data by date
+    return df.sort_values(by='Date')
 
-# Create the figure
-plt.figure(figsize=(16, 7))
 
-# Plot all API values as red bars
-plt.bar(df['Date'], df['API'], color='lightcoral', width=10, alpha=0.7, edgecolor='black', label="API Values")
+def plot_api(df, api_threshold=90, save_path=None, dpi=300):
+    """API bars with the months at or above the threshold highlighted; returns the figure."""
+    # Identify high API spells
+    high_spell = df['API'] >= api_threshold  # Boolean column for high API spells
 
-# Highlight bars above the threshold in dark red
-plt.bar(df[df['High_Spell']]['Date'], df[df['High_Spell']]['API'], 
-        color='darkred', width=10, edgecolor='black', alpha=0.9, label="High API Spells (≥ 90mm)")
+    # Create the figure
+    fig = plt.figure(figsize=(16, 7))
 
-# Add threshold line
-plt.axhline(y=api_threshold, color='red', linestyle='dashed', linewidth=2, label=f'Threshold = {api_threshold} mm')
+    # Plot all API values as red bars
+    plt.bar(df['Date'], df['API'], color='lightcoral', width=10, alpha=0.7, edgecolor='black', label="API Values")
 
-# Labels and title
-plt.title("API Bar Plot with Highlighted High Spells", fontsize=18, fontweight='bold')
-plt.xlabel("Date", fontsize=14, fontweight='bold')
-plt.ylabel("API Value (mm)", fontsize=14, fontweight='bold')
+    # Highlight bars above the threshold in dark red
+    plt.bar(df[high_spell]['Date'], df[high_spell]['API'],
+            color='darkred', width=10, edgecolor='black', alpha=0.9, label=f"High API Spells (≥ {api_threshold:g}mm)")
 
-# Improve aesthetics
-plt.xticks(rotation=45)
-plt.grid(axis='y', linestyle="--", alpha=0.6)
-plt.legend(fontsize=12)
-plt.tight_layout()
+    # Add threshold line
+    plt.axhline(y=api_threshold, color='red', linestyle='dashed', linewidth=2, label=f'Threshold = {api_threshold} mm')
 
-# Show the plot
-save_path = "D:/PhD_Main/STPD/STPD/RESULTS/Paper/API_PLOT.png"
-plt.savefig(save_path, dpi=300, bbox_inches='tight')
-plt.show()
+    # Labels and title
+    plt.title("API Bar Plot with Highlighted High Spells", fontsize=18, fontweight='bold')
+    plt.xlabel("Date", fontsize=14, fontweight='bold')
+    plt.ylabel("API Value (mm)", fontsize=14, fontweight='bold')
+
+    # Improve aesthetics
+    plt.xticks(rotation=45)
+    plt.grid(axis='y', linestyle="--", alpha=0.6)
+    plt.legend(fontsize=12)
+    plt.tight_layout()
+
+    if save_path:
+        plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    return fig
+
+
+if __name__ == "__main__":
+    # Load the dataset
+    df = read_api(apipath)
+
+    # High spells as events, e.g. to join with turning-point months
+    spells = extract_spells(df['Date'], df['API'].to_numpy(), api_threshold, inclusive=True)
+    print(spells.drop(columns='Station').to_string(index=False))
+
+    # Show the plot
+    plot_api(df, api_threshold, save_path)
+    plt.show()
@@ -0,0 +1,163 @@
+"""
+High-API spell extraction into an event table.
+
+A spell is a run of consecutive samples (days or months) whose API is above
+a threshold. Runs are found by run-length encoding without Python loops: the
+exceedance mask of every station is padded with False and differenced, so
++1/-1 mark the starts/ends of all runs of all stations at once. The
+cumulative excess comes from a cumulative sum of (API - threshold) indexed
+at the run bounds, and the peaks from np.maximum.reduceat over the runs.
+Missing values end a spell.
+
+The spell table has one row per event (Station, Start, End, Duration, Peak,
+Peak_Date, Excess) and spell_index maps any dates (e.g. turning-point
+months) to the spell containing them, for joins.
+
+Usage:
+    python API_Spells.py Output_API_mean.csv --threshold 90 --output API_spells.csv
+    python API_Spells.py --precipitation Pdata_Petacciato.txt --k 0.85 --threshold 100
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from API_Engine import compute_api_frame, read_precipitation_table
+from Date_Parser import parse_dates
+
+SPELL_COLUMNS = ['Station', 'Start', 'End', 'Duration', 'Peak', 'Peak_Date', 'Excess']
+
+
+def run_bounds(mask):
+    """(station, start, stop) of every run of True along axis 0 of a (time x station) mask; stop is exclusive."""
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = mask[:, None]
+    padded = np.zeros((mask.shape[1], mask.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.diff(padded, axis=1)
+    # Row-major nonzero keeps starts and stops of each station in the same order
+    station, start = np.nonzero(edges == 1)
+    _, stop = np.nonzero(edges == -1)
+    return station, start, stop
+
+
+def extract_spells(dates, api, threshold, stations=None, inclusive=False, min_duration=1):
+    """Event table of the high-API spells of a (time x station) array (or a 1-D series).
+
+    A sample is high when API > threshold (API >= threshold with inclusive,
+    as in API_Plot.py). Duration is the number of samples of the spell,
+    Excess the sum of (API - threshold) over it. Spells shorter than
+    min_duration samples are dropped. Rows are ordered by station and start.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    values = np.asarray(api, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_time, n_stations = values.shape
+    stations = np.arange(n_stations) if stations is None else np.asarray(stations)
+
+    with np.errstate(invalid='ignore'):
+        high = values >= threshold if inclusive else values > threshold
+    station, start, stop = run_bounds(high)
+    duration = stop - start
+    keep = duration >= min_duration
+    station, start, stop, duration = station[keep], start[keep], stop[keep], duration[keep]
+
+    # Cumulative excess per station, read at the run bounds
+    excess = np.zeros((n_stations, n_time + 1))
+    np.cumsum(np.where(high, values - threshold, 0.0).T, axis=1, out=excess[:, 1:])
+    total_excess = excess[station, stop] - excess[station, start]
+
+    # Samples of all runs laid end to end in the station-major flattened series
+    flat = values.T.ravel()
+    offsets = station * n_time
+    run_first = np.cumsum(duration) - duration
+    run_id = np.repeat(np.arange(len(start)), duration)
+    positions = np.repeat(offsets + start, duration) + np.arange(duration.sum()) - run_first[run_id]
+    run_values = flat[positions]
+    peak = np.maximum.reduceat(run_values, run_first) if len(start) else np.zeros(0)
+    # First sample of each run reaching its peak
+    at_peak = run_values == peak[run_id]
+    _, first = np.unique(run_id[at_peak], return_index=True)
+    peak_time = positions[at_peak][first] - offsets[run_id[at_peak][first]]
+
+    return pd.DataFrame({
+        'Station': stations[station],
+        'Start': dates[start],
+        'End': dates[stop - 1],
+        'Duration': duration,
+        'Peak': peak,
+        'Peak_Date': dates[peak_time],
+        'Excess': total_excess,
+    }, columns=SPELL_COLUMNS)
+
+
+def spells_from_frame(frame, threshold, inclusive=False, min_duration=1):
+    """Spell table of a wide API DataFrame (DatetimeIndex x station columns)."""
+    return extract_spells(frame.index, frame.to_numpy(dtype=float), threshold, stations=frame.columns.to_numpy(),
+                          inclusive=inclusive, min_duration=min_duration)
+
+
+def _days(dates):
+    return dates.astype('datetime64[D]').astype(np.int64)
+
+
+def spell_index(spells, dates, stations=None, freq=None):
+    """Row of `spells` containing each date, or -1; vectorized with searchsorted.
+
+    stations gives the station of each date (one station tables need none).
+    With freq='M' dates and spells are compared by month, e.g. to join
+    turning-point months against daily spells.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    starts = spells['Start'].to_numpy(dtype='datetime64[ns]')
+    ends = spells['End'].to_numpy(dtype='datetime64[ns]')
+    if freq == 'M':
+        dates, starts, ends = (d.astype('datetime64[M]') for d in (dates, starts, ends))
+    if stations is None:
+        spell_station = np.zeros(len(spells), dtype=np.int64)
+        date_station = np.zeros(len(dates), dtype=np.int64)
+    else:
+        _, codes = np.unique(np.r_[spells['Station'].to_numpy(), np.asarray(stations)], return_inverse=True)
+        spell_station, date_station = codes[:len(spells)], codes[len(spells):]
+
+    # Spells of one station do not overlap: the last one starting before a date is the only candidate
+    order = np.lexsort((starts, spell_station))
+    key_start = spell_station[order].astype(np.int64) * 2**32 + _days(starts[order])
+    key_date = date_station.astype(np.int64) * 2**32 + _days(dates)
+    candidate = np.searchsorted(key_start, key_date, side='right') - 1
+    rows = order[np.maximum(candidate, 0)] if len(order) else np.zeros(len(dates), dtype=np.int64)
+    found = (candidate >= 0) & ~np.isnat(dates)
+    if len(order):
+        found &= (spell_station[rows] == date_station) & (dates >= starts[rows]) & (dates <= ends[rows])
+    return np.where(found, rows, -1)
+
+
+def read_api_table(path):
+    """API table with a Date column and one or more API columns (e.g. Output_API_mean.csv)."""
+    table = pd.read_csv(path)
+    dates = parse_dates(table.iloc[:, 0])
+    table = table.iloc[:, 1:].set_index(pd.DatetimeIndex(dates, name='Date'))
+    return table[table.index.notna()].sort_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract high-API spells into an event table.")
+    parser.add_argument('api', nargs='?', help="API table: Date column followed by API column(s)")
+    parser.add_argument('--precipitation', nargs='+', help="Gauge files to compute daily API from instead")
+    parser.add_argument('--k', type=float, default=0.85, help="API decay factor (with --precipitation)")
+    parser.add_argument('--threshold', type=float, default=100, help="API threshold (mm)")
+    parser.add_argument('--inclusive', action='store_true', help="High when API >= threshold instead of >")
+    parser.add_argument('--min-duration', type=int, default=1, help="Shortest spell kept (samples)")
+    parser.add_argument('--output', default='API_spells.csv', help="Output CSV")
+    args = parser.parse_args()
+
+    if args.precipitation:
+        table = compute_api_frame(read_precipitation_table(args.precipitation), k=args.k)
+    elif args.api:
+        table = read_api_table(args.api)
+    else:
+        parser.error("an API table or --precipitation is required")
+
+    spells = spells_from_frame(table, args.threshold, args.inclusive, args.min_duration)
+    spells.to_csv(args.output, index=False)
+    print(f"{len(spells)} spells over {table.shape[1]} station(s) saved to {args.output}")
@@ -4,36 +4,198 @@ Created on Mon Oct 28 15:35:50 2024
 
 @author: divye
 """
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+from Deformation_Stack import StackWriter, point_columns
+from Instrumentation import stage, instrumented
 
 # Load the shapefile
 shapefile_path = "D:\PhD_Main\STPD\STPD\Format_Datasets\Clip_Data\ASC_CLIP.shp"
-gdf = gpd.read_file(shapefile_path)
 
-# Extract columns starting with 'D' (time series data)
-time_series_cols = [col for col in gdf.columns if col.startswith('D')]
-time_series_df = gdf[time_series_cols].transpose()
+# Save to a new CSV
+output_csv = "D:\PhD_Main\STPD\STPD\Format_Datasets\Clip_Data\ASC_CLIP.csv"
 
-# Convert column names to datetime if needed
-time_series_df.index = pd.to_datetime(time_series_df.index, format='D%Y%m%d')
+# Features read and resampled per chunk, and worker processes (None = all cores)
+chunk_size = 20000
+workers = None
 
-# Resample to monthly scale, taking the mean for each month
-monthly_resampled = time_series_df.resample('M').mean().transpose()
+# Output format: 'csv', 'stack' (memory-mapped .npy directory) or 'parquet'
+output_format = 'csv'
+binary_dtype = 'float32'
 
-# Calculate decimal year starting from zero
-first_date = monthly_resampled.columns[0]
-decimal_years = monthly_resampled.columns.to_series().apply(
-    lambda date: (date.year - first_date.year) + (date.month - first_date.month) / 12
-)
-monthly_resampled.columns = decimal_years
+# Time series columns are named DYYYYMMDD
+TIME_COLUMN = re.compile(r'^D\d{8}$')
 
-# Combine resampled time series back with original non-time-series columns
-gdf_resampled = gdf.drop(columns=time_series_cols)
-gdf_resampled = pd.concat([gdf_resampled, monthly_resampled], axis=1)
 
-# Save to a new CSV
-output_csv = "D:\PhD_Main\STPD\STPD\Format_Datasets\Clip_Data\ASC_CLIP.csv"
-gdf_resampled.to_csv(output_csv, index=False)
+def count_features(path):
+    """Number of features in a vector file, without reading the attributes."""
+    try:
+        import pyogrio
+        return pyogrio.read_info(path)['features']
+    except ImportError:
+        import fiona
+        with fiona.open(path) as collection:
+            return len(collection)
+
+
+def month_layout(columns):
+    """Precompute the column -> month mapping of the DYYYYMMDD time series columns.
+
+    Returns (time_series_cols, indicator, decimal_years) where indicator is a
+    (column x month) 0/1 matrix over every month from the first to the last
+    observation (months without observations stay empty, as with
+    resample('M')), and decimal_years labels those months starting from zero.
+    """
+    time_series_cols = [col for col in columns if TIME_COLUMN.match(col)]
+    dates = pd.to_datetime(time_series_cols, format='D%Y%m%d')
+    codes = dates.year * 12 + dates.month - 1
+    first, last = codes.min(), codes.max()
+
+    indicator = np.zeros((len(time_series_cols), last - first + 1))
+    indicator[np.arange(len(time_series_cols)), codes - first] = 1.0
+
+    # Decimal year starting from zero
+    decimal_years = [(code // 12 - first // 12) + (code % 12 - first % 12) / 12
+                     for code in range(first, last + 1)]
+    return time_series_cols, indicator, decimal_years
+
+
+def resample_chunk(path, start, stop, time_series_cols, indicator, decimal_years):
+    """Read features [start, stop) and replace their time series by monthly means."""
+    gdf = gpd.read_file(path, rows=slice(start, stop))
+    values = gdf[time_series_cols].to_numpy(dtype=float)
+
+    # Monthly sums and observation counts as two matrix products, then the NaN-aware mean
+    valid = ~np.isnan(values)
+    sums = np.where(valid, values, 0.0) @ indicator
+    counts = valid.astype(float) @ indicator
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+
+    monthly_resampled = pd.DataFrame(means, index=gdf.index, columns=decimal_years)
+
+    # Combine resampled time series back with original non-time-series columns
+    gdf_resampled = gdf.drop(columns=time_series_cols)
+    return pd.concat([gdf_resampled, monthly_resampled], axis=1)
+
+
+def split_chunk(frame, decimal_years):
+    """Split a resampled chunk into (ids, latitudes, longitudes, attributes) for binary output.
+
+    Coordinates come from the point geometries when there are any, otherwise
+    from lat/lon attribute columns; geometries are kept as WKT attributes.
+    """
+    attributes = frame.drop(columns=decimal_years)
+    has_geometry = 'geometry' in attributes
+    id_col, lat_col, lon_col = point_columns([col for col in attributes.columns if col != 'geometry'])
+
+    if has_geometry:
+        geometry = gpd.GeoSeries(attributes['geometry'])
+        points = geometry if (geometry.geom_type == 'Point').all() else geometry.representative_point()
+        latitudes, longitudes = points.y.to_numpy(), points.x.to_numpy()
+        # A plain DataFrame, as a GeoDataFrame warns when its geometry column is replaced by text
+        attributes = pd.DataFrame(attributes).assign(geometry=geometry.to_wkt())
+    else:
+        nan = np.full(len(frame), np.nan)
+        latitudes = attributes[lat_col].to_numpy(dtype=float) if lat_col else nan
+        longitudes = attributes[lon_col].to_numpy(dtype=float) if lon_col else nan
+
+    return attributes[id_col].astype(str).to_numpy(), latitudes, longitudes, pd.DataFrame(attributes)
+
+
+def parquet_schema(table):
+    """Writer schema from the first chunk's table, with all-null columns typed as strings.
+
+    Every later chunk is cast to this schema; a column that happens to be
+    empty in the first chunk would otherwise be typed null, which no other
+    type can be cast to.
+    """
+    import pyarrow as pa
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                      for field in table.schema])
+
+
+def convert(path, output_path, chunk_size=20000, workers=None, output_format='csv', dtype='float32'):
+    """Stream a shapefile in chunks of features to a monthly-resampled stack.
+
+    output_format 'csv' writes the original text layout; 'stack' writes a
+    memory-mapped directory (see Deformation_Stack.py) and 'parquet' a
+    columnar file. Both binary formats keep the decimal-year time axis and the
+    non-time-series attribute columns.
+    """
+    with stage('layout'):
+        n_features = count_features(path)
+        columns = gpd.read_file(path, rows=slice(0, 1)).columns
+        layout = month_layout(columns)
+    decimal_years = layout[2]
+    chunks = [(start, min(start + chunk_size, n_features)) for start in range(0, n_features, chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    written = 0
+    started = time.perf_counter()
+    stack_writer = StackWriter(output_path, n_features, decimal_years, dtype) if output_format == 'stack' else None
+    parquet_writer = None
+
+    @instrumented('write')
+    def write(frame):
+        nonlocal written, parquet_writer
+        if output_format == 'csv':
+            frame.to_csv(output_path, index=False, mode='w' if written == 0 else 'a', header=written == 0)
+        else:
+            ids, latitudes, longitudes, attributes = split_chunk(frame, decimal_years)
+            values = frame[decimal_years].to_numpy(dtype=dtype)
+            if output_format == 'stack':
+                stack_writer.write(ids, latitudes, longitudes, values, attributes)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                if 'lat' not in attributes and 'lon' not in attributes:
+                    attributes = attributes.assign(lat=latitudes, lon=longitudes)
+                table = pa.Table.from_pandas(pd.concat([
+                    attributes.reset_index(drop=True),
+                    pd.DataFrame(values, columns=[str(year) for year in decimal_years]),
+                ], axis=1), preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pq.ParquetWriter(output_path, parquet_schema(table))
+                parquet_writer.write_table(table.cast(parquet_writer.schema))
+        written += len(frame)
+        print(f"{written}/{n_features} features written ({written / (time.perf_counter() - started):.0f} features/s)")
+
+    if workers == 1:
+        for start, stop in chunks:
+            with stage('resample_chunk') as s:
+                frame = resample_chunk(path, start, stop, *layout)
+                s.count(points=len(frame))
+            write(frame)
+    else:
+        # Chunks are written in order; a bounded window in flight keeps memory flat
+        with stage('resample_parallel') as s, ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = []
+            for start, stop in chunks:
+                in_flight.append(pool.submit(resample_chunk, path, start, stop, *layout))
+                if len(in_flight) >= 2 * workers:
+                    write(in_flight.pop(0).result())
+            for future in in_flight:
+                write(future.result())
+            s.count(points=n_features)
+
+    if stack_writer is not None:
+        stack_writer.close({'source': os.path.abspath(path)})
+    if parquet_writer is not None:
+        parquet_writer.close()
+    return written
+
+
+if __name__ == "__main__":
+    output_path = output_csv
+    if output_format != 'csv':
+        output_path = os.path.splitext(output_csv)[0] + ('.stack' if output_format == 'stack' else '.parquet')
 
-print(f"Time series resampled to monthly scale with decimal years starting from zero and saved to {output_csv}")
+    convert(shapefile_path, output_path, chunk_size=chunk_size, workers=workers,
+            output_format=output_format, dtype=binary_dtype)
+    print(f"Time series resampled to monthly scale with decimal years starting from zero and saved to {output_path}")
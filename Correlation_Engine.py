@@ -0,0 +1,205 @@
+"""
+Vectorized lagged Pearson correlation between rain gauges and GPM cells.
+
+Pearson_Correlation_Precipitation_data.py correlates one gauge with one GPM
+series at lag 0. Here all gauges and all GPM cells are put on one monthly
+axis and Pearson r is computed for every station x cell x lag in batched
+NumPy form: each lag is a pair of overlapping slices of the two matrices
+and the correlations of a block of cells come out of a few matrix products.
+Missing months are dropped pairwise, like Series.corr.
+
+A positive lag compares the gauge at month t with GPM at month t + lag.
+
+Usage:
+    python Correlation_Engine.py Pdata_*.txt --gpm GPM_grid.csv --lags -6 6 --output Precipitation_lag_corr
+"""
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from API_Engine import read_precipitation_table, month_codes
+from Date_Parser import parse_dates
+
+
+def station_monthly_table(file_paths, start='2011-01-01', end='2022-12-31'):
+    """Monthly mean precipitation of several gauge files as a (month x station) DataFrame."""
+    return read_precipitation_table(file_paths, start=start, end=end).resample('MS').mean()
+
+
+def read_gpm_table(path):
+    """Load GPM monthly precipitation as a (date x cell) DataFrame.
+
+    Accepts the headerless two-column 'date,mean_precipitation' GPM.csv used
+    by the Pearson script, or a wide table whose first column is the date and
+    whose other columns are cells (with or without a header row).
+    """
+    # Look at the first row only, so a header row does not turn every column into strings
+    head = pd.read_csv(path, header=None, nrows=1)
+    has_header = pd.isna(parse_dates([head.iloc[0, 0]])[0])
+    table = pd.read_csv(path, header=0 if has_header else None)
+    if has_header:
+        columns = [str(name) for name in table.columns[1:]]
+    elif table.shape[1] == 2:
+        columns = ['mean_precipitation']
+    else:
+        columns = [f'cell_{i}' for i in range(1, table.shape[1])]
+
+    dates = parse_dates(table.iloc[:, 0])
+    values = table.iloc[:, 1:].apply(pd.to_numeric, errors='coerce')
+    values.columns = columns
+    values.index = pd.DatetimeIndex(dates, name='date')
+    return values[values.index.notna()]
+
+
+def align_monthly(stations, gpm):
+    """Put two date-indexed tables on one continuous monthly axis.
+
+    Returns (months, station_matrix, gpm_matrix) with NaN for months missing
+    from either table. Several values in one month are averaged.
+    """
+    tables = []
+    for table in (stations, gpm):
+        codes = month_codes(table.index)
+        tables.append(table.groupby(codes).mean())
+    first = min(table.index.min() for table in tables)
+    last = max(table.index.max() for table in tables)
+    axis = np.arange(first, last + 1)
+    months = axis.astype('datetime64[M]')
+    return (months,) + tuple(table.reindex(axis).to_numpy(dtype=float) for table in tables)
+
+
+def standardize(X):
+    """Centre and scale the columns of a (time x series) array, ignoring NaN.
+
+    Correlation does not change under this transform; it only keeps the sums
+    of squares in the lagged products well conditioned.
+    """
+    with warnings.catch_warnings():
+        # All-NaN columns (e.g. GPM cells over the sea) stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(X, axis=0)
+        std = np.nanstd(X, axis=0)
+    std = np.where(std > 0, std, 1.0)
+    return (X - np.nan_to_num(mean)) / std
+
+
+def lag_slices(n_months, lag):
+    """Row slices of the station and GPM matrices that are `lag` months apart."""
+    if lag >= 0:
+        return slice(0, max(n_months - lag, 0)), slice(lag, n_months)
+    return slice(-lag, n_months), slice(0, max(n_months + lag, 0))
+
+
+def _block_correlation(S, G, min_periods):
+    """Pearson r and pair counts between all columns of S and G (same rows)."""
+    S_valid, G_valid = ~np.isnan(S), ~np.isnan(G)
+    if len(S) == 0:
+        # Lag longer than the series: no pairs
+        n = np.zeros((S.shape[1], G.shape[1]))
+        return np.full(n.shape, np.nan), n
+    if S_valid.all() and G_valid.all():
+        # No gaps: centre on the overlap and use one product
+        Sc, Gc = S - S.mean(axis=0), G - G.mean(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = (Sc.T @ Gc) / np.sqrt(np.outer((Sc * Sc).sum(axis=0), (Gc * Gc).sum(axis=0)))
+        n = np.full(r.shape, len(S))
+    else:
+        # Pairwise-complete sums from masked products
+        Ms, Mg = S_valid.astype(float), G_valid.astype(float)
+        Sz, Gz = np.where(S_valid, S, 0.0), np.where(G_valid, G, 0.0)
+        n = Ms.T @ Mg
+        sx, sy = Sz.T @ Mg, Ms.T @ Gz
+        sxx, syy = (Sz * Sz).T @ Mg, Ms.T @ (Gz * Gz)
+        sxy = Sz.T @ Gz
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    r = np.where(n >= min_periods, np.clip(r, -1.0, 1.0), np.nan)
+    return r, n
+
+
+def lagged_correlation(station_matrix, gpm_matrix, lags, min_periods=3, block_size=2000, out=None):
+    """Pearson r for every station x cell x lag.
+
+    station_matrix is (month x station), gpm_matrix (month x cell) on the same
+    monthly axis. Returns (r, n): float32 correlations and int32 pair counts,
+    both (station x cell x lag). Pairs with fewer than min_periods months are
+    NaN. Cells are processed in blocks of block_size; `out` may be a
+    preallocated (e.g. memory-mapped) array for r.
+    """
+    S = standardize(np.asarray(station_matrix, dtype=float))
+    G = standardize(np.asarray(gpm_matrix, dtype=float))
+    lags = list(lags)
+    n_months = len(S)
+    shape = (S.shape[1], G.shape[1], len(lags))
+    r = np.empty(shape, dtype=np.float32) if out is None else out
+    counts = np.empty(shape, dtype=np.int32)
+
+    for j, lag in enumerate(lags):
+        station_rows, gpm_rows = lag_slices(n_months, lag)
+        for start in range(0, G.shape[1], block_size):
+            stop = min(start + block_size, G.shape[1])
+            block_r, block_n = _block_correlation(S[station_rows], G[gpm_rows, start:stop], min_periods)
+            r[:, start:stop, j] = block_r
+            counts[:, start:stop, j] = block_n
+    return r, counts
+
+
+def best_lag_summary(r, counts, lags, stations, cells, top=None):
+    """Long table with the best lag (highest r) of every station-cell pair.
+
+    Columns: Station, Cell, Best_Lag, r_best, n_best, r_lag0 (if lag 0 was
+    computed). With top, only the top cells of each station are kept.
+    Rows are sorted by station and descending r_best.
+    """
+    lags = np.asarray(lags)
+    filled = np.where(np.isnan(r), -np.inf, r)
+    best = filled.argmax(axis=2)
+    r_best = np.take_along_axis(r, best[..., None], axis=2)[..., 0]
+    n_best = np.take_along_axis(counts, best[..., None], axis=2)[..., 0]
+    has_value = ~np.isnan(r_best)
+
+    summary = pd.DataFrame({
+        'Station': np.repeat(np.asarray(stations, dtype=object), len(cells)),
+        'Cell': np.tile(np.asarray(cells, dtype=object), len(stations)),
+        'Best_Lag': np.where(has_value, lags[best], np.nan).ravel(),
+        'r_best': r_best.ravel(),
+        'n_best': n_best.ravel(),
+    })
+    if (lags == 0).any():
+        summary['r_lag0'] = r[..., int(np.flatnonzero(lags == 0)[0])].ravel()
+
+    summary = summary.sort_values(['Station', 'r_best'], ascending=[True, False], kind='stable')
+    if top is not None:
+        summary = summary.groupby('Station', sort=False).head(top)
+    return summary.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lagged Pearson correlation of rain gauges against GPM cells.")
+    parser.add_argument('stations', nargs='+', help="Gauge files (Pdata_<station>.txt)")
+    parser.add_argument('--gpm', default=r"D:\PhD_Main\STPD\STPD\GPM.csv", help="GPM monthly CSV (one or many cells)")
+    parser.add_argument('--lags', type=int, nargs=2, default=[0, 0], metavar=('MIN', 'MAX'),
+                        help="Range of monthly lags (inclusive)")
+    parser.add_argument('--start', default='2011-01-01')
+    parser.add_argument('--end', default='2022-12-31')
+    parser.add_argument('--min-periods', type=int, default=3, help="Minimum overlapping months per pair")
+    parser.add_argument('--top', type=int, default=None, help="Keep the best N cells per station in the summary")
+    parser.add_argument('--output', default='Precipitation_lag_corr', help="Output prefix")
+    args = parser.parse_args()
+
+    stations = station_monthly_table(args.stations, start=args.start, end=args.end)
+    gpm = read_gpm_table(args.gpm)
+    months, station_matrix, gpm_matrix = align_monthly(stations, gpm)
+    lags = np.arange(args.lags[0], args.lags[1] + 1)
+
+    start = time.perf_counter()
+    r, counts = lagged_correlation(station_matrix, gpm_matrix, lags, min_periods=args.min_periods)
+    elapsed = time.perf_counter() - start
+    print(f"{r.size} correlations ({r.shape[0]} stations x {r.shape[1]} cells x {r.shape[2]} lags) in {elapsed:.2f} s")
+
+    np.savez(args.output + '.npz', r=r, n=counts, lags=lags, months=months,
+             stations=np.asarray(stations.columns, dtype=str), cells=np.asarray(gpm.columns, dtype=str))
+    summary = best_lag_summary(r, counts, lags, stations.columns, gpm.columns, top=args.top)
+    summary.to_csv(args.output + '_best_lag.csv', index=False)
+    print(f"Correlations saved to {args.output}.npz and best lags to {args.output}_best_lag.csv")
@@ -0,0 +1,224 @@
+"""
+Bootstrap confidence intervals and permutation p-values for gauge/GPM correlations.
+
+Each station is paired with one GPM series (the single GPM.csv column, or
+its best cell and lag from Correlation_Engine.py). Resamples are generated
+in bulk per block: a bootstrap block is a (resample x month) matrix of
+draw counts, so the resampled sums of x, y, x^2, y^2 and xy of all stations
+are five matrix products; a permutation block gathers the standardized GPM
+series through a (resample x month) permutation matrix. Blocks are spread
+over worker processes and every block draws from its own child of one
+SeedSequence, so results do not depend on the number of workers.
+
+Usage:
+    python Correlation_Significance.py Pdata_*.txt --gpm GPM.csv --resamples 10000 --output Precipitation_corr_significance.csv
+    python Correlation_Significance.py Pdata_*.txt --gpm GPM_grid.csv --summary Precipitation_lag_corr_best_lag.csv
+"""
+import argparse
+import os
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from Correlation_Engine import station_monthly_table, read_gpm_table, align_monthly
+
+Significance = namedtuple('Significance', ['r', 'n', 'ci_low', 'ci_high', 'p_value', 'bootstrap'])
+
+# Permutations gathered per product inside a block, to bound the temporary (resample x month x station) array
+PERMUTATION_CHUNK = 32
+
+
+def shift_months(values, lag):
+    """Rows of a (month x series) array moved so that row t holds month t + lag (NaN padded)."""
+    shifted = np.full_like(values, np.nan)
+    n_months = len(values)
+    if lag >= 0:
+        shifted[:max(n_months - lag, 0)] = values[lag:]
+    else:
+        shifted[-lag:] = values[:max(n_months + lag, 0)]
+    return shifted
+
+
+def pair_matrices(stations, gpm, summary=None):
+    """Paired (month x station) gauge and GPM matrices on one monthly axis.
+
+    Without a summary every station is paired with the first GPM column at
+    lag 0. With a Correlation_Engine best-lag summary each station uses the
+    cell and lag of its top row; stations without a row are reported and get
+    cell None, lag None and an all-NaN GPM column (so r is NaN). Returns
+    (cells, lags, x, y).
+    """
+    months, station_matrix, gpm_matrix = align_monthly(stations, gpm)
+    gpm_columns = [str(col) for col in gpm.columns]
+    if summary is None:
+        cells = [gpm_columns[0]] * len(stations.columns)
+        lags = [0] * len(stations.columns)
+    else:
+        best = summary.dropna(subset=['r_best']).drop_duplicates('Station').set_index('Station')
+        best.index = best.index.astype(str)
+        names = [str(name) for name in stations.columns]
+        missing = [name for name in names if name not in best.index]
+        if missing:
+            print(f"Warning: {len(missing)} stations have no best-lag row in the summary: {', '.join(missing)}")
+        cells = [None if name in missing else str(best.loc[name, 'Cell']) for name in names]
+        lags = [None if name in missing else int(best.loc[name, 'Best_Lag']) for name in names]
+
+    y = np.full_like(station_matrix, np.nan)
+    for j, (cell, lag) in enumerate(zip(cells, lags)):
+        if cell is not None:
+            y[:, j] = shift_months(gpm_matrix[:, [gpm_columns.index(cell)]], lag)[:, 0]
+    return cells, lags, station_matrix, y
+
+
+def _scale(values):
+    """Centre columns and scale them to unit population standard deviation (NaN for a constant column)."""
+    values = values - values.mean(axis=0)
+    std = values.std(axis=0)
+    return values / np.where(std > 0, std, np.nan)
+
+
+def group_pairs(x, y):
+    """Group stations by their number of complete months.
+
+    Stations in a group share one resample matrix. Returns a list of
+    (columns, X, Y) with the complete months of each station stacked as
+    (n x stations) arrays, standardized per column.
+    """
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    lengths = valid.sum(axis=0)
+    groups = []
+    for n in np.unique(lengths):
+        columns = np.flatnonzero(lengths == n)
+        if n < 3:
+            continue
+        X = np.column_stack([x[valid[:, j], j] for j in columns])
+        Y = np.column_stack([y[valid[:, j], j] for j in columns])
+        groups.append((columns, _scale(X), _scale(Y)))
+    return groups
+
+
+def bootstrap_block(rng, X, Y, n_resamples):
+    """Correlations of n_resamples paired bootstrap resamples of every column of X and Y."""
+    n = len(X)
+    draws = rng.integers(0, n, size=(n_resamples, n))
+    # Draw counts per month: a bootstrap sum is a count-weighted sum over the original months
+    counts = np.bincount((draws + n * np.arange(n_resamples)[:, None]).ravel(),
+                         minlength=n_resamples * n).reshape(n_resamples, n).astype(float)
+    mx, my = counts @ X / n, counts @ Y / n
+    sxx = counts @ (X * X) / n - mx * mx
+    syy = counts @ (Y * Y) / n - my * my
+    sxy = counts @ (X * Y) / n - mx * my
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sxy / np.sqrt(sxx * syy)
+
+
+def permutation_block(rng, X, Y, r_observed, n_resamples):
+    """Number of permutations with |r| >= |r_observed|, for every column of X and Y.
+
+    X and Y are standardized, so mean and variance do not change under a
+    permutation and r is the mean of X * Y[permutation].
+    """
+    n = len(X)
+    exceed = np.zeros(X.shape[1], dtype=np.int64)
+    threshold = np.abs(r_observed) - 1e-12
+    for start in range(0, n_resamples, PERMUTATION_CHUNK):
+        size = min(PERMUTATION_CHUNK, n_resamples - start)
+        permutations = np.argsort(rng.random((size, n)), axis=1)
+        r_perm = np.einsum('btk,tk->bk', Y[permutations], X) / n
+        exceed += (np.abs(r_perm) >= threshold).sum(axis=0)
+    return exceed
+
+
+# Per-process state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(groups):
+    """Keep the grouped station data in the worker process."""
+    _worker['groups'] = groups
+
+
+def _run_block(seed, n_resamples, n_stations):
+    """Bootstrap and permutation resamples of one block for all groups."""
+    rng = np.random.default_rng(seed)
+    boot = np.full((n_resamples, n_stations), np.nan, dtype=np.float32)
+    exceed = np.zeros(n_stations, dtype=np.int64)
+    for columns, X, Y in _worker['groups']:
+        boot[:, columns] = bootstrap_block(rng, X, Y, n_resamples)
+        r_observed = (X * Y).mean(axis=0)
+        exceed[columns] = permutation_block(rng, X, Y, r_observed, n_resamples)
+    return boot, exceed
+
+
+def correlation_significance(x, y, n_resamples=10000, confidence=0.95, seed=0, block_size=250, workers=None):
+    """Pearson r of every column pair of x and y with bootstrap CI and permutation p-value.
+
+    x and y are (month x station) arrays; months missing from either side of
+    a pair are dropped. The CI is the percentile interval of n_resamples
+    paired bootstrap correlations, the p-value is two-sided,
+    (1 + #{|r_perm| >= |r|}) / (1 + n_resamples). Pairs with fewer than 3
+    complete months, or with a constant series (zero variance), are NaN.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n_stations = x.shape[1]
+    groups = group_pairs(x, y)
+
+    r = np.full(n_stations, np.nan)
+    n = (~np.isnan(x) & ~np.isnan(y)).sum(axis=0)
+    for columns, X, Y in groups:
+        r[columns] = (X * Y).mean(axis=0)
+
+    sizes = [min(block_size, n_resamples - start) for start in range(0, n_resamples, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(sizes) == 1:
+        _init_worker(groups)
+        results = [_run_block(s, size, n_stations) for s, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(groups,)) as pool:
+            results = list(pool.map(_run_block, seeds, sizes, [n_stations] * len(sizes)))
+
+    bootstrap = np.concatenate([boot for boot, _ in results]) if results else np.empty((0, n_stations))
+    exceed = sum(count for _, count in results) if results else np.zeros(n_stations)
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        # All-NaN columns (pairs with too few months) stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ci_low, ci_high = np.nanpercentile(bootstrap, [tail, 100 - tail], axis=0)
+    p_value = np.where(np.isnan(r), np.nan, (1 + exceed) / (1 + n_resamples))
+    return Significance(r, n, ci_low, ci_high, p_value, bootstrap)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap CI and permutation p-value of gauge/GPM correlations.")
+    parser.add_argument('stations', nargs='+', help="Gauge files (Pdata_<station>.txt)")
+    parser.add_argument('--gpm', default=r"D:\PhD_Main\STPD\STPD\GPM.csv", help="GPM monthly CSV")
+    parser.add_argument('--summary', help="Best-lag CSV of Correlation_Engine.py (pairs each station with its best cell)")
+    parser.add_argument('--start', default='2011-01-01')
+    parser.add_argument('--end', default='2022-12-31')
+    parser.add_argument('--resamples', type=int, default=10000, help="Bootstrap and permutation resamples")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--block-size', type=int, default=250, help="Resamples per task")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--output', default='Precipitation_corr_significance.csv')
+    args = parser.parse_args()
+
+    stations = station_monthly_table(args.stations, start=args.start, end=args.end)
+    gpm = read_gpm_table(args.gpm)
+    summary = pd.read_csv(args.summary) if args.summary else None
+    cells, lags, x, y = pair_matrices(stations, gpm, summary)
+
+    start = time.perf_counter()
+    result = correlation_significance(x, y, args.resamples, args.confidence, args.seed, args.block_size, args.workers)
+    print(f"{args.resamples} bootstrap + {args.resamples} permutation resamples x {x.shape[1]} stations "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    pd.DataFrame({
+        'Station': stations.columns, 'Cell': cells, 'Lag': lags, 'n': result.n, 'r': result.r,
+        'CI_low': result.ci_low, 'CI_high': result.ci_high, 'p_value': result.p_value,
+    }).to_csv(args.output, index=False)
+    print(f"Correlation significance saved to {args.output}")
@@ -1,25 +1,21 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from TP_Aggregator import aggregate_files, direction_table, DIRECTION_LABELS
+from Instrumentation import stage
 
-# Load the CSV file
+# Turning-point table (CSV or Parquet)
 file_path = r"D:\PhD_Main\STPD\STPD\LSWAVE-SignalProcessing\STPD_PythonPackage_EGhaderpour\DESC_ALL_CLIP\DESC_filtered_turning_points.csv"
-df = pd.read_csv(file_path)
+save_path = "D:/PhD_Main/STPD/STPD/RESULTS/Paper/TPF_DESCENDING_HighRes.png"
 
-# Define bins similar to the image
-bins = [-np.inf, -10, -8, -6, -4, -2, 2, 4, 6, 8, 10, np.inf]
-bin_labels = ["< -10", "[-10 -8)", "[-8 -6)", "[-6 -4)", "[-4 -2)", "[-2 2)",
-              "[2 4)", "[4 6)", "[6 8)", "[8 10)", "> 10"]
+# Worker processes for counting the table (None = all cores)
+workers = None
 
-# Categorize the 'Direction' values into bins
-df["Direction_Bin"] = pd.cut(df["Direction"], bins=bins, labels=bin_labels, right=False)
+# Area of interest (None = all points), e.g. dict(bbox=(41.95, 42.00, 14.95, 15.02)) or dict(near=(41.98, 14.99), radius=500)
+area = None
 
-# Count occurrences per bin
-bin_counts = df["Direction_Bin"].value_counts().reindex(bin_labels, fill_value=0)
-
-# Separate counts for positive and negative slopes
-positive_counts = df[df["Slope"] >= 0]["Direction_Bin"].value_counts().reindex(bin_labels, fill_value=0)
-negative_counts = df[df["Slope"] < 0]["Direction_Bin"].value_counts().reindex(bin_labels, fill_value=0)
+# Define bins similar to the image ([-inf, -10, -8, ..., 10, inf), left-closed)
+bin_labels = DIRECTION_LABELS
 
 # Define font sizes for a research-quality figure
 TITLE_SIZE = 18
@@ -27,24 +23,45 @@ LABEL_SIZE = 14
 TICK_SIZE = 12
 LEGEND_SIZE = 14
 
-# Plot the bar chart
-fig, ax = plt.subplots(figsize=(10, 5))
-bar_width = 0.4
-x = np.arange(len(bin_labels))
-
-ax.bar(x - bar_width/2, negative_counts, bar_width, color='red', label='Negative Slopes')
-ax.bar(x + bar_width/2, positive_counts, bar_width, color='blue', label='Positive Slopes')
-
-# Formatting
-ax.set_xticks(x)
-ax.set_xticklabels(bin_labels, rotation=45, ha="right")
-ax.set_xlabel("Direction of Turning Points (mm/year)")
-ax.set_ylabel("Turning Point Frequency")
-ax.set_title("Turning Point Frequency by Direction - Descending")
-ax.legend()
-
-# Show plot
-plt.tight_layout()
-# Save a high-quality figure for publication
-plt.savefig("D:/PhD_Main/STPD/STPD/RESULTS/Paper/TPF_DESCENDING_HighRes.png", dpi=300, bbox_inches='tight')
-plt.show()
+
+def plot_direction_histogram(direction_counts, orbit="Descending", save_path=None, dpi=300):
+    """Turning-point frequency per direction bin by slope sign (a direction_table); returns the figure."""
+    # Separate counts for positive and negative slopes
+    positive_counts = direction_counts["Positive"]
+    negative_counts = direction_counts["Negative"]
+
+    # Plot the bar chart
+    fig, ax = plt.subplots(figsize=(10, 5))
+    bar_width = 0.4
+    x = np.arange(len(bin_labels))
+
+    ax.bar(x - bar_width/2, negative_counts, bar_width, color='red', label='Negative Slopes')
+    ax.bar(x + bar_width/2, positive_counts, bar_width, color='blue', label='Positive Slopes')
+
+    # Formatting
+    ax.set_xticks(x)
+    ax.set_xticklabels(bin_labels, rotation=45, ha="right")
+    ax.set_xlabel("Direction of Turning Points (mm/year)")
+    ax.set_ylabel("Turning Point Frequency")
+    ax.set_title(f"Turning Point Frequency by Direction - {orbit}")
+    ax.legend()
+
+    plt.tight_layout()
+    # Save a high-quality figure for publication
+    if save_path:
+        with stage('savefig'):
+            fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    return fig
+
+
+if __name__ == "__main__":
+    # Count direction bins by slope sign in one streaming pass over the table
+    with stage('aggregate') as s:
+        counts = aggregate_files({"Descending": file_path}, workers=workers, area=area)["Descending"]
+        s.count(rows=counts.rows)
+    direction_counts = direction_table(counts)
+
+    plot_direction_histogram(direction_counts, "Descending", save_path)
+
+    # Show plot
+    plt.show()
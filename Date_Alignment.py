@@ -0,0 +1,68 @@
+"""
+Temporal alignment of date series by sorted search over datetime64 arrays.
+
+Matches every date of one series to the nearest date of another (or to all
+dates within +/- threshold_days) with np.searchsorted, in O((N + M) log M)
+instead of the O(N * M) min() scan. The returned index mappings only depend
+on the two date axes, so they are computed once per scene and reused for
+every point ID.
+"""
+import numpy as np
+
+ONE_DAY = np.timedelta64(1, 'D')
+
+
+def to_datetime64(dates):
+    """Convert a list of datetimes, a pandas Series/Index or an array to datetime64[ns]."""
+    return np.asarray(dates, dtype='datetime64[ns]')
+
+
+def nearest_index(source_dates, target_dates):
+    """For each source date, return the index of the nearest target date.
+
+    Ties go to the earlier target date, like min() over a date-sorted list.
+    Returns (indices into target_dates, source - target offsets as timedelta64).
+    """
+    source = to_datetime64(source_dates)
+    target = to_datetime64(target_dates)
+    if len(target) == 0:
+        raise ValueError("target_dates is empty")
+
+    order = np.argsort(target, kind='stable')
+    sorted_target = target[order]
+
+    # Candidate neighbours on each side of the insertion point
+    right = np.clip(np.searchsorted(sorted_target, source, side='left'), 0, len(target) - 1)
+    left = np.clip(right - 1, 0, len(target) - 1)
+    use_left = np.abs(source - sorted_target[left]) <= np.abs(sorted_target[right] - source)
+    nearest = np.where(use_left, left, right)
+
+    index = order[nearest]
+    return index, source - target[index]
+
+
+def match_within(source_dates, target_dates, threshold_days=30):
+    """Match source dates to their nearest target date if it is within threshold_days.
+
+    The distance is measured in whole days as timedelta.days does (floored),
+    so the result is identical to the original filter_api_dates loop.
+    Returns (source indices kept, matching target indices).
+    """
+    index, offset = nearest_index(source_dates, target_dates)
+    days = (-offset) // ONE_DAY
+    keep = np.flatnonzero(np.abs(days) <= threshold_days)
+    return keep, index[keep]
+
+
+def window_bounds(source_dates, target_dates, threshold_days=30):
+    """For each target date, the [start, stop) range of sorted source dates within +/- threshold_days.
+
+    source_dates must be sorted. Use the bounds to slice or reduce (e.g. with
+    prefix sums) every source value falling in each target window.
+    """
+    source = to_datetime64(source_dates)
+    target = to_datetime64(target_dates)
+    window = threshold_days * ONE_DAY
+    start = np.searchsorted(source, target - window, side='left')
+    stop = np.searchsorted(source, target + window, side='right')
+    return start, stop
@@ -0,0 +1,115 @@
+"""
+Fast date parsing shared by the histogram, API and correlation scripts.
+
+Date columns in this project are long and highly repeated (turning-point
+months, monthly API tables), so a column is factorized first and only its
+unique strings are parsed, with one explicit format, then mapped back. The
+format is detected on a small sample of unique strings and remembered per
+string shape (e.g. 'Jan-15' -> 'aaa-00'), so tables of the same kind skip the
+detection. Two-digit-year centuries are fixed with datetime64 arithmetic.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Candidate formats, tried in order when none are given; month-first before day-first,
+# so ambiguous dates such as 2/1/2011 read as pd.to_datetime reads them (February)
+DEFAULT_FORMATS = ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d',
+                   '%b-%y', '%y-%b', '%b-%Y', '%Y-%m', '%m/%Y']
+
+# Strings used to detect a format
+SAMPLE_SIZE = 200
+
+# (formats, string shape) -> detected format
+_format_cache = {}
+
+
+def _shape(string):
+    """Shape of a date string with digits as '0' and letters as 'a'."""
+    return re.sub(r'[A-Za-z]', 'a', re.sub(r'\d', '0', string))
+
+
+def _parse_count(sample, fmt):
+    return int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+
+
+def _sample(values, size=SAMPLE_SIZE):
+    """Up to `size` distinct, non-empty, stripped strings from the start of a column."""
+    head = pd.Series(np.asarray(values, dtype=object)[:50 * size]).dropna().astype(str).str.strip()
+    head = head[head != '']
+    return pd.Index(head.unique()[:size])
+
+
+def detect_format(values, formats=None):
+    """Return the format of `formats` that parses the most sampled strings, or None.
+
+    Ties go to the earlier format. A format detected before for strings of the
+    same shape is reused if it still parses the whole sample and no earlier
+    format does (so a day-first table cannot make a later ambiguous one day-first).
+    """
+    formats = tuple(formats or DEFAULT_FORMATS)
+    sample = _sample(values)
+    if len(sample) == 0:
+        return formats[0]
+    if len(formats) == 1:
+        return formats[0]
+
+    key = (formats, _shape(sample[0]))
+    cached = _format_cache.get(key)
+    if cached is not None:
+        for fmt in formats[:formats.index(cached) + 1]:
+            if _parse_count(sample, fmt) == len(sample):
+                return fmt
+
+    counts = [_parse_count(sample, fmt) for fmt in formats]
+    if max(counts) == 0:
+        return None
+    fmt = formats[counts.index(max(counts))]
+    _format_cache[key] = fmt
+    return fmt
+
+
+def fix_century(dates, min_year=2000):
+    """Move datetime64 dates before min_year forward by 100 years (two-digit-year pivot)."""
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    early = ~np.isnat(dates) & (years < min_year)
+    if early.any():
+        months = dates[early].astype('datetime64[M]')
+        # Same position within the month, 1200 months later
+        dates = dates.copy()
+        dates[early] = (months + 1200).astype('datetime64[ns]') + (dates[early] - months.astype('datetime64[ns]'))
+    return dates
+
+
+def parse_dates(values, formats=None, min_year=None):
+    """Parse a column of date strings, parsing each distinct string only once.
+
+    The format is detected from a sample (see detect_format); if no candidate
+    fits, pandas infers it. Unparseable strings become NaT. With min_year,
+    dates before it are moved forward a century. Returns a datetime64 Series
+    with the same index for a Series, otherwise a DatetimeIndex.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    strings = pd.Index(uniques, dtype=object).astype(str).str.strip()
+    fmt = detect_format(strings, formats)
+    parsed = pd.to_datetime(strings, format=fmt, errors='coerce').to_numpy(dtype='datetime64[ns]')
+    if min_year is not None:
+        parsed = fix_century(parsed, min_year)
+
+    # Map back; missing values (code -1) become NaT
+    result = np.append(parsed, np.datetime64('NaT', 'ns'))[codes]
+    if isinstance(values, pd.Series):
+        return pd.Series(result, index=values.index, name=values.name)
+    return pd.DatetimeIndex(result)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str, format="%m/%d/%Y"):
+    """Parse one date string with strptime, cached; None if it does not match."""
+    try:
+        return datetime.strptime(date_str.strip(), format)
+    except ValueError:
+        return None
@@ -0,0 +1,310 @@
+"""
+Columnar binary cache for 'ID,lat,lon,t1..tN' deformation CSVs.
+
+The CSV is converted once into a directory next to it (DESC_CLIP.csv.cache/)
+holding a memory-mapped float32 (optionally float64) values.npy cube and
+sidecar ids.npy, lat.npy, lon.npy and times.npy arrays. Later runs open the
+cube in milliseconds and only page in the rows they touch. The cache is
+rebuilt when the source file changes (size/mtime, confirmed by SHA-1).
+
+The same directory layout (plus an attributes.csv) is the binary output
+format of Conversion_resample.py; such stack directories are opened as they
+are, and Parquet stacks are cached like CSVs.
+
+Usage:
+    python Deformation_Stack.py DESC_CLIP.csv [--float64] [--rebuild]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+
+# Same field order as read_time_series in RunMe_API_STPD_ID.py
+DeformationStack = namedtuple('DeformationStack', ['ids', 'latitudes', 'longitudes', 'times', 'values'])
+
+# Time columns of a resampled stack are named by the decimal year starting from zero (str(float): 0.0, 0.0833...)
+TIME_COLUMN = re.compile(r'^\d+\.\d+$')
+
+
+def cache_dir_for(csvpath):
+    """Return the cache directory used for a deformation CSV."""
+    return csvpath + '.cache'
+
+
+def scan_file(path, block_size=1 << 24):
+    """Return (SHA-1 hex digest, number of newlines) of a file in one sequential pass."""
+    sha1 = hashlib.sha1()
+    newlines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+            newlines += block.count(b'\n')
+    return sha1.hexdigest(), newlines
+
+
+def source_info(csvpath):
+    """Return the path, size and mtime recorded for a source file."""
+    stat = os.stat(csvpath)
+    return {'source': os.path.abspath(csvpath), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_meta(cache_dir):
+    """Read the meta.json of a cache directory, or return None if it has none."""
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+
+def write_meta(cache_dir, meta):
+    """Write meta.json atomically."""
+    tmp_path = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, 'meta.json'))
+
+
+def source_unchanged(csvpath, meta_dir, meta):
+    """Check a source file against the meta of a file derived from it.
+
+    Size and mtime are compared first; if only the mtime changed, the SHA-1
+    decides and the new mtime is recorded.
+    """
+    info = source_info(csvpath)
+    if meta['size'] != info['size']:
+        return False
+    if meta['mtime_ns'] != info['mtime_ns']:
+        # Touched or copied but possibly unchanged: confirm by content hash
+        sha1, _ = scan_file(csvpath)
+        if sha1 != meta['sha1']:
+            return False
+        meta['mtime_ns'] = info['mtime_ns']
+        write_meta(meta_dir, meta)
+    return True
+
+
+def is_cache_valid(csvpath, cache_dir=None, dtype='float32'):
+    """Check whether the binary cache of a CSV is up to date."""
+    cache_dir = cache_dir or cache_dir_for(csvpath)
+    meta = read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION or meta.get('dtype') != np.dtype(dtype).name:
+        return False
+    return source_unchanged(csvpath, cache_dir, meta)
+
+
+def split_columns(columns):
+    """Split wide-table column names into (attribute columns, time columns).
+
+    Time columns are the ones named by a decimal year (TIME_COLUMN), as
+    written by Conversion_resample.py; other numeric names (e.g. a column
+    called 2019 or 1e3) stay attributes.
+    """
+    attribute_cols, time_cols = [], []
+    for col in columns:
+        (time_cols if TIME_COLUMN.match(col) else attribute_cols).append(col)
+    return attribute_cols, time_cols
+
+
+def point_columns(attribute_cols):
+    """Pick the (ID, latitude, longitude) columns among attribute columns by name.
+
+    The ID is the first column unless one is called ID/CODE; latitude and
+    longitude are None when no column has a recognised name.
+    """
+    lower = {col.lower(): col for col in attribute_cols}
+    id_col = next((lower[name] for name in ('id', 'code', 'pid') if name in lower), attribute_cols[0])
+    lat_col = next((lower[name] for name in ('lat', 'latitude') if name in lower), None)
+    lon_col = next((lower[name] for name in ('lon', 'long', 'longitude') if name in lower), None)
+    return id_col, lat_col, lon_col
+
+
+class StackWriter:
+    """Write a stack directory (values.npy cube plus ids/lat/lon/times sidecars) block by block.
+
+    The directory is assembled under <stack_dir>.tmp and swapped in by close(),
+    so readers never see a half-written stack.
+    """
+
+    def __init__(self, stack_dir, max_rows, times, dtype='float32'):
+        self.stack_dir = stack_dir
+        self.tmp_dir = stack_dir + '.tmp'
+        self.times = np.asarray(times, dtype=float)
+        self.dtype = np.dtype(dtype)
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+        self.values = np.lib.format.open_memmap(os.path.join(self.tmp_dir, 'values.npy'), mode='w+',
+                                                dtype=self.dtype, shape=(max_rows, len(self.times)))
+        self.ids, self.latitudes, self.longitudes = [], [], []
+        self.n_rows = 0
+        self.has_attributes = False
+
+    def write(self, ids, latitudes, longitudes, values, attributes=None):
+        """Append a block of rows; optional attributes (a DataFrame) go to attributes.csv."""
+        n = len(ids)
+        self.ids.append(np.asarray(ids, dtype=str))
+        self.latitudes.append(np.asarray(latitudes, dtype=float))
+        self.longitudes.append(np.asarray(longitudes, dtype=float))
+        self.values[self.n_rows:self.n_rows + n] = values
+        if attributes is not None:
+            attributes.to_csv(os.path.join(self.tmp_dir, 'attributes.csv'), index=False,
+                              mode='a' if self.has_attributes else 'w', header=not self.has_attributes)
+            self.has_attributes = True
+        self.n_rows += n
+
+    def close(self, meta=None):
+        """Write the sidecars and meta.json and move the stack into place."""
+        self.values.flush()
+        max_rows = len(self.values)
+        del self.values
+
+        if self.n_rows != max_rows:
+            truncate_npy(os.path.join(self.tmp_dir, 'values.npy'), self.n_rows)
+
+        empty = np.array([], dtype=float)
+        np.save(os.path.join(self.tmp_dir, 'ids.npy'),
+                np.concatenate(self.ids) if self.ids else np.array([], dtype=str))
+        np.save(os.path.join(self.tmp_dir, 'lat.npy'), np.concatenate(self.latitudes) if self.latitudes else empty)
+        np.save(os.path.join(self.tmp_dir, 'lon.npy'), np.concatenate(self.longitudes) if self.longitudes else empty)
+        np.save(os.path.join(self.tmp_dir, 'times.npy'), self.times)
+
+        meta = dict(meta or {}, version=CACHE_VERSION, dtype=self.dtype.name,
+                    shape=[self.n_rows, len(self.times)])
+        # Stacks written directly (not cached from a source file) get a unique build id
+        meta.setdefault('sha1', 'build-' + uuid.uuid4().hex)
+        write_meta(self.tmp_dir, meta)
+
+        # Swap the finished stack in place of the old one
+        if os.path.exists(self.stack_dir):
+            shutil.rmtree(self.stack_dir)
+        os.replace(self.tmp_dir, self.stack_dir)
+        return self.stack_dir
+
+
+def truncate_npy(path, n_rows):
+    """Shrink a C-ordered 2-D .npy file to its first n_rows rows in place.
+
+    The header is rewritten with the new shape, padded to its old length
+    (the shape only gets shorter), and the file is truncated after the last
+    row, so no data is copied.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+        if fortran_order or len(shape) != 2:
+            raise ValueError(f"{path} is not a C-ordered 2-D array")
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                       'shape': (n_rows, shape[1])})
+        start = 8 + (2 if version == (1, 0) else 4)  # Magic string, version and header length field
+        f.seek(start)
+        f.write(header.ljust(offset - start - 1).encode('latin1') + b'\n')
+        f.truncate(offset + n_rows * shape[1] * dtype.itemsize)
+
+
+def _read_csv_blocks(csvpath, chunksize):
+    """Yield (ids, latitudes, longitudes, values) blocks of an ID,lat,lon,t1..tN CSV."""
+    with open(csvpath, 'r', newline='') as csvfile:
+        headers = next(csv.reader(csvfile, skipinitialspace=True))
+    reader = pd.read_csv(csvpath, skipinitialspace=True, dtype={headers[0]: str},
+                         chunksize=chunksize, low_memory=False)
+    for chunk in reader:
+        yield (chunk.iloc[:, 0].to_numpy(dtype=str), chunk.iloc[:, 1].to_numpy(dtype=float),
+               chunk.iloc[:, 2].to_numpy(dtype=float), chunk.iloc[:, 3:].to_numpy(dtype=float))
+
+
+def _read_parquet_blocks(path, chunksize):
+    """Yield (ids, latitudes, longitudes, values) blocks of a stack written as Parquet."""
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path)
+    attribute_cols, time_cols = split_columns(parquet.schema_arrow.names)
+    id_col, lat_col, lon_col = point_columns(attribute_cols)
+    columns = [id_col] + [col for col in (lat_col, lon_col) if col] + time_cols
+    for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+        frame = batch.to_pandas()
+        nan = np.full(len(frame), np.nan)
+        yield (frame[id_col].astype(str).to_numpy(dtype=str),
+               frame[lat_col].to_numpy(dtype=float) if lat_col else nan,
+               frame[lon_col].to_numpy(dtype=float) if lon_col else nan,
+               frame[time_cols].to_numpy(dtype=float))
+
+
+def build_cache(path, cache_dir=None, dtype='float32', chunksize=20000):
+    """Convert a deformation CSV (or Parquet stack) to the binary cache, reading it in chunks of rows."""
+    cache_dir = cache_dir or cache_dir_for(path)
+    info = source_info(path)
+    sha1, newlines = scan_file(path)
+
+    if path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        times = [float(col) for col in split_columns(parquet.schema_arrow.names)[1]]
+        max_rows = parquet.metadata.num_rows
+        blocks = _read_parquet_blocks(path, chunksize)
+    else:
+        with open(path, 'r', newline='') as csvfile:
+            headers = next(csv.reader(csvfile, skipinitialspace=True))
+        times = [float(time) for time in headers[3:]]
+        # Lines after the header (the last one may lack its newline); trimmed on close only if some are blank
+        with open(path, 'rb') as f:
+            f.seek(max(info['size'] - 1, 0))
+            unterminated = info['size'] > 0 and f.read(1) != b'\n'
+        max_rows = max(newlines - 1 + unterminated, 0)
+        blocks = _read_csv_blocks(path, chunksize)
+
+    writer = StackWriter(cache_dir, max_rows, times, dtype)
+    for block in blocks:
+        writer.write(*block)
+    return writer.close(dict(info, sha1=sha1))
+
+
+def open_cache(cache_dir):
+    """Open a cache directory; the arrays are memory-mapped read-only, so opening is O(1)."""
+    return DeformationStack(
+        ids=np.load(os.path.join(cache_dir, 'ids.npy'), mmap_mode='r'),
+        latitudes=np.load(os.path.join(cache_dir, 'lat.npy'), mmap_mode='r'),
+        longitudes=np.load(os.path.join(cache_dir, 'lon.npy'), mmap_mode='r'),
+        times=np.load(os.path.join(cache_dir, 'times.npy')),
+        values=np.load(os.path.join(cache_dir, 'values.npy'), mmap_mode='r'),
+    )
+
+
+def load_stack(csvpath, cache_dir=None, dtype='float32', rebuild=False):
+    """Open the deformation stack of a CSV through its binary cache, building it if needed.
+
+    csvpath may also be a Parquet stack (cached the same way) or a stack
+    directory written by Conversion_resample.py, which is opened directly.
+    """
+    if os.path.isdir(csvpath):
+        return open_cache(csvpath)
+    cache_dir = cache_dir or cache_dir_for(csvpath)
+    if rebuild or not is_cache_valid(csvpath, cache_dir, dtype):
+        print(f"Building binary cache for {csvpath} ...")
+        start = time.perf_counter()
+        build_cache(csvpath, cache_dir, dtype)
+        print(f"Cache written to {cache_dir} in {time.perf_counter() - start:.1f} s")
+    return open_cache(cache_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a deformation CSV to a memory-mapped binary cache.")
+    parser.add_argument('csvpath', help="Deformation CSV (ID,lat,lon,t1..tN)")
+    parser.add_argument('--cache-dir', default=None, help="Cache directory (default: <csvpath>.cache)")
+    parser.add_argument('--float64', action='store_true', help="Store values as float64 instead of float32")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild even if the cache is up to date")
+    args = parser.parse_args()
+
+    stack = load_stack(args.csvpath, args.cache_dir, 'float64' if args.float64 else 'float32', args.rebuild)
+    print(f"{len(stack.ids)} IDs x {len(stack.times)} epochs ({stack.values.dtype})")
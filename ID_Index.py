@@ -0,0 +1,213 @@
+"""
+Persistent ID -> row index for O(1) single-point lookup.
+
+An open-addressing hash table (64-bit FNV-1a hashes of the IDs and int64
+values, stored as two .npy files) maps each point ID to its row number in
+the binary cache of Deformation_Stack.py, or to the byte offset of its line
+in the raw CSV. The table is memory-mapped, so a lookup touches a few slots
+and then seeks straight to the one row it needs; single-ID latency stays
+flat as the dataset grows.
+
+Usage:
+    python ID_Index.py DESC_CLIP.csv 1021          # row of the binary cache
+    python ID_Index.py DESC_CLIP.csv 1021 --raw    # seek into the CSV itself
+"""
+import argparse
+import csv
+import os
+import shutil
+import time
+from collections import namedtuple
+import numpy as np
+from Deformation_Stack import (cache_dir_for, load_stack, read_meta, write_meta, source_info,
+                               source_unchanged, scan_file)
+
+INDEX_VERSION = 1
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+IDIndex = namedtuple('IDIndex', ['hashes', 'values'])
+
+
+def hash_ids(ids):
+    """Return 64-bit FNV-1a hashes of the UTF-8 bytes of each ID, vectorized over the IDs.
+
+    0 marks an empty slot in the table, so a hash of 0 is mapped to 1.
+    """
+    data = np.char.encode(np.asarray(ids, dtype=str), 'utf-8')
+    width = data.dtype.itemsize
+    codes = data.view(np.uint8).reshape(len(data), width)
+
+    hashes = np.full(len(data), FNV_OFFSET, dtype=np.uint64)
+    for j in range(width):
+        byte = codes[:, j].astype(np.uint64)
+        # Shorter IDs are NUL-padded; padding bytes are not part of the key
+        hashes = np.where(codes[:, j] != 0, (hashes ^ byte) * FNV_PRIME, hashes)
+    hashes[hashes == 0] = 1
+    return hashes
+
+
+def build_index(ids, values, index_dir, meta):
+    """Build the hash table for ids -> values (first occurrence wins) and save it in index_dir."""
+    ids = np.asarray(ids, dtype=str)
+    values = np.asarray(values, dtype=np.int64)
+    _, first = np.unique(ids, return_index=True)
+    first.sort()
+    hashes = hash_ids(ids[first])
+    values = values[first]
+
+    # Power-of-two table at most half full keeps probe sequences short
+    size = 1 << max(3, (2 * len(first)).bit_length())
+    mask = size - 1
+    slot_hashes = np.zeros(size, dtype=np.uint64)
+    slot_values = np.full(size, -1, dtype=np.int64)
+
+    # Linear probing, inserting every pending key in one vectorized round per probe step
+    home = (hashes & np.uint64(mask)).astype(np.int64)
+    pending = np.arange(len(first))
+    probe = np.zeros(len(first), dtype=np.int64)
+    while len(pending):
+        slots = (home[pending] + probe) & mask
+        free = np.flatnonzero(slot_hashes[slots] == 0)
+        _, winners = np.unique(slots[free], return_index=True)
+        winners = free[winners]
+        slot_hashes[slots[winners]] = hashes[pending[winners]]
+        slot_values[slots[winners]] = values[pending[winners]]
+
+        losers = np.ones(len(pending), dtype=bool)
+        losers[winners] = False
+        pending, probe = pending[losers], probe[losers] + 1
+
+    tmp_dir = index_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'hashes.npy'), slot_hashes)
+    np.save(os.path.join(tmp_dir, 'values.npy'), slot_values)
+    write_meta(tmp_dir, dict(meta, version=INDEX_VERSION, n_ids=len(first)))
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+
+
+def open_index(index_dir):
+    """Memory-map a saved index."""
+    return IDIndex(hashes=np.load(os.path.join(index_dir, 'hashes.npy'), mmap_mode='r'),
+                   values=np.load(os.path.join(index_dir, 'values.npy'), mmap_mode='r'))
+
+
+def lookup(index, id_, verify=None):
+    """Return the value stored for an ID, or None if it is not indexed.
+
+    verify(value) is called on hash matches to rule out 64-bit collisions.
+    """
+    key = hash_ids([id_])[0]
+    mask = len(index.hashes) - 1
+    slot = int(key & np.uint64(mask))
+    while True:
+        slot_hash = index.hashes[slot]
+        if slot_hash == 0:
+            return None
+        if slot_hash == key:
+            value = int(index.values[slot])
+            if verify is None or verify(value):
+                return value
+        slot = (slot + 1) & mask
+
+
+def open_row_index(csvpath, cache_dir=None, dtype='float32'):
+    """Open the binary cache of a CSV and its ID -> row index, building either if needed.
+
+    Returns (stack, index); use find_row(stack, index, id_) for lookups.
+    """
+    cache_dir = cache_dir or (csvpath if os.path.isdir(csvpath) else cache_dir_for(csvpath))
+    stack = load_stack(csvpath, cache_dir, dtype)
+    index_dir = os.path.join(cache_dir, 'id_index')
+
+    # The index belongs to one build of the cache, identified by the source hash
+    cache_sha1 = read_meta(cache_dir)['sha1']
+    meta = read_meta(index_dir)
+    if meta is None or meta.get('version') != INDEX_VERSION or meta.get('cache_sha1') != cache_sha1:
+        build_index(stack.ids, np.arange(len(stack.ids)), index_dir, {'cache_sha1': cache_sha1})
+    return stack, open_index(index_dir)
+
+
+def find_row(stack, index, id_):
+    """Row number of an ID in an opened cache, or None if the ID is not in the dataset."""
+    return lookup(index, id_, verify=lambda row: stack.ids[row] == id_)
+
+
+def scan_csv_offsets(csvpath):
+    """Return (ids, byte offsets of their lines) for a deformation CSV."""
+    ids, offsets = [], []
+    with open(csvpath, 'rb') as f:
+        offset = len(f.readline())  # Skip header
+        for line in f:
+            if line.strip():
+                ids.append(line.split(b',', 1)[0].decode().strip('"'))
+                offsets.append(offset)
+            offset += len(line)
+    return ids, offsets
+
+
+def open_offset_index(csvpath, index_dir=None):
+    """Open the ID -> byte offset index of a raw CSV, building it if the CSV changed."""
+    index_dir = index_dir or csvpath + '.idindex'
+    meta = read_meta(index_dir)
+    if meta is None or meta.get('version') != INDEX_VERSION or not source_unchanged(csvpath, index_dir, meta):
+        sha1, _ = scan_file(csvpath)
+        ids, offsets = scan_csv_offsets(csvpath)
+        build_index(ids, offsets, index_dir, dict(source_info(csvpath), sha1=sha1))
+    return open_index(index_dir)
+
+
+def read_csv_row(csvpath, id_, index=None):
+    """Read one ID straight from the raw CSV by seeking to its line.
+
+    Returns (id, latitude, longitude, times, values) like one row of
+    read_time_series in RunMe_API_STPD_ID.py, or None if the ID is absent.
+    """
+    index = index or open_offset_index(csvpath)
+    with open(csvpath, 'r', newline='') as csvfile:
+        headers = next(csv.reader(csvfile, skipinitialspace=True))
+
+        def parse(offset):
+            csvfile.seek(offset)
+            return next(csv.reader([csvfile.readline()], skipinitialspace=True))
+
+        offset = lookup(index, id_, verify=lambda offset: parse(offset)[0] == id_)
+        if offset is None:
+            return None
+        row = parse(offset)
+
+    times = np.array([float(time) for time in headers[3:]])
+    values = np.array([float(val) if val else np.nan for val in row[3:]])
+    return row[0], float(row[1]), float(row[2]), times, values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up one point ID through a persistent ID index.")
+    parser.add_argument('csvpath', help="Deformation CSV (ID,lat,lon,t1..tN)")
+    parser.add_argument('id', help="Point ID to look up")
+    parser.add_argument('--raw', action='store_true', help="Seek into the CSV instead of the binary cache")
+    args = parser.parse_args()
+
+    if args.raw:
+        index = open_offset_index(args.csvpath)
+        start = time.perf_counter()
+        row = read_csv_row(args.csvpath, args.id, index)
+        found = row is not None
+        values = row[4] if found else None
+    else:
+        stack, index = open_row_index(args.csvpath)
+        start = time.perf_counter()
+        i = find_row(stack, index, args.id)
+        found = i is not None
+        values = np.asarray(stack.values[i], dtype=float) if found else None
+    elapsed = time.perf_counter() - start
+
+    if not found:
+        print(f"Error: ID '{args.id}' not found in the dataset.")
+    else:
+        print(f"ID {args.id}: {len(values)} epochs, {np.count_nonzero(np.isnan(values))} missing "
+              f"(lookup {elapsed * 1e3:.2f} ms)")
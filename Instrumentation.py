@@ -0,0 +1,245 @@
+"""
+Per-stage timing and memory instrumentation for the pipeline scripts.
+
+Scripts wrap their stages (CSV parsing, date handling, STPD/TPTR, savefig,
+...) in `with stage('name') as s:` and count what they processed with
+s.count(rows=..., points=...). A stage records wall-clock and CPU time, the
+process peak RSS and, with trace_memory, the peak tracemalloc allocation
+inside it (nested stages included). Repeated stages (e.g. per chunk) are
+accumulated under one name. CPU time and memory cover this process only, not
+worker processes.
+
+Instrumentation is off by default: stage() then returns one shared no-op
+object, so an instrumented script costs an attribute lookup per stage. Turn
+it on in code with enable(), or for any script with environment variables:
+
+    STPD_REPORT=run_report.json   enable and write the report (.json or .csv) at exit
+    STPD_TRACEMALLOC=1            also trace Python/NumPy allocations (slower)
+    STPD_PROFILE=stpd             run cProfile over one stage, stats in <report>.<stage>.prof
+"""
+import atexit
+import cProfile
+import csv
+import functools
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_FIELDS = ['stage', 'calls', 'wall_s', 'cpu_s', 'peak_traced_mb', 'peak_rss_mb', 'rows', 'points']
+
+# Recorder state; 'enabled' is the only key read when instrumentation is off
+_state = {'enabled': False}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB), or None where it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+    except (ImportError, AttributeError):
+        return None
+
+
+class _NullStage:
+    """Stage used when instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, rows=0, points=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """One timed run of a named stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.points = 0
+        self.profiler = None
+
+    def count(self, rows=0, points=0):
+        """Add processed rows / points to the stage."""
+        self.rows += rows
+        self.points += points
+
+    def __enter__(self):
+        stack = _state['stack']
+        if _state['trace_memory']:
+            # Keep the peak reached so far for the enclosing stage, then measure this one from here
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, peak)
+            tracemalloc.reset_peak()
+            self.traced_peak = current
+        stack.append(self)
+        if self.name == _state['profile_stage']:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+            _state['profiles'].append(self.profiler)
+        stack = _state['stack']
+        stack.pop()
+        traced = None
+        if _state['trace_memory']:
+            traced = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1].traced_peak = max(stack[-1].traced_peak, traced)
+
+        record = _state['records'].get(self.name)
+        if record is None:
+            record = _state['records'][self.name] = dict.fromkeys(REPORT_FIELDS, 0)
+            record.update(stage=self.name, peak_traced_mb=None, peak_rss_mb=None)
+        record['calls'] += 1
+        record['wall_s'] += wall
+        record['cpu_s'] += cpu
+        record['rows'] += self.rows
+        record['points'] += self.points
+        if traced is not None:
+            record['peak_traced_mb'] = max(record['peak_traced_mb'] or 0.0, traced / 2**20)
+        record['peak_rss_mb'] = peak_rss_mb()
+        return False
+
+
+def enable(report_path=None, trace_memory=False, profile_stage=None):
+    """Start recording stages; with report_path the report is also written at exit."""
+    _state.update(enabled=True, records={}, stack=[], trace_memory=trace_memory, profile_stage=profile_stage,
+                  profiles=[], report_path=report_path, started=time.perf_counter(),
+                  date=datetime.now().isoformat(timespec='seconds'))
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if report_path and not _state.get('atexit'):
+        atexit.register(_write_at_exit)
+        _state['atexit'] = True
+
+
+def disable():
+    """Stop recording (the records are kept for report())."""
+    _state['enabled'] = False
+    if tracemalloc.is_tracing() and _state.get('trace_memory'):
+        tracemalloc.stop()
+
+
+def enabled():
+    return _state['enabled']
+
+
+def stage(name):
+    """Context manager timing one stage; a shared no-op when instrumentation is off."""
+    if not _state['enabled']:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def instrumented(name=None):
+    """Decorator running a function as a stage (named after the function by default)."""
+    def decorate(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def report():
+    """Run report: run metadata and one record per stage, in first-finished order."""
+    if 'records' not in _state:
+        return {'run': {}, 'stages': []}
+    return {
+        'run': {
+            'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            'argv': sys.argv[1:],
+            'date': _state['date'],
+            'wall_s': time.perf_counter() - _state['started'],
+            'peak_rss_mb': peak_rss_mb(),
+            'trace_memory': _state['trace_memory'],
+        },
+        'stages': [dict(record) for record in _state['records'].values()],
+    }
+
+
+def write_report(path):
+    """Write the run report as JSON (.json) or CSV (one row per stage), plus profiler stats if any."""
+    data = report()
+    if path.lower().endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(data['stages'])
+    if _state.get('profiles'):
+        profile_path = f"{os.path.splitext(path)[0]}.{_state['profile_stage']}.prof"
+        stats = pstats.Stats(_state['profiles'][0])
+        for profiler in _state['profiles'][1:]:
+            stats.add(profiler)
+        stats.dump_stats(profile_path)
+    return path
+
+
+def summary(limit=20):
+    """Text table of the stages, slowest first, and the top functions of the profiled stage."""
+    lines = [f"{'stage':<24}{'calls':>7}{'wall (s)':>11}{'cpu (s)':>10}{'traced MB':>11}"
+             f"{'RSS MB':>9}{'rows':>11}{'points':>10}"]
+    for record in sorted(report()['stages'], key=lambda r: -r['wall_s']):
+        traced = '-' if record['peak_traced_mb'] is None else f"{record['peak_traced_mb']:.1f}"
+        rss = '-' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.0f}"
+        lines.append(f"{record['stage']:<24}{record['calls']:>7}{record['wall_s']:>11.3f}{record['cpu_s']:>10.3f}"
+                     f"{traced:>11}{rss:>9}{record['rows']:>11}{record['points']:>10}")
+    if _state.get('profiles'):
+        out = io.StringIO()
+        stats = pstats.Stats(_state['profiles'][0], stream=out)
+        for profiler in _state['profiles'][1:]:
+            stats.add(profiler)
+        stats.sort_stats('cumulative').print_stats(limit)
+        lines.append(f"\ncProfile of stage '{_state['profile_stage']}':")
+        lines.append(out.getvalue())
+    return '\n'.join(lines)
+
+
+def _write_at_exit():
+    if _state.get('report_path') and _state.get('records'):
+        write_report(_state['report_path'])
+        print(summary(), file=sys.stderr)
+        print(f"Run report saved to {_state['report_path']}", file=sys.stderr)
+
+
+# Environment switch, so every script can be instrumented without editing it (main process only:
+# spawned workers inherit the environment but must not write the report)
+if os.environ.get('STPD_REPORT') and multiprocessing.parent_process() is None:
+    enable(os.environ['STPD_REPORT'], trace_memory=os.environ.get('STPD_TRACEMALLOC', '') not in ('', '0'),
+           profile_stage=os.environ.get('STPD_PROFILE') or None)
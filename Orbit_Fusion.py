@@ -0,0 +1,197 @@
+"""
+Ascending/descending orbit fusion into vertical and east-west displacement.
+
+ASC and DESC points are paired through the spatial index of the DESC stack
+(nearest neighbour within a distance, one ASC point per DESC point), their
+monthly epochs are put on the common months of both stacks, and the two
+line-of-sight (LOS) series of every pair are decomposed at once by solving
+the batched 2x2 systems
+
+    LOS_asc  = -sin(inc_a) cos(head_a) E + cos(inc_a) U
+    LOS_desc = -sin(inc_d) cos(head_d) E + cos(inc_d) U
+
+(LOS positive towards the satellite, north motion neglected) with
+np.linalg.solve. Both LOS series are referenced to the first common epoch.
+The vertical and east-west results are written in the stack format read by
+RunMe_API_STPD_ID.py: a stack directory (default) or an ID,lat,lon,t1..tN CSV.
+
+Usage:
+    python Orbit_Fusion.py ASC_CLIP.csv DESC_CLIP.csv --asc-start 2011-03 --desc-start 2011-05 --output FUSED
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from Deformation_Stack import StackWriter, load_stack
+from Spatial_Index import stack_spatial_index, query_nearest
+
+# Default Sentinel-1 geometry over the study area (degrees); heading is clockwise from north
+ASC_INCIDENCE, ASC_HEADING = 39.0, -12.0
+DESC_INCIDENCE, DESC_HEADING = 39.0, -168.0
+
+
+def month_codes(times, start):
+    """Month codes (months since 1970-01) of decimal-year epochs counted from a 'YYYY-MM' start."""
+    first = np.datetime64(start, 'M').astype(np.int64)
+    return first + np.rint(np.asarray(times, dtype=float) * 12).astype(np.int64)
+
+
+def common_epochs(asc_codes, desc_codes):
+    """Columns of the ASC and DESC stacks on their common months, and those months."""
+    months, asc_cols, desc_cols = np.intersect1d(asc_codes, desc_codes, return_indices=True)
+    return months, asc_cols, desc_cols
+
+
+def match_pairs(asc, desc_index, max_distance=50.0):
+    """Pair ASC points with their nearest DESC point within max_distance metres.
+
+    Each DESC point keeps only its closest ASC point. Returns (asc_rows,
+    desc_rows, distances) sorted by DESC row.
+    """
+    distances, desc_rows = query_nearest(desc_index, asc.latitudes, asc.longitudes, k=1, max_distance=max_distance)
+    asc_rows = np.flatnonzero(desc_rows >= 0)
+    desc_rows, distances = desc_rows[asc_rows], distances[asc_rows]
+
+    # One-to-one: closest ASC point per DESC point
+    order = np.lexsort((distances, desc_rows))
+    first = np.r_[True, np.diff(desc_rows[order]) != 0]
+    keep = order[first]
+    return asc_rows[keep], desc_rows[keep], distances[keep]
+
+
+def los_matrix(asc_incidence, asc_heading, desc_incidence, desc_heading):
+    """(..., 2, 2) matrices mapping (east, up) to (LOS asc, LOS desc); angles in degrees, scalars or per pair."""
+    inc_a, head_a, inc_d, head_d = np.broadcast_arrays(*(np.radians(np.asarray(a, dtype=float)) for a in
+                                                         (asc_incidence, asc_heading, desc_incidence, desc_heading)))
+    G = np.empty(inc_a.shape + (2, 2))
+    G[..., 0, 0] = -np.sin(inc_a) * np.cos(head_a)
+    G[..., 0, 1] = np.cos(inc_a)
+    G[..., 1, 0] = -np.sin(inc_d) * np.cos(head_d)
+    G[..., 1, 1] = np.cos(inc_d)
+    return G
+
+
+def decompose(los_asc, los_desc, G):
+    """Solve the 2x2 LOS systems of all pairs and epochs at once.
+
+    los_asc and los_desc are (pairs x epochs); G is (2, 2) or (pairs, 2, 2).
+    Returns (east, up), each (pairs x epochs). Epochs missing from either
+    orbit are NaN.
+    """
+    G = np.broadcast_to(G, (len(los_asc), 2, 2))
+    rhs = np.stack([los_asc, los_desc], axis=1)  # (pairs, 2, epochs)
+    missing = np.isnan(rhs).any(axis=1)
+    solution = np.linalg.solve(G, np.nan_to_num(rhs))
+    east = np.where(missing, np.nan, solution[:, 0])
+    up = np.where(missing, np.nan, solution[:, 1])
+    return east, up
+
+
+def _reference(values, column=0):
+    """Series relative to one epoch (the first common one); rows without it keep their values."""
+    base = values[:, [column]]
+    return values - np.where(np.isnan(base), 0.0, base)
+
+
+class CSVStackWriter:
+    """StackWriter counterpart writing the ID,lat,lon,t1..tN CSV layout block by block."""
+
+    def __init__(self, path, times):
+        self.path = path
+        self.columns = [repr(float(t)) for t in times]
+        self.started = False
+
+    def write(self, ids, latitudes, longitudes, values, attributes=None):
+        frame = pd.DataFrame(values, columns=self.columns)
+        frame.insert(0, 'lon', longitudes)
+        frame.insert(0, 'lat', latitudes)
+        frame.insert(0, 'ID', ids)
+        frame.to_csv(self.path, index=False, mode='a' if self.started else 'w', header=not self.started)
+        self.started = True
+
+    def close(self, meta=None):
+        return self.path
+
+
+def _writer(path, max_rows, times, dtype):
+    if path.lower().endswith('.csv'):
+        return CSVStackWriter(path, times)
+    return StackWriter(path, max_rows, times, dtype)
+
+
+def fuse(asc_path, desc_path, output_prefix, asc_start='2011-05', desc_start='2011-05', max_distance=50.0,
+         asc_geometry=(ASC_INCIDENCE, ASC_HEADING), desc_geometry=(DESC_INCIDENCE, DESC_HEADING),
+         output_format='stack', block_size=20000, dtype='float32'):
+    """Fuse an ASC and a DESC stack into vertical and east-west stacks.
+
+    Writes <output_prefix>_vertical and <output_prefix>_east (stack
+    directories, or .csv with output_format='csv') and
+    <output_prefix>_pairs.csv. Returns the number of fused points.
+    """
+    asc = load_stack(asc_path)
+    desc, desc_index = stack_spatial_index(desc_path)
+
+    months, asc_cols, desc_cols = common_epochs(month_codes(asc.times, asc_start), month_codes(desc.times, desc_start))
+    if len(months) == 0:
+        raise ValueError("The ASC and DESC stacks have no common months")
+    # Decimal years from the first common month, like Conversion_resample.py
+    times = (months - months[0]) / 12
+
+    asc_rows, desc_rows, distances = match_pairs(asc, desc_index, max_distance)
+    n_pairs = len(asc_rows)
+    ids = np.char.add(np.char.add(np.asarray(asc.ids)[asc_rows].astype(str), '_'),
+                      np.asarray(desc.ids)[desc_rows].astype(str))
+    latitudes = (np.asarray(asc.latitudes)[asc_rows] + np.asarray(desc.latitudes)[desc_rows]) / 2
+    longitudes = (np.asarray(asc.longitudes)[asc_rows] + np.asarray(desc.longitudes)[desc_rows]) / 2
+
+    suffix = '.csv' if output_format == 'csv' else ''
+    vertical_path, east_path = output_prefix + '_vertical' + suffix, output_prefix + '_east' + suffix
+    vertical = _writer(vertical_path, n_pairs, times, dtype)
+    east = _writer(east_path, n_pairs, times, dtype)
+    G = los_matrix(asc_geometry[0], asc_geometry[1], desc_geometry[0], desc_geometry[1])
+    if abs(np.linalg.det(G)) < 1e-6:
+        raise ValueError("ASC and DESC geometries are too similar to separate east and vertical motion")
+
+    start = time.perf_counter()
+    for block in range(0, n_pairs, block_size):
+        sl = slice(block, min(block + block_size, n_pairs))
+        los_asc = np.asarray(asc.values[asc_rows[sl]], dtype=float)
+        los_desc = np.asarray(desc.values[desc_rows[sl]], dtype=float)
+        los_asc = _reference(los_asc[:, asc_cols])
+        los_desc = _reference(los_desc[:, desc_cols])
+        e, u = decompose(los_asc, los_desc, G)
+        vertical.write(ids[sl], latitudes[sl], longitudes[sl], u)
+        east.write(ids[sl], latitudes[sl], longitudes[sl], e)
+
+    meta = {'asc_source': os.path.abspath(asc_path), 'desc_source': os.path.abspath(desc_path),
+            'first_month': str(months[0].astype('datetime64[M]'))}
+    vertical.close(dict(meta, component='vertical'))
+    east.close(dict(meta, component='east'))
+    pd.DataFrame({'ID': ids, 'ASC_ID': np.asarray(asc.ids)[asc_rows], 'DESC_ID': np.asarray(desc.ids)[desc_rows],
+                  'Distance_m': distances}).to_csv(output_prefix + '_pairs.csv', index=False)
+
+    elapsed = time.perf_counter() - start
+    print(f"{n_pairs} ASC/DESC pairs x {len(months)} common months decomposed in {elapsed:.2f} s "
+          f"({len(asc.ids)} ASC, {len(desc.ids)} DESC points)")
+    print(f"Vertical displacement saved to {vertical_path}, east-west to {east_path}")
+    return n_pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuse ASC and DESC LOS stacks into vertical and east-west stacks.")
+    parser.add_argument('asc', help="Ascending stack (CSV, Parquet or stack directory)")
+    parser.add_argument('desc', help="Descending stack (CSV, Parquet or stack directory)")
+    parser.add_argument('--asc-start', default='2011-05', help="Month (YYYY-MM) of the first ASC epoch")
+    parser.add_argument('--desc-start', default='2011-05', help="Month (YYYY-MM) of the first DESC epoch")
+    parser.add_argument('--max-distance', type=float, default=50.0, help="Maximum ASC-DESC pair distance (m)")
+    parser.add_argument('--asc-geometry', type=float, nargs=2, default=[ASC_INCIDENCE, ASC_HEADING],
+                        metavar=('INCIDENCE', 'HEADING'), help="ASC incidence and heading angles (degrees)")
+    parser.add_argument('--desc-geometry', type=float, nargs=2, default=[DESC_INCIDENCE, DESC_HEADING],
+                        metavar=('INCIDENCE', 'HEADING'), help="DESC incidence and heading angles (degrees)")
+    parser.add_argument('--format', choices=['stack', 'csv'], default='stack', help="Output format")
+    parser.add_argument('--output', default='FUSED', help="Output prefix")
+    args = parser.parse_args()
+
+    fuse(args.asc, args.desc, args.output, args.asc_start, args.desc_start, args.max_distance,
+         tuple(args.asc_geometry), tuple(args.desc_geometry), args.format)
@@ -1,6 +1,12 @@
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from Correlation_Significance import correlation_significance
+from Date_Parser import parse_dates
+from Instrumentation import stage
+
+# Bootstrap/permutation resamples for the CI and p-value of the correlation
+n_resamples = 10000
 
 # Set global font size for research-quality plots
 plt.rcParams.update({
@@ -20,11 +26,11 @@ pdata = pd.read_csv(file_path, sep=r'\s+', header=None, names=['Date', 'Precipit
 gpm = pd.read_csv(r"D:\PhD_Main\STPD\STPD\GPM.csv", header=None, names=['date', 'mean_precipitation'])
 
 # Convert 'Date' to datetime and 'Precipitation' to numeric for pdata
-pdata['Date'] = pd.to_datetime(pdata['Date'], format='%d/%m/%Y', errors='coerce')
+pdata['Date'] = parse_dates(pdata['Date'], formats=['%d/%m/%Y'])
 pdata['Precipitation'] = pd.to_numeric(pdata['Precipitation'], errors='coerce')
 
 # Convert 'date' to datetime and 'mean_precipitation' to numeric for gpm
-gpm['date'] = pd.to_datetime(gpm['date'], errors='coerce')
+gpm['date'] = parse_dates(gpm['date'])
 gpm['mean_precipitation'] = pd.to_numeric(gpm['mean_precipitation'], errors='coerce')
 
 # Subset pdata to the range from 2011 to 2022
@@ -48,6 +54,15 @@ merged_data.dropna(inplace=True)
 # Calculate the Pearson correlation
 correlation = merged_data['Precipitation'].corr(merged_data['mean_precipitation'])
 
+# 95% bootstrap confidence interval and permutation p-value (one pair, so no worker processes)
+with stage('significance') as s:
+    significance = correlation_significance(merged_data[['Precipitation']].to_numpy(),
+                                            merged_data[['mean_precipitation']].to_numpy(),
+                                            n_resamples=n_resamples, workers=1)
+    s.count(rows=len(merged_data))
+ci_low, ci_high, p_value = significance.ci_low[0], significance.ci_high[0], significance.p_value[0]
+print(f"Pearson r = {correlation:.3f}, 95% CI [{ci_low:.3f}, {ci_high:.3f}], p = {p_value:.4g}")
+
 # Scatter Plot with Regression Line
 plt.figure(figsize=(9, 7))
 sns.regplot(x='Precipitation', y='mean_precipitation', data=merged_data,
@@ -59,13 +74,15 @@ plt.xlabel("Local Station Precipitation (mm)", fontweight='bold')
 plt.ylabel("GPM Precipitation (mm)", fontweight='bold')
 
 # Annotate the Pearson correlation on the plot
-plt.text(0.05, 0.93, f'Pearson Correlation: {correlation:.2f}', 
+plt.text(0.05, 0.88, f'Pearson Correlation: {correlation:.2f}\n'
+         f'95% CI: [{ci_low:.2f}, {ci_high:.2f}], p = {p_value:.3g}', 
          transform=plt.gca().transAxes, fontsize=14, color='black', 
          bbox=dict(facecolor='white', alpha=0.6, edgecolor='black'))
 
 plt.grid(True, linestyle="--", alpha=0.6)
 save_path = "D:/PhD_Main/STPD/STPD/RESULTS/Paper/Precipitation_Corr.png"
-plt.savefig(save_path, dpi=300, bbox_inches='tight')
+with stage('savefig'):
+    plt.savefig(save_path, dpi=300, bbox_inches='tight')
 plt.show()
 
 # Correlation Heatmap
@@ -80,5 +97,6 @@ plt.title("Pearson Correlation Heatmap", fontweight='bold')
 plt.xticks(fontsize=12, fontweight='bold')
 plt.yticks(fontsize=12, fontweight='bold')
 save_path = "D:/PhD_Main/STPD/STPD/RESULTS/Paper/Heatmap.png"
-plt.savefig(save_path, dpi=300, bbox_inches='tight')
+with stage('savefig'):
+    plt.savefig(save_path, dpi=300, bbox_inches='tight')
 plt.show()
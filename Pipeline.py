@@ -0,0 +1,473 @@
+"""
+One entry point for the API -> STPD -> histogram -> plot workflow.
+
+The steps of API_Calculation.py, STPD_Batch.py (the batch form of
+RunMe_API_STPD_ID.py), TP_Histogram.py, DIR_Histogram.py and API_Plot.py are
+modelled as stages with declared inputs, parameters and outputs:
+
+    api             Pdata file -> Output_API_mean.csv
+    spells          Pdata file -> Output_API_spells.csv
+    stpd_desc/asc   deformation CSV -> <ORBIT>_filtered_turning_points.csv
+    tp_histogram    both turning-point tables -> monthly counts and combined histogram
+    dir_desc/asc    one turning-point table -> direction counts and histogram
+    api_plot        monthly API -> API bar plot
+    series_plots    deformation CSV + monthly API -> per-ID figures (only with --plot-ids)
+
+Each stage's outputs are cached under <cache>/<stage>/<key>, where the key
+is the SHA-1 of the stage name, its parameters, its code and its inputs: the
+content hash of each raw file (memoised by size and mtime) or the key of the
+stage that produced it. The code hash covers the source of the stage function
+and the files of the workflow modules it imports, directly or through other
+modules (STPD and TPTR included), so editing e.g. TP_Aggregator.py reruns the
+histograms. Keys are known before anything runs, so stages whose key
+is already in the cache are skipped, and changing e.g. the decay factor k
+only reruns the API stages and the plots that read them. Stages whose inputs are ready run
+concurrently in a process pool (the ASC and DESC branches, histograms next
+to plots); the cores given by --workers are split between them. Finished
+outputs are hard-linked (or copied) into the output directory.
+
+Usage:
+    python Pipeline.py --precipitation Pdata_Petacciato.txt --desc DESC_CLIP.csv --asc ASC_CLIP.csv --output-dir RESULTS
+    python Pipeline.py --k 0.9 --api-threshold 80 --dry-run
+"""
+import argparse
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import shutil
+import sysconfig
+import textwrap
+import time
+import types
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+from API_Calculation import load_precipitation, add_api, high_api_spells, monthly_api
+from API_Engine import station_name
+from API_Plot import read_api, plot_api
+from DIR_Histogram import plot_direction_histogram
+from Deformation_Stack import load_stack, scan_file, read_meta, write_meta
+from RunMe_API_STPD_ID import STPD_PARAMS, generate_dates, read_api_data, filter_api_dates
+from TP_Aggregator import aggregate_files, direction_table
+from TP_Histogram import monthly_histogram, plot_histogram
+
+# Bump to invalidate every cached stage output after a change the code hash does not see
+# (e.g. an upgrade of pandas or matplotlib)
+PIPELINE_VERSION = 1
+
+# Modules whose source is part of the code hash even when they are installed in site-packages
+SOURCE_MODULES = ('STPD', 'TPTR')
+
+# inputs maps a name to a file path or a Ref; outputs maps a name to a file (or directory) name
+Stage = namedtuple('Stage', ['name', 'function', 'inputs', 'params', 'outputs'])
+
+# Output of an upstream stage
+Ref = namedtuple('Ref', ['stage', 'output'])
+
+ORBIT_NAMES = {'desc': 'Descending Orbit', 'asc': 'Ascending Orbit'}
+
+# Inputs opened with Deformation_Stack.load_stack, whose binary cache is built in the parent process
+STACK_INPUTS = ('deformation',)
+
+# Default file paths
+precipitation_path = "D:/PhD_Main/STPD/STPD/Pdata_Petacciato.txt"
+desc_path = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/DESC_CLIP.csv"
+asc_path = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/ASC_CLIP.csv"
+output_dir = "D:/PhD_Main/STPD/STPD/RESULTS/Pipeline"
+
+
+def api_stage(inputs, params, outputs, workers):
+    """Monthly mean API of one gauge file (API_Calculation.py)."""
+    data = add_api(load_precipitation(inputs['precipitation'], params['start'], params['end']), params['k'])
+    monthly_api(data).to_csv(outputs['api_mean'], index=False)
+
+
+def spells_stage(inputs, params, outputs, workers):
+    """High-API spells of the daily API of one gauge file (API_Calculation.py)."""
+    data = add_api(load_precipitation(inputs['precipitation'], params['start'], params['end']), params['k'])
+    high_api_spells(data, params['threshold'], station_name(inputs['precipitation'])).to_csv(outputs['spells'],
+                                                                                            index=False)
+
+
+def stpd_stage(inputs, params, outputs, workers):
+    """STPD/TPTR over every ID of a deformation CSV (STPD_Batch.py)."""
+    from STPD_Batch import run_batch
+    stack = load_stack(inputs['deformation'])
+    dates = generate_dates(start_month=params['start_month'], start_year=params['start_year'],
+                           num_months=len(stack.times))
+    run_batch(list(stack.ids), stack.latitudes, stack.longitudes, stack.times, stack.values, dates,
+              outputs['turning_points'], params=params['stpd'], workers=workers,
+              source=os.path.abspath(inputs['deformation']))
+
+
+def tp_histogram_stage(inputs, params, outputs, workers):
+    """Monthly turning-point counts of the orbits, stacked in one histogram (TP_Histogram.py)."""
+    hist = monthly_histogram(aggregate_files({ORBIT_NAMES[orbit]: path for orbit, path in inputs.items()},
+                                             workers=workers))
+    hist.astype(int).to_csv(outputs['counts'], index_label='Month')
+    plt.close(plot_histogram(hist, outputs['figure'], dpi=params['dpi']))
+
+
+def dir_histogram_stage(inputs, params, outputs, workers):
+    """Direction-bin counts of one turning-point table by slope sign (DIR_Histogram.py)."""
+    table = direction_table(aggregate_files({'table': inputs['turning_points']}, workers=workers)['table'])
+    table.to_csv(outputs['counts'])
+    plt.close(plot_direction_histogram(table, params['orbit'], outputs['figure'], dpi=params['dpi']))
+
+
+def api_plot_stage(inputs, params, outputs, workers):
+    """Monthly API bars with the high spells highlighted (API_Plot.py)."""
+    plt.close(plot_api(read_api(inputs['api_mean']), params['threshold'], outputs['figure'], dpi=params['dpi']))
+
+
+def series_plots_stage(inputs, params, outputs, workers):
+    """Time_Series_API_Analysis figures of the given IDs (RunMe_API_STPD_ID.py, via Plot_Render.py)."""
+    from Plot_Render import render_all
+    stack = load_stack(inputs['deformation'])
+    wanted = set(params['ids'])
+    rows = [i for i, id_ in enumerate(stack.ids) if id_ in wanted]
+    deformation_dates = generate_dates(start_month=params['start_month'], start_year=params['start_year'],
+                                       num_months=len(stack.times))
+    api_dates, api_values = read_api_data(inputs['api_mean'], format='%Y-%m-%d')
+    api_dates, api_values = filter_api_dates(api_dates, api_values, deformation_dates)
+    render_all(inputs['deformation'], rows, deformation_dates, api_dates, api_values, outputs['figures'],
+               workers=workers, dpi=params['dpi'], params=params['stpd'])
+
+
+def build_stages(precipitation, orbits, k=0.85, api_threshold=100, plot_threshold=90, start='2011-01-01',
+                 end='2022-12-31', stpd_params=STPD_PARAMS, start_month=5, start_year=2011, dpi=300,
+                 histogram_dpi=600, plot_ids=None, plot_orbit='desc'):
+    """The stages of the workflow; orbits maps 'desc'/'asc' to deformation CSVs (missing orbits are left out)."""
+    stpd = dict(stpd=dict(stpd_params), start_month=start_month, start_year=start_year)
+    api = dict(k=k, start=start, end=end)
+    # The spell threshold is a stage of its own, so changing it leaves the monthly API (and the plots) cached
+    stages = [Stage('api', api_stage, {'precipitation': precipitation}, api, {'api_mean': 'Output_API_mean.csv'}),
+              Stage('spells', spells_stage, {'precipitation': precipitation}, dict(api, threshold=api_threshold),
+                    {'spells': 'Output_API_spells.csv'})]
+    for orbit, path in orbits.items():
+        label = orbit.upper()
+        stages.append(Stage(f'stpd_{orbit}', stpd_stage, {'deformation': path}, stpd,
+                            {'turning_points': f'{label}_filtered_turning_points.csv'}))
+    stages.append(Stage('tp_histogram', tp_histogram_stage,
+                        {orbit: Ref(f'stpd_{orbit}', 'turning_points') for orbit in orbits}, dict(dpi=histogram_dpi),
+                        {'counts': 'TP_monthly_counts.csv', 'figure': 'Combined_Histogram_HighRes.png'}))
+    for orbit in orbits:
+        name = ORBIT_NAMES[orbit].split()[0]
+        stages.append(Stage(f'dir_{orbit}', dir_histogram_stage, {'turning_points': Ref(f'stpd_{orbit}', 'turning_points')},
+                            dict(orbit=name, dpi=dpi),
+                            {'counts': f'TPF_{name.upper()}_counts.csv', 'figure': f'TPF_{name.upper()}_HighRes.png'}))
+    stages.append(Stage('api_plot', api_plot_stage, {'api_mean': Ref('api', 'api_mean')},
+                        dict(threshold=plot_threshold, dpi=dpi), {'figure': 'API_PLOT.png'}))
+    if plot_ids:
+        stages.append(Stage('series_plots', series_plots_stage,
+                            {'deformation': orbits[plot_orbit], 'api_mean': Ref('api', 'api_mean')},
+                            dict(stpd, ids=sorted(plot_ids), dpi=dpi), {'figures': 'PLOT'}))
+    return stages
+
+
+def input_hash(path, memo):
+    """Content hash of a raw input: SHA-1 of a file (reused while its size and mtime are unchanged),
+    or the sha1 recorded in the meta.json of a stack directory."""
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        meta = read_meta(path)
+        if meta is None or 'sha1' not in meta:
+            raise ValueError(f"{path} is a directory without a stack meta.json")
+        return meta['sha1']
+    stat = os.stat(path)
+    known = memo.get(path)
+    if known is None or known['size'] != stat.st_size or known['mtime_ns'] != stat.st_mtime_ns:
+        known = memo[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': scan_file(path)[0]}
+    return known['sha1']
+
+
+def module_file(name):
+    """Source file of a top-level workflow module, or None for the standard library and
+    installed packages (apart from SOURCE_MODULES)."""
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.has_location or not spec.origin.endswith('.py'):
+        return None
+    origin = os.path.abspath(spec.origin)
+    paths = sysconfig.get_paths()
+    libraries = tuple(os.path.abspath(paths[p]) + os.sep for p in ('stdlib', 'platstdlib', 'purelib', 'platlib'))
+    if name not in SOURCE_MODULES and origin.startswith(libraries):
+        return None
+    return origin
+
+
+def _imports(tree):
+    """Top-level names of the modules imported anywhere in an ast (relative imports excluded)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def code_hash(function, memo):
+    """SHA-1 of the code a stage runs.
+
+    Covers the source of the function and of the functions and constants of
+    its own module that it uses, plus the content hash (memoised like the
+    inputs) of every workflow module it imports, followed through the imports
+    of those modules.
+    """
+    sources, files = [], {}
+    modules, functions, seen = set(), [function], set()
+    while functions:
+        f = functions.pop()
+        if f in seen:
+            continue
+        seen.add(f)
+        source = inspect.getsource(f)
+        sources.append(source)
+        modules |= _imports(ast.parse(textwrap.dedent(source)))
+        for name in sorted(_code_names(f.__code__) & set(f.__globals__)):
+            value = f.__globals__[name]
+            if isinstance(value, types.ModuleType):
+                modules.add(value.__name__.split('.')[0])
+            elif isinstance(value, types.FunctionType) and value.__module__ == function.__module__:
+                functions.append(value)
+            elif isinstance(value, (str, int, float, tuple, list, dict)):
+                sources.append(f"{name} = {value!r}")
+            elif isinstance(getattr(value, '__module__', None), str):
+                modules.add(value.__module__.split('.')[0])
+    modules.discard(function.__module__)
+    while modules:
+        name = modules.pop()
+        path = module_file(name)
+        if name in files or path is None:
+            continue
+        files[name] = input_hash(path, memo)
+        with open(path, 'rb') as f:
+            modules |= _imports(ast.parse(f.read(), path)) - set(files)
+    payload = {'sources': sources, 'modules': files}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def stage_keys(stages, memo):
+    """Cache key of every stage, in order; a Ref must point to an earlier stage."""
+    keys, code = {}, {}
+    for s in stages:
+        if s.function not in code:
+            code[s.function] = code_hash(s.function, memo)
+        hashes = {}
+        for name, source in s.inputs.items():
+            if isinstance(source, Ref):
+                if source.stage not in keys:
+                    raise ValueError(f"Stage '{s.name}' uses '{source.stage}', which is not defined before it")
+                hashes[name] = keys[source.stage]
+            else:
+                hashes[name] = input_hash(source, memo)
+        payload = {'stage': s.name, 'function': s.function.__name__, 'version': PIPELINE_VERSION,
+                   'code': code[s.function], 'params': s.params, 'inputs': hashes, 'outputs': s.outputs}
+        keys[s.name] = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return keys
+
+
+def _run_stage(function, inputs, params, outputs, workers, stage_dir):
+    """Run one stage into <stage_dir>.tmp and move it into place when it finished.
+
+    A .tmp directory left by an interrupted run of the same key is reused, so
+    STPD_Batch.py resumes from its chunk checkpoints.
+    """
+    tmp_dir = stage_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    start = time.perf_counter()
+    function(inputs, params, {name: os.path.join(tmp_dir, out) for name, out in outputs.items()}, workers)
+    missing = [out for out in outputs.values() if not os.path.exists(os.path.join(tmp_dir, out))]
+    if missing:
+        raise RuntimeError(f"stage did not write {', '.join(missing)}")
+    seconds = time.perf_counter() - start
+    write_meta(tmp_dir, {'params': params, 'inputs': inputs, 'outputs': outputs, 'seconds': seconds})
+    os.replace(tmp_dir, stage_dir)
+    return seconds
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def publish(source, target):
+    """Expose a cached output at its output path (hard link where possible, else a copy)."""
+    if os.path.isdir(target) and not os.path.islink(target):
+        shutil.rmtree(target)
+    elif os.path.lexists(target):
+        os.remove(target)
+    if os.path.isdir(source):
+        shutil.copytree(source, target, copy_function=_link_or_copy)
+    else:
+        _link_or_copy(source, target)
+
+
+def run_pipeline(stages, output_dir, cache_dir=None, jobs=2, workers=None, force=(), dry_run=False):
+    """Run the stages whose outputs are not cached, concurrently where their inputs allow.
+
+    jobs is the number of stages run at once, and each gets workers // jobs
+    worker processes. force names stages to rerun even if cached. Returns
+    {stage name: 'cached' | 'done' | 'failed' | 'skipped'}.
+    """
+    cache_dir = cache_dir or os.path.join(output_dir, '.pipeline_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    memo = read_meta(cache_dir) or {}
+    keys = stage_keys(stages, memo)
+    write_meta(cache_dir, memo)
+
+    by_name = {s.name: s for s in stages}
+
+    def stage_dir(name):
+        return os.path.join(cache_dir, name, keys[name])
+
+    def resolve(source):
+        if isinstance(source, Ref):
+            return os.path.join(stage_dir(source.stage), by_name[source.stage].outputs[source.output])
+        return os.path.abspath(source)
+
+    status = {}
+    for s in stages:
+        cached = read_meta(stage_dir(s.name)) is not None and s.name not in force
+        status[s.name] = 'cached' if cached else 'pending'
+        print(f"{s.name:<14} {keys[s.name][:12]}  {'cached' if cached else 'run'}")
+    if dry_run:
+        return status
+
+    jobs = max(1, jobs)
+    workers = workers or os.cpu_count() or 1
+    stage_workers = max(1, workers // jobs)
+    depends = {s.name: {source.stage for source in s.inputs.values() if isinstance(source, Ref)} for s in stages}
+    start = time.perf_counter()
+
+    # Build or validate the binary caches once here: stages reading the same deformation file
+    # (stpd_desc and series_plots) would otherwise race to rebuild its cache directory
+    stack_paths = {s.name: [resolve(source) for name, source in s.inputs.items() if name in STACK_INPUTS]
+                   for s in stages if status[s.name] == 'pending'}
+    for path in sorted({path for paths in stack_paths.values() for path in paths}):
+        try:
+            load_stack(path)
+        except Exception as e:
+            print(f"{path}: cannot open the deformation stack ({type(e).__name__}: {e})")
+            for name, paths in stack_paths.items():
+                if path in paths:
+                    status[name] = 'failed'
+
+    def ready():
+        for s in stages:
+            if status[s.name] == 'pending':
+                states = [status[d] for d in depends[s.name]]
+                if any(state in ('failed', 'skipped') for state in states):
+                    status[s.name] = 'skipped'
+                    print(f"{s.name}: skipped (an input stage failed)")
+                elif all(state in ('cached', 'done') for state in states):
+                    yield s
+
+    def submit_args(s):
+        if s.name in force and os.path.exists(stage_dir(s.name)):
+            shutil.rmtree(stage_dir(s.name))
+        inputs = {name: resolve(source) for name, source in s.inputs.items()}
+        return s.function, inputs, s.params, s.outputs, stage_workers, stage_dir(s.name)
+
+    def finish(s, run):
+        try:
+            seconds = run()
+        except Exception as e:
+            status[s.name] = 'failed'
+            print(f"{s.name}: failed ({type(e).__name__}: {e})")
+        else:
+            status[s.name] = 'done'
+            print(f"{s.name}: done in {seconds:.1f} s")
+
+    if jobs == 1:
+        for s in iter(lambda: next(ready(), None), None):
+            status[s.name] = 'running'
+            args = submit_args(s)
+            finish(s, lambda: _run_stage(*args))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            running = {}
+            while True:
+                for s in list(ready()):
+                    status[s.name] = 'running'
+                    running[pool.submit(_run_stage, *submit_args(s))] = s
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(running.pop(future), future.result)
+
+    # Expose the outputs of every stage with a complete cache entry
+    os.makedirs(output_dir, exist_ok=True)
+    for s in stages:
+        if status[s.name] in ('cached', 'done'):
+            for out in s.outputs.values():
+                publish(os.path.join(stage_dir(s.name), out), os.path.join(output_dir, out))
+    counts = {state: list(status.values()).count(state) for state in ('done', 'cached', 'failed', 'skipped')}
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f} s: {counts['done']} run, {counts['cached']} cached, "
+          f"{counts['failed']} failed, {counts['skipped']} skipped. Outputs in {output_dir}")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API -> STPD -> histogram -> plot workflow with caching.")
+    parser.add_argument('--precipitation', default=precipitation_path, help="Gauge file (Pdata_*.txt)")
+    parser.add_argument('--desc', default=desc_path, help="Descending orbit deformation CSV, Parquet or stack directory")
+    parser.add_argument('--asc', default=asc_path, help="Ascending orbit deformation CSV, Parquet or stack directory")
+    parser.add_argument('--no-asc', action='store_true', help="Only process the descending orbit")
+    parser.add_argument('--output-dir', default=output_dir, help="Directory the outputs are linked into")
+    parser.add_argument('--cache-dir', default=None, help="Stage cache (default: <output-dir>/.pipeline_cache)")
+    parser.add_argument('--k', type=float, default=0.85, help="API decay factor")
+    parser.add_argument('--api-threshold', type=float, default=100, help="High API threshold of the spell table (mm)")
+    parser.add_argument('--plot-threshold', type=float, default=90, help="High API threshold of the API plot (mm)")
+    parser.add_argument('--start', default='2011-01-01', help="First precipitation date")
+    parser.add_argument('--end', default='2022-12-31', help="Last precipitation date")
+    for name, value in STPD_PARAMS.items():
+        parser.add_argument(f'--{name.lower().replace("_", "-")}', dest=name, type=type(value), default=value,
+                            help=f"STPD {name}")
+    parser.add_argument('--start-month', type=int, default=5, help="Month of the first epoch")
+    parser.add_argument('--start-year', type=int, default=2011, help="Year of the first epoch")
+    parser.add_argument('--plot-ids', nargs='+', help="Also render the time series figures of these IDs")
+    parser.add_argument('--plot-orbit', choices=['desc', 'asc'], default='desc', help="Orbit of --plot-ids")
+    parser.add_argument('--jobs', type=int, default=2, help="Stages run at once")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes shared by the stages (default: all cores)")
+    parser.add_argument('--force', nargs='+', default=[], help="Rerun these stages even if cached")
+    parser.add_argument('--dry-run', action='store_true', help="Only show which stages would run")
+    args = parser.parse_args()
+
+    orbits = {'desc': args.desc} if args.no_asc else {'desc': args.desc, 'asc': args.asc}
+    for path in [args.precipitation] + list(orbits.values()):
+        if not os.path.exists(path):
+            print(f"Error: File {path} not found.")
+            exit()
+
+    stages = build_stages(args.precipitation, orbits, k=args.k, api_threshold=args.api_threshold,
+                          plot_threshold=args.plot_threshold, start=args.start, end=args.end,
+                          stpd_params={name: getattr(args, name) for name in STPD_PARAMS},
+                          start_month=args.start_month, start_year=args.start_year,
+                          plot_ids=args.plot_ids, plot_orbit=args.plot_orbit)
+    unknown = set(args.force) - {s.name for s in stages}
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    status = run_pipeline(stages, args.output_dir, args.cache_dir, jobs=args.jobs, workers=args.workers,
+                          force=set(args.force), dry_run=args.dry_run)
+    if 'failed' in status.values():
+        exit(1)
@@ -0,0 +1,221 @@
+"""
+Headless parallel rendering of the per-ID Time_Series_API_Analysis figures.
+
+Each worker process builds the figure of RunMe_API_STPD_ID.py once with the
+non-interactive Agg backend: API bars, threshold line, axes, labels, legend
+and date ticks. For every ID it only updates the per-ID artists (series and
+trend lines, turning-point markers and annotations, title) before saving.
+The API/deformation date join is computed once in the parent process. IDs
+on which STPD/TPTR raised are counted and returned with their error, and
+the first traceback is printed, as in STPD_Batch.py.
+
+Usage:
+    python Plot_Render.py DESC_CLIP.csv --api Output_API_mean.csv --output-dir PLOT --workers 8
+    python Plot_Render.py DESC_CLIP.csv --ids 1021 1022 --output-dir PLOT
+"""
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+from matplotlib import pyplot as plt
+import numpy as np
+from RunMe_API_STPD_ID import STPD_PARAMS, generate_dates, read_api_data, filter_api_dates
+from Deformation_Stack import load_stack
+from STPD_Batch import run_stpd
+from Spatial_Index import add_area_arguments, area_options, stack_spatial_index, select_rows
+from Instrumentation import stage
+
+# Default file paths (same as RunMe_API_STPD_ID.py)
+csvpath = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/DESC_CLIP.csv"
+apipath = "D:/PhD_Main/STPD/STPD/Output_API_mean.csv"
+plot_dir = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/FINAL/DESCENDING/PLOT"
+
+
+class FigureRenderer:
+    """One reusable twin-axis figure; render() redraws only the per-ID artists."""
+
+    def __init__(self, deformation_dates, api_dates, api_values, api_threshold=80, dpi=300):
+        self.dates = list(deformation_dates)
+        self.dpi = dpi
+        self.annotations = []
+
+        fig, ax1 = plt.subplots()
+        fig.set_size_inches(12, 6)
+        placeholder = np.zeros(len(self.dates))
+
+        # Primary y-axis: Deformation Time Series
+        self.series_line, = ax1.plot(self.dates, placeholder, '-ok', label='Time Series', linewidth=1, markersize=3)
+        self.trend_line, = ax1.plot(self.dates, placeholder, 'b-', label='Linear Trend', linewidth=1)
+        self.tp_markers, = ax1.plot(self.dates[:1], placeholder[:1], 'ob', label='Turning Points')
+        ax1.set_xlabel('Time')
+        ax1.set_ylabel('Displacement (mm)', color='k')
+        ax1.tick_params(axis='y', labelcolor='k')
+
+        # Secondary y-axis: Filtered API Data (static)
+        ax2 = ax1.twinx()
+        ax2.bar(api_dates, api_values, color='r', alpha=0.5, label='Filtered API Data', width=20)
+        ax2.axhline(y=api_threshold, color='red', linestyle='--', linewidth=1.5,
+                    label=f'API Threshold ({api_threshold} mm)')
+        ax2.set_ylabel('API Value (mm)', color='r')
+        ax2.tick_params(axis='y', labelcolor='r')
+
+        self.title = fig.suptitle('')
+        fig.legend(loc='upper left')
+        fig.autofmt_xdate()
+        ax2.grid(True)
+
+        # Yearly ticks labelled 2011, 2012, ...
+        ax1.xaxis.set_major_locator(mdates.YearLocator())
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+
+        self.fig, self.ax1 = fig, ax1
+
+    def render(self, id_, f, TPs, stats, y, save_path):
+        """Update the per-ID artists and save the figure."""
+        tps = [int(tp) for tp in TPs]
+        self.series_line.set_ydata(f)
+        self.trend_line.set_ydata(y)
+        self.tp_markers.set_data([self.dates[tp] for tp in tps], [f[tp] for tp in tps])
+
+        # Annotate turning points with improved formatting and arrows
+        for annotation in self.annotations:
+            annotation.remove()
+        self.annotations = []
+        for idx, tp in enumerate(tps):
+            annotation_text = f"$DIR$ = {np.round(stats[idx][2], 2)}\n$|NDRI|$ = {np.round(stats[idx][4], 2)}"
+            self.annotations.append(self.ax1.annotate(
+                annotation_text,
+                xy=(self.dates[tp], f[tp]),  # Turning point location
+                xytext=(self.dates[tp], f[tp] + 2),  # Offset for better visibility
+                fontsize=10,
+                ha="center",
+                bbox=dict(facecolor='yellow', edgecolor='black', boxstyle="round,pad=0.3", alpha=0.7),
+                arrowprops=dict(arrowstyle="->", color="black", lw=1)))
+
+        self.title.set_text(f'Time Series and API Analysis for ID: {id_}')
+        self.ax1.relim()
+        self.ax1.autoscale_view()
+        with stage('savefig'):
+            self.fig.savefig(save_path, dpi=self.dpi, bbox_inches='tight')
+
+
+# Per-process state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(stack_path, deformation_dates, api_dates, api_values, output_dir, dpi, params):
+    """Open the stack and build the static figure once per worker process."""
+    _worker.update(stack=load_stack(stack_path), output_dir=output_dir, params=params,
+                   renderer=FigureRenderer(deformation_dates, api_dates, api_values, dpi=dpi))
+
+
+def _render_rows(rows):
+    """Render the figures of a chunk of rows.
+
+    Returns (rows done, figures saved, failed, trace): failed lists (ID, error)
+    of the series STPD/TPTR raised on, trace is the traceback of the first of them.
+    """
+    stack, renderer = _worker['stack'], _worker['renderer']
+    saved, failed, trace = 0, [], None
+    for row in rows:
+        id_ = str(stack.ids[row])
+        f = np.asarray(stack.values[row], dtype=float)
+        try:
+            result = run_stpd(stack.times, f, _worker['params'])
+        except Exception as e:
+            failed.append((id_, f"{type(e).__name__}: {e}"))
+            trace = trace or traceback.format_exc()
+            continue
+        if result is None:
+            continue  # Figures are only made for series with turning points
+        save_path = os.path.join(_worker['output_dir'], f"Time_Series_API_Analysis_{id_}.png")
+        renderer.render(id_, f, *result, save_path)
+        saved += 1
+    return len(rows), saved, failed, trace
+
+
+def render_all(stack_path, rows, deformation_dates, api_dates, api_values, output_dir,
+               workers=None, chunk_size=50, dpi=300, params=STPD_PARAMS):
+    """Render the figures of the given stack rows across a pool of worker processes.
+
+    Returns (number of figures saved, [(ID, error)] of the IDs STPD/TPTR failed on).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+    initargs = (stack_path, deformation_dates, api_dates, api_values, output_dir, dpi, params)
+
+    done, saved, failed = 0, 0, []
+    start = time.perf_counter()
+
+    def report(result):
+        nonlocal done, saved
+        chunk_done, chunk_saved, chunk_failed, trace = result
+        if chunk_failed and not failed:
+            print(f"STPD/TPTR failed on ID {chunk_failed[0][0]} (further failures are only counted):\n{trace}")
+        done += chunk_done
+        saved += chunk_saved
+        failed.extend(chunk_failed)
+        elapsed = time.perf_counter() - start
+        print(f"{done}/{len(rows)} IDs, {saved} figures, {len(failed)} failed, {saved / elapsed:.2f} figures/s")
+
+    with stage('render') as s:
+        if workers == 1:
+            _init_worker(*initargs)
+            for chunk in chunks:
+                report(_render_rows(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+                for future in as_completed([pool.submit(_render_rows, chunk) for chunk in chunks]):
+                    report(future.result())
+        s.count(points=done)
+
+    elapsed = time.perf_counter() - start
+    print(f"Saved {saved} figures to {output_dir} in {elapsed:.1f} s ({saved / max(elapsed, 1e-9):.2f} figures/s), "
+          f"{len(failed)} IDs failed")
+    return saved, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render Time_Series_API_Analysis figures for many IDs.")
+    parser.add_argument('csvpath', nargs='?', default=csvpath, help="Deformation CSV, Parquet or stack directory")
+    parser.add_argument('--api', default=apipath, help="Monthly API CSV")
+    parser.add_argument('--output-dir', default=plot_dir, help="Directory for the PNG files")
+    parser.add_argument('--ids', nargs='+', help="Only render these IDs (default: all)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=50, help="IDs per task")
+    parser.add_argument('--dpi', type=int, default=300, help="Figure resolution")
+    parser.add_argument('--start-month', type=int, default=5, help="Month of the first epoch")
+    parser.add_argument('--start-year', type=int, default=2011, help="Year of the first epoch")
+    add_area_arguments(parser)
+    args = parser.parse_args()
+
+    for path in (args.csvpath, args.api):
+        if not os.path.exists(path):
+            print(f"Error: File {path} not found.")
+            exit()
+
+    # Build the binary cache (and spatial index) once in the parent so workers only open it
+    stack, spatial_index = stack_spatial_index(args.csvpath)
+    if args.ids:
+        wanted = set(args.ids)
+        rows = [i for i, id_ in enumerate(stack.ids) if id_ in wanted]
+    else:
+        rows = list(range(len(stack.ids)))
+
+    # Restrict to an area of interest
+    area_rows = select_rows(spatial_index, **area_options(args, parser))
+    if area_rows is not None:
+        rows = [int(i) for i in np.asarray(rows)[np.isin(rows, area_rows)]]
+
+    deformation_dates = generate_dates(start_month=args.start_month, start_year=args.start_year,
+                                       num_months=len(stack.times))
+    api_dates, api_values = read_api_data(args.api)
+    api_dates, api_values = filter_api_dates(api_dates, api_values, deformation_dates)
+
+    render_all(args.csvpath, rows, deformation_dates, api_dates, api_values, args.output_dir,
+               workers=args.workers, chunk_size=args.chunk_size, dpi=args.dpi)
@@ -5,6 +5,13 @@ import os
 from datetime import datetime, timedelta
 from STPD import STPD
 from TPTR import TPTR
+from Date_Alignment import match_within
+from ID_Index import open_row_index, find_row
+from Date_Parser import parse_date, parse_dates
+from Instrumentation import stage
+
+# STPD parameters used for every series
+STPD_PARAMS = dict(size=60, step=12, SNR=1, NDRI=0.3, dir_th=0, tp_th=1, margin=12, alpha=0.01)
 
 def generate_dates(start_month, start_year, num_months):
     """Generate a list of dates in datetime format starting from given month/year for num_months."""
@@ -12,25 +19,50 @@ def generate_dates(start_month, start_year, num_months):
 
 def convert_to_datetime(date_str, format="%m/%d/%Y"):
     """Convert a date string to a datetime object safely."""
-    try:
-        return datetime.strptime(date_str, format)
-    except ValueError:
+    date = parse_date(date_str, format)  # Cached, so repeated strings are parsed once
+    if date is None:
         print(f"Error: Invalid date format for {date_str}. Expected {format}.")
-        return None  # Handle invalid dates gracefully
+    return date  # None for invalid dates
+
+def read_time_series(csvpath):
+    """Read an 'ID,lat,lon,t1..tN' deformation CSV into (ids, latitudes, longitudes, times, series_values)."""
+    ids, latitudes, longitudes, series_values = [], [], [], []
+    with open(csvpath, 'r') as csvfile:
+        reader = csv.reader(csvfile, skipinitialspace=True)
+        headers = next(reader)
+        time_headers = headers[3:]
+        times = [float(time) for time in time_headers]  # Ensure float conversion
+        for row in reader:
+            ids.append(row[0])
+            latitudes.append(float(row[1]))
+            longitudes.append(float(row[2]))
+            series_values.append([float(val) if val else np.nan for val in row[3:]])
+    return ids, latitudes, longitudes, times, np.array(series_values)
+
+def read_api_data(apipath, format="%m/%d/%Y"):
+    """Read the monthly API CSV (Date, API) into lists of dates and values, skipping invalid dates."""
+    api_dates, api_values = [], []
+    with open(apipath, 'r') as api_file:
+        api_reader = csv.reader(api_file, skipinitialspace=True)
+        next(api_reader)  # Skip header
+        rows = list(api_reader)
+
+    # Parse the whole date column at once
+    dates = parse_dates([row[0] for row in rows], formats=[format])
+    for row, date, valid in zip(rows, dates.to_pydatetime(), dates.notna()):
+        if not valid:
+            print(f"Error: Invalid date format for {row[0]}. Expected {format}.")
+            continue  # Skip invalid dates
+        api_dates.append(date)
+        api_values.append(float(row[1]))
+    return api_dates, api_values
 
 def filter_api_dates(api_dates, api_values, deformation_dates, threshold_days=30):
     """Filter API dates to keep only those that are close to deformation dates."""
-    filtered_api_dates = []
-    filtered_api_values = []
-    
-    for api_date, api_value in zip(api_dates, api_values):
-        # Find the closest deformation date
-        closest_deformation_date = min(deformation_dates, key=lambda d: abs(d - api_date))
-        
-        # Check if the API date is within the threshold range
-        if abs((closest_deformation_date - api_date).days) <= threshold_days:
-            filtered_api_dates.append(api_date)
-            filtered_api_values.append(api_value)
+    # Nearest deformation date of every API date by sorted search
+    keep, _ = match_within(api_dates, deformation_dates, threshold_days)
+    filtered_api_dates = [api_dates[i] for i in keep]
+    filtered_api_values = [api_values[i] for i in keep]
 
     return filtered_api_dates, filtered_api_values
 
@@ -51,62 +83,56 @@ if __name__ == "__main__":
     specific_id = input("Enter the ID you want to plot: ").strip()
     
     # Read time series data
-    ids, latitudes, longitudes, times, series_values = [], [], [], [], []
     try:
-        with open(csvpath, 'r') as csvfile:
-            reader = csv.reader(csvfile, skipinitialspace=True)
-            headers = next(reader)
-            time_headers = headers[3:]
-            times = [float(time) for time in time_headers]  # Ensure float conversion
-            for row in reader:
-                ids.append(row[0])
-                latitudes.append(float(row[1]))
-                longitudes.append(float(row[2]))
-                series_values.append([float(val) if val else np.nan for val in row[3:]])
+        # Binary cache of the CSV and its ID index, rebuilt only when the file changes
+        with stage('load_stack') as s:
+            stack, id_index = open_row_index(csvpath)
+            ids, latitudes, longitudes, times, series_values = stack
+            s.count(points=len(ids))
     except Exception as e:
         print(f"Error reading {csvpath}: {e}")
         exit()
 
     # Read API data
-    api_dates, api_values = [], []
     try:
-        with open(apipath, 'r') as api_file:
-            api_reader = csv.reader(api_file, skipinitialspace=True)
-            next(api_reader)  # Skip header
-            for row in api_reader:
-                date = convert_to_datetime(row[0], "%m/%d/%Y")
-                if date:
-                    api_dates.append(date)
-                    api_values.append(float(row[1]))
+        with stage('read_api') as s:
+            api_dates, api_values = read_api_data(apipath)
+            s.count(rows=len(api_dates))
     except Exception as e:
         print(f"Error reading {apipath}: {e}")
         exit()
 
-    # Convert lists to numpy arrays
-    series_values = np.array(series_values)
-    deformation_dates = generate_dates(start_month=5, start_year=2011, num_months=len(times))
+    with stage('dates') as s:
+        deformation_dates = generate_dates(start_month=5, start_year=2011, num_months=len(times))
 
-    # **Filter API dates that are not close to deformation dates**
-    api_dates, api_values = filter_api_dates(api_dates, api_values, deformation_dates)
+        # **Filter API dates that are not close to deformation dates**
+        api_dates, api_values = filter_api_dates(api_dates, api_values, deformation_dates)
+        s.count(rows=len(api_dates))
 
     # Print deformation time series dates
     print("Deformation Time Series Dates:")
     for date in deformation_dates:
         print(date.strftime("%Y-%m-%d"))
 
+    # Look up the row of the specified ID directly through the ID index
+    row = find_row(stack, id_index, specific_id)
+    matching_rows = [] if row is None else [row]
+
     # Process the specified ID
     id_found = False
-    for i, (id_, lat, lon, f) in enumerate(zip(ids, latitudes, longitudes, series_values)):
-        if id_ != specific_id:
-            continue  # Skip IDs that do not match the specific ID
-        
+    for i in matching_rows:
+        id_, lat, lon, f = ids[i], latitudes[i], longitudes[i], series_values[i]
+
         id_found = True
-        f = np.array(f)
+        f = np.asarray(f, dtype=float)
 
         # Apply STPD to detect turning points in deformation time series
-        TPs = STPD(times, f, size=60, step=12, SNR=1, NDRI=0.3, dir_th=0, tp_th=1, margin=12, alpha=0.01)
+        with stage('stpd') as s:
+            TPs = STPD(times, f, **STPD_PARAMS)
+            s.count(points=1)
         if len(TPs) > 0:
-            stats, y = TPTR(times, f, TPs)  # Obtain the overall trend `y`
+            with stage('tptr'):
+                stats, y = TPTR(times, f, TPs)  # Obtain the overall trend `y`
 
             # Plot the time series with API data
             fig, ax1 = plt.subplots()
@@ -162,7 +188,8 @@ if __name__ == "__main__":
             save_path = f"D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/FINAL/DESCENDING/PLOT/Time_Series_API_Analysis_{id_}.png"
 
             # Save the figure in high resolution
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            with stage('savefig'):
+                plt.savefig(save_path, dpi=300, bbox_inches='tight')
             print(f"Plot saved successfully at: {save_path}")
             plt.show()
             break  # Stop after processing the specific ID
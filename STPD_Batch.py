@@ -0,0 +1,362 @@
+"""
+Batch STPD/TPTR over every point ID of a deformation CSV.
+
+Runs STPD and TPTR on every ID (or a given ID list) across a process pool in
+chunks and writes one consolidated turning-point table in the
+*_filtered_turning_points.csv layout read by TP_Histogram.py and
+DIR_Histogram.py. Every finished chunk is checkpointed to disk, so an
+interrupted run resumes where it stopped when started again. IDs on which
+STPD/TPTR raised are listed with the error in <output>_failed_ids.csv, and
+the first traceback is printed.
+
+Usage:
+    python STPD_Batch.py DESC_CLIP.csv --output DESC_filtered_turning_points.csv --workers 8
+    python STPD_Batch.py DESC_CLIP.csv --ids 1021 1022 --output Subset_turning_points.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from STPD import STPD
+from TPTR import TPTR
+from RunMe_API_STPD_ID import STPD_PARAMS, generate_dates, read_time_series
+from Deformation_Stack import load_stack, cache_dir_for, read_meta, source_info, source_unchanged
+from Table_IO import is_parquet
+from Trend_Engine import fit_windows, turning_point_candidates
+from Spatial_Index import add_area_arguments, area_options, stack_spatial_index, select_rows
+from Instrumentation import stage
+
+# Columns of the consolidated turning-point table
+TP_COLUMNS = ['ID', 'Latitude', 'Longitude', 'Date (mm/yyyy)', 'Direction', 'NDRI', 'Slope']
+
+# Columns of the failed-ID table
+FAILED_COLUMNS = ['ID', 'Error']
+
+# Default file paths
+csvpath = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/DESC_CLIP.csv"
+output_path = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/DESC_ALL_CLIP/DESC_filtered_turning_points.csv"
+
+
+def run_stpd(times, f, params=STPD_PARAMS):
+    """Run STPD and, if it finds turning points, TPTR on one series.
+
+    Returns (TPs, stats, y) or None when there are no turning points.
+    """
+    with stage('stpd') as s:
+        TPs = STPD(times, f, **params)
+        s.count(points=1)
+    if len(TPs) == 0:
+        return None
+    with stage('tptr'):
+        stats, y = TPTR(times, f, TPs)
+    return TPs, stats, y
+
+
+def turning_point_rows(id_, lat, lon, times, f, deformation_dates, params=STPD_PARAMS):
+    """Run STPD/TPTR on one series and return one table row per turning point."""
+    result = run_stpd(times, np.asarray(f, dtype=float), params)
+    if result is None:
+        return []
+    TPs, stats, y = result
+
+    tps = [int(tp) for tp in TPs]
+    ends = tps[1:] + [len(times) - 1]
+    rows = []
+    for idx, (tp, end) in enumerate(zip(tps, ends)):
+        # Slope (mm/year) of the fitted trend on the segment starting at this turning point
+        slope = (y[end] - y[tp]) / (times[end] - times[tp]) if end > tp else np.nan
+        rows.append((id_, lat, lon, deformation_dates[tp].strftime('%b-%y'),
+                     stats[idx][2], stats[idx][4], slope))
+    return rows
+
+
+# Shared by every task of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(times, deformation_dates, params):
+    """Store the arrays common to all chunks in the worker process."""
+    _worker.update(times=times, deformation_dates=deformation_dates, params=params)
+
+
+def _run_chunk(chunk_index, ids, latitudes, longitudes, values):
+    """Process one chunk of series.
+
+    Returns (chunk_index, rows, failed, trace): failed lists (ID, error) of the
+    series STPD/TPTR raised on, trace is the traceback of the first of them.
+    """
+    rows, failed, trace = [], [], None
+    for id_, lat, lon, f in zip(ids, latitudes, longitudes, values):
+        try:
+            rows.extend(turning_point_rows(id_, lat, lon, _worker['times'], f,
+                                           _worker['deformation_dates'], _worker['params']))
+        except Exception as e:
+            failed.append((id_, f"{type(e).__name__}: {e}"))
+            trace = trace or traceback.format_exc()
+    return chunk_index, rows, failed, trace
+
+
+def _part_path(parts_dir, chunk_index):
+    return os.path.join(parts_dir, f"chunk_{chunk_index:06d}.csv")
+
+
+def _failed_path(parts_dir, chunk_index):
+    return os.path.join(parts_dir, f"chunk_{chunk_index:06d}_failed.csv")
+
+
+def failed_ids_path(output_path):
+    """Path of the failed-ID table written next to a turning-point table."""
+    return os.path.splitext(output_path)[0] + '_failed_ids.csv'
+
+
+def _write_part(parts_dir, chunk_index, rows, failed=()):
+    """Write a finished chunk atomically so a crash never leaves a partial checkpoint.
+
+    The failed IDs of the chunk are written first, as the part file marks the chunk done.
+    """
+    if failed:
+        path = _failed_path(parts_dir, chunk_index)
+        pd.DataFrame(failed, columns=FAILED_COLUMNS).to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    path = _part_path(parts_dir, chunk_index)
+    pd.DataFrame(rows, columns=TP_COLUMNS).to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def source_state(source):
+    """Contents of a deformation source as the manifest records them.
+
+    The SHA-1 of its binary cache (a stack directory, or a CSV/Parquet file
+    whose cache is up to date), else the size and mtime of the file.
+    """
+    if not source or not os.path.exists(source):
+        return None
+    if os.path.isdir(source):
+        meta = read_meta(source)
+        if meta is not None and 'sha1' in meta:
+            return {'sha1': meta['sha1']}
+    else:
+        meta = read_meta(cache_dir_for(source))
+        if meta is not None and 'sha1' in meta and source_unchanged(source, cache_dir_for(source), meta):
+            return {'sha1': meta['sha1']}
+    info = source_info(source)
+    return {'size': info['size'], 'mtime_ns': info['mtime_ns']}
+
+
+def _prepare_parts_dir(parts_dir, manifest):
+    """Create the checkpoint directory, discarding it if it belongs to a different run."""
+    manifest_path = os.path.join(parts_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            if json.load(f) == manifest:
+                return
+        print(f"Checkpoints in {parts_dir} are from a different run; starting over.")
+        shutil.rmtree(parts_dir)
+    os.makedirs(parts_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def consolidate(parts_dir, n_chunks, output_path):
+    """Concatenate the chunk files in order into one turning-point table (CSV or Parquet)."""
+    if is_parquet(output_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([('ID', pa.string()), ('Latitude', pa.float64()), ('Longitude', pa.float64()),
+                            ('Date (mm/yyyy)', pa.string()), ('Direction', pa.float64()),
+                            ('NDRI', pa.float64()), ('Slope', pa.float64())])
+        with pq.ParquetWriter(output_path, schema) as writer:
+            for chunk_index in range(n_chunks):
+                part = pd.read_csv(_part_path(parts_dir, chunk_index), dtype={'ID': str, 'Date (mm/yyyy)': str})
+                writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+        return
+
+    with open(output_path, 'w', newline='') as out:
+        out.write(','.join(TP_COLUMNS) + '\n')
+        for chunk_index in range(n_chunks):
+            with open(_part_path(parts_dir, chunk_index), 'r', newline='') as part:
+                next(part)  # Skip header
+                shutil.copyfileobj(part, out)
+
+
+def consolidate_failed(parts_dir, n_chunks, failed_path):
+    """Concatenate the failed IDs of all chunks into one table; return their number.
+
+    Without failures no table is written (and one left by an earlier run is removed).
+    """
+    parts = [pd.read_csv(_failed_path(parts_dir, c), dtype=str, keep_default_na=False)
+             for c in range(n_chunks) if os.path.exists(_failed_path(parts_dir, c))]
+    if not parts:
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        return 0
+    failed = pd.concat(parts, ignore_index=True)
+    failed.to_csv(failed_path, index=False)
+    return len(failed)
+
+
+def run_batch(ids, latitudes, longitudes, times, series_values, deformation_dates, output_path,
+              params=STPD_PARAMS, workers=None, chunk_size=1000, keep_parts=False, source=''):
+    """Run STPD/TPTR on all given series and write the consolidated turning-point table.
+
+    Chunk checkpoints are kept for a rerun with the same IDs, parameters and
+    source contents (source is the path of the deformation data, see source_state).
+    """
+    workers = workers or os.cpu_count() or 1
+    n_ids = len(ids)
+    n_chunks = (n_ids + chunk_size - 1) // chunk_size
+    parts_dir = output_path + '.parts'
+
+    manifest = {
+        'source': source,
+        'source_state': source_state(source),
+        'n_ids': n_ids,
+        'ids_sha1': hashlib.sha1('\n'.join(ids).encode()).hexdigest(),
+        'chunk_size': chunk_size,
+        'params': params,
+    }
+    _prepare_parts_dir(parts_dir, manifest)
+
+    pending = [c for c in range(n_chunks) if not os.path.exists(_part_path(parts_dir, c))]
+    if len(pending) < n_chunks:
+        print(f"Resuming: {n_chunks - len(pending)} of {n_chunks} chunks already done.")
+
+    def chunk_args(c):
+        sl = slice(c * chunk_size, min((c + 1) * chunk_size, n_ids))
+        return c, ids[sl], latitudes[sl], longitudes[sl], series_values[sl]
+
+    def chunk_len(c):
+        return min((c + 1) * chunk_size, n_ids) - c * chunk_size
+
+    total_points = sum(chunk_len(c) for c in pending)
+    done_points, done_chunks, tp_total = 0, 0, 0
+    first_failure = None
+    start = time.perf_counter()
+
+    def report(chunk_index, rows, failed, trace):
+        nonlocal done_points, done_chunks, tp_total, first_failure
+        with stage('write_part') as s:
+            _write_part(parts_dir, chunk_index, rows, failed)
+            s.count(rows=len(rows))
+        if failed and first_failure is None:
+            first_failure = failed[0][0]
+            print(f"STPD/TPTR failed on ID {first_failure} (further failures are only counted):\n{trace}")
+        done_chunks += 1
+        done_points += chunk_len(chunk_index)
+        tp_total += len(rows)
+        elapsed = time.perf_counter() - start
+        rate = done_points / elapsed if elapsed > 0 else 0.0
+        eta = (total_points - done_points) / rate if rate > 0 else 0.0
+        print(f"[{done_chunks}/{len(pending)} chunks] {done_points}/{total_points} IDs, "
+              f"{rate:.1f} IDs/s, ETA {eta / 60:.1f} min")
+
+    with stage('run_chunks') as batch:
+        if workers == 1:
+            _init_worker(times, deformation_dates, params)
+            for c in pending:
+                report(*_run_chunk(*chunk_args(c)))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(times, deformation_dates, params)) as pool:
+                queue = iter(pending)
+                running = set()
+                for c in queue:
+                    running.add(pool.submit(_run_chunk, *chunk_args(c)))
+                    if len(running) >= 2 * workers:
+                        finished, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            report(*future.result())
+                for future in wait(running).done:
+                    report(*future.result())
+        batch.count(points=total_points)
+
+    with stage('consolidate'):
+        consolidate(parts_dir, n_chunks, output_path)
+        failed_total = consolidate_failed(parts_dir, n_chunks, failed_ids_path(output_path))
+    if not keep_parts:
+        shutil.rmtree(parts_dir)
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {done_points} IDs in {elapsed:.1f} s "
+          f"({done_points / elapsed if elapsed > 0 else 0.0:.1f} IDs/s), "
+          f"{tp_total} turning points, {failed_total} IDs failed.")
+    print(f"Turning points saved to {output_path}")
+    if failed_total:
+        print(f"Failed IDs and their errors saved to {failed_ids_path(output_path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run STPD/TPTR on every point ID of a deformation CSV.")
+    parser.add_argument('csvpath', nargs='?', default=csvpath, help="Deformation CSV (ID,lat,lon,t1..tN)")
+    parser.add_argument('--output', default=output_path, help="Consolidated turning-point table (.csv or .parquet)")
+    parser.add_argument('--ids', nargs='+', help="Only process these IDs")
+    parser.add_argument('--ids-file', help="Only process the IDs listed in this file (one per line)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="IDs per chunk/checkpoint")
+    parser.add_argument('--start-month', type=int, default=5, help="Month of the first epoch")
+    parser.add_argument('--start-year', type=int, default=2011, help="Year of the first epoch")
+    parser.add_argument('--no-cache', action='store_true', help="Parse the CSV instead of using its binary cache")
+    parser.add_argument('--prescreen', action='store_true',
+                        help="Only run STPD on points with significant window-trend slope changes (Trend_Engine.py)")
+    parser.add_argument('--keep-parts', action='store_true', help="Keep chunk checkpoints after finishing")
+    add_area_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csvpath):
+        print(f"Error: File {args.csvpath} not found.")
+        exit()
+
+    with stage('load_stack') as s:
+        if args.no_cache:
+            ids, latitudes, longitudes, times, series_values = read_time_series(args.csvpath)
+        else:
+            ids, latitudes, longitudes, times, series_values = load_stack(args.csvpath)
+        s.count(points=len(ids))
+    print(f"Loaded {len(ids)} IDs with {len(times)} epochs from {args.csvpath}")
+
+    # Restrict to the requested IDs, keeping their order in the dataset
+    rows = np.arange(len(ids))
+    wanted = set(args.ids or [])
+    if args.ids_file:
+        with open(args.ids_file, 'r') as f:
+            wanted.update(line.strip() for line in f if line.strip())
+    if wanted:
+        rows = np.array([i for i, id_ in enumerate(ids) if id_ in wanted], dtype=int)
+        missing = wanted.difference(ids[i] for i in rows)
+        if missing:
+            print(f"Warning: {len(missing)} requested IDs not found in the dataset.")
+
+    # Restrict to an area of interest through the spatial index of the stack (same row order as the CSV)
+    area = area_options(args, parser)
+    if any(value is not None for value in area.values()):
+        area_rows = select_rows(stack_spatial_index(args.csvpath)[1], **area)
+        if area_rows is not None:
+            rows = rows[np.isin(rows, area_rows)]
+            print(f"Area of interest: {len(rows)} points selected.")
+
+    if args.prescreen:
+        # Skip points whose window trends show no significant slope change at the STPD alpha
+        _, trends = fit_windows(times, series_values[rows], STPD_PARAMS['size'], STPD_PARAMS['step'])
+        candidates = turning_point_candidates(trends, STPD_PARAMS['dir_th'], norm.isf(STPD_PARAMS['alpha'] / 2))
+        print(f"Prescreen: {int(candidates.sum())} of {len(rows)} points have significant slope changes.")
+        rows = rows[candidates]
+
+    if len(rows) < len(ids):
+        ids = [ids[i] for i in rows]
+        latitudes = [latitudes[i] for i in rows]
+        longitudes = [longitudes[i] for i in rows]
+        series_values = series_values[rows]
+
+    deformation_dates = generate_dates(start_month=args.start_month, start_year=args.start_year,
+                                       num_months=len(times))
+    run_batch(ids, latitudes, longitudes, times, series_values, deformation_dates, args.output,
+              workers=args.workers, chunk_size=args.chunk_size, keep_parts=args.keep_parts,
+              source=os.path.abspath(args.csvpath))
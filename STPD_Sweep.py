@@ -0,0 +1,299 @@
+"""
+STPD parameter sweep over a grid of parameter combinations.
+
+The STPD parameters of RunMe_API_STPD_ID.py (size, step, SNR, NDRI, dir_th,
+tp_th, margin, alpha) are given as lists, and every combination of them is
+run on the same points: all IDs of a deformation CSV, a random sample, given
+IDs or an area of interest. The deformation matrix of those points is read
+once (through the binary cache of Deformation_Stack.py) and copied into one
+shared memory block, which the worker processes attach to by name, so no
+series is pickled. Tasks are (combination, block of points) pairs spread
+over a process pool.
+
+The results table has one row per combination: its parameters, the number
+of points, points with turning points, turning points, failed series, the
+direction distribution of the turning points (DIR_Histogram.py bins, split
+by slope sign), the error of one failed series and the summed runtime of its
+tasks. Each finished combination without failed series is cached under a
+hash of the data, the selected points and its parameters, so a rerun (or a
+wider grid) only computes new combinations.
+
+Usage:
+    python STPD_Sweep.py DESC_CLIP.csv --size 48 60 72 --ndri 0.2 0.3 0.4 --alpha 0.01 0.05 --sample 2000 --workers 8
+    python STPD_Sweep.py DESC_CLIP.csv --tp-th 0.5 1 2 --bbox 41.95 42.00 14.95 15.02 --output Sweep_area.csv
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from Deformation_Stack import cache_dir_for, read_meta
+from RunMe_API_STPD_ID import STPD_PARAMS, generate_dates
+from STPD_Batch import turning_point_rows
+from Spatial_Index import add_area_arguments, area_options, stack_spatial_index, select_rows
+from TP_Aggregator import direction_bins, DIRECTION_LABELS, NEGATIVE, POSITIVE, NO_SLOPE
+
+# Bump to invalidate cached combinations after changing how they are evaluated
+SWEEP_VERSION = 2
+
+COUNT_COLUMNS = ['Points', 'Points_with_TP', 'TPs', 'Failed']
+
+# STPD parameters taking whole numbers (epochs); the others are read as floats
+INT_PARAMS = ('size', 'step', 'margin')
+
+# Default file path
+csvpath = "D:/PhD_Main/STPD/STPD/LSWAVE-SignalProcessing/STPD_PythonPackage_EGhaderpour/DESC_CLIP.csv"
+
+
+def parameter_grid(grid):
+    """All combinations of a {name: list of values} grid, as STPD keyword dicts (last name varies fastest)."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def combination_key(source_sha1, ids_sha1, params):
+    """Cache key of one combination on one set of points."""
+    payload = {'version': SWEEP_VERSION, 'source': source_sha1, 'ids': ids_sha1, 'params': params}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def read_cached(sweep_dir, key):
+    path = os.path.join(sweep_dir, key + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_cached(sweep_dir, key, result):
+    """Write one combination result atomically."""
+    path = os.path.join(sweep_dir, key + '.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(result, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def cache_result(sweep_dir, key, result):
+    """Cache a combination result unless some of its series failed (they are retried on the next run)."""
+    if result['Failed']:
+        print(f"  not cached: {result['Failed']} series failed, e.g. {result['error']}")
+        return
+    write_cached(sweep_dir, key, result)
+
+
+def evaluate(times, values, deformation_dates, params):
+    """Turning-point counts of a block of series under one parameter set.
+
+    Returns (counts of COUNT_COLUMNS, (slope sign x direction bin) counts,
+    error of the first failed series or None).
+    """
+    n_bins = len(DIRECTION_LABELS)
+    points_with_tp, n_tps, failed = 0, 0, 0
+    error = None
+    directions, slopes = [], []
+    for f in values:
+        try:
+            rows = turning_point_rows(None, 0.0, 0.0, times, f, deformation_dates, params)
+        except Exception as e:
+            failed += 1
+            error = error or f"{type(e).__name__}: {e}"
+            continue
+        points_with_tp += bool(rows)
+        n_tps += len(rows)
+        directions.extend(row[4] for row in rows)
+        slopes.extend(row[6] for row in rows)
+
+    bins = direction_bins(directions)
+    slope = np.asarray(slopes, dtype=float)
+    sign = np.where(np.isnan(slope), NO_SLOPE, np.where(slope >= 0, POSITIVE, NEGATIVE))
+    in_bin = bins >= 0
+    direction = np.bincount(sign[in_bin] * n_bins + bins[in_bin], minlength=3 * n_bins).reshape(3, n_bins)
+    return [len(values), points_with_tp, n_tps, failed], direction, error
+
+
+# Per-process state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(shm_name, shape, times, deformation_dates):
+    """Attach to the shared deformation matrix (no copy) in the worker process."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(shm=shm, values=np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+                   times=times, deformation_dates=deformation_dates)
+
+
+def _run_task(combination, params, start, stop):
+    """Evaluate one combination on rows start:stop; return (combination, counts, direction, error, seconds)."""
+    begin = time.perf_counter()
+    counts, direction, error = evaluate(_worker['times'], _worker['values'][start:stop], _worker['deformation_dates'],
+                                        params)
+    return combination, counts, direction, error, time.perf_counter() - begin
+
+
+def run_sweep(times, values, combinations, deformation_dates, rows=None, workers=None, block_size=200,
+              cached=None, on_result=None):
+    """Evaluate every combination on the given rows of values (default: all).
+
+    values may be the memory-mapped matrix of a stack: only the selected rows
+    are read, block by block, into the shared copy. cached maps combination
+    indices to results computed before, which are returned as they are.
+    on_result(index, result) is called as soon as a combination is complete
+    (e.g. to cache it). Returns one result dict per combination; its 'error'
+    is the error of one failed series (None if none failed).
+    """
+    cached = cached or {}
+    rows = np.arange(len(values)) if rows is None else np.asarray(rows)
+    n_points = len(rows)
+    blocks = [(start, min(start + block_size, n_points)) for start in range(0, n_points, block_size)]
+    todo = [c for c in range(len(combinations)) if c not in cached]
+    tasks = ((c, combinations[c], start, stop) for c in todo for start, stop in blocks)
+
+    totals = {c: {'counts': np.zeros(len(COUNT_COLUMNS), dtype=np.int64),
+                  'direction': np.zeros((3, len(DIRECTION_LABELS)), dtype=np.int64),
+                  'error': None, 'seconds': 0.0, 'blocks': 0} for c in todo}
+    results = dict(cached)
+    start_time = time.perf_counter()
+
+    def report(combination, counts, direction, error, seconds):
+        total = totals[combination]
+        total['counts'] += counts
+        total['direction'] += direction
+        total['error'] = total['error'] or error
+        total['seconds'] += seconds
+        total['blocks'] += 1
+        if total['blocks'] < len(blocks):
+            return
+        result = dict(zip(COUNT_COLUMNS, (int(x) for x in total['counts'])), seconds=total['seconds'],
+                      direction=total['direction'].tolist(), error=total['error'])
+        results[combination] = result
+        done = len(results) - len(cached)
+        print(f"[{done}/{len(todo)} combinations] {combinations[combination]}: {result['TPs']} TPs on "
+              f"{result['Points_with_TP']}/{n_points} points, {result['Failed']} failed, {result['seconds']:.1f} s "
+              f"(elapsed {time.perf_counter() - start_time:.1f} s)")
+        if on_result is not None:
+            on_result(combination, result)
+
+    if not todo:
+        return [results[c] for c in range(len(combinations))]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _worker.update(values=np.asarray(values[rows], dtype=np.float64), times=times,
+                       deformation_dates=deformation_dates)
+        for task in tasks:
+            report(*_run_task(*task))
+        return [results[c] for c in range(len(combinations))]
+
+    # One shared copy of the selected rows for all workers
+    shape = (n_points, values.shape[1])
+    shm = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+    shared = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    try:
+        for start in range(0, n_points, 20000):
+            shared[start:start + 20000] = values[rows[start:start + 20000]]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, shape, times, deformation_dates)) as pool:
+            # Keep a bounded number of tasks in flight
+            running = set()
+            for task in tasks:
+                running.add(pool.submit(_run_task, *task))
+                if len(running) >= 2 * workers:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        report(*future.result())
+            for future in wait(running).done:
+                report(*future.result())
+    finally:
+        del shared  # The buffer cannot be closed while an array uses it
+        shm.close()
+        shm.unlink()
+    return [results[c] for c in range(len(combinations))]
+
+
+def results_table(combinations, results):
+    """Tidy table: one row per combination with its parameters, counts, direction bins and runtime."""
+    rows = []
+    for params, result in zip(combinations, results):
+        direction = np.asarray(result['direction'])
+        row = dict(params)
+        row.update({column: result[column] for column in COUNT_COLUMNS})
+        row['TPs_per_point'] = result['TPs'] / result['Points'] if result['Points'] else np.nan
+        row['Negative_Slopes'] = int(direction[NEGATIVE].sum())
+        row['Positive_Slopes'] = int(direction[POSITIVE].sum())
+        for label, count in zip(DIRECTION_LABELS, direction.sum(axis=0)):
+            row[f'DIR {label}'] = int(count)
+        row['Seconds'] = result['seconds']
+        row['Seconds_per_point'] = result['seconds'] / result['Points'] if result['Points'] else np.nan
+        row['Error'] = result.get('error') or ''
+        row['Cached'] = result.get('cached', False)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep STPD parameters over a grid of combinations.")
+    parser.add_argument('csvpath', nargs='?', default=csvpath, help="Deformation CSV, Parquet or stack directory")
+    for name, value in STPD_PARAMS.items():
+        parser.add_argument(f'--{name.lower().replace("_", "-")}', dest=name, nargs='+',
+                            type=int if name in INT_PARAMS else float,
+                            default=[value], help=f"STPD {name} values (default: {value})")
+    parser.add_argument('--sample', type=int, help="Evaluate a random sample of this many points")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of --sample")
+    parser.add_argument('--ids', nargs='+', help="Only evaluate these IDs")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--block-size', type=int, default=200, help="Points per task")
+    parser.add_argument('--cache-dir', default=None, help="Results cache (default: 'sweep' in the stack cache)")
+    parser.add_argument('--no-cache', action='store_true', help="Recompute every combination")
+    parser.add_argument('--output', default='STPD_sweep.csv', help="Results table")
+    add_area_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csvpath):
+        print(f"Error: File {args.csvpath} not found.")
+        exit()
+
+    stack, spatial_index = stack_spatial_index(args.csvpath)
+    stack_dir = args.csvpath if os.path.isdir(args.csvpath) else cache_dir_for(args.csvpath)
+    rows = np.arange(len(stack.ids))
+    if args.ids:
+        rows = rows[np.isin(stack.ids, args.ids)]
+    area_rows = select_rows(spatial_index, **area_options(args, parser))
+    if area_rows is not None:
+        rows = rows[np.isin(rows, area_rows)]
+    if args.sample is not None and args.sample < len(rows):
+        rows = np.sort(np.random.default_rng(args.seed).choice(rows, args.sample, replace=False))
+    print(f"{len(rows)} of {len(stack.ids)} points selected")
+
+    # Defaults come as given in STPD_PARAMS: cast them like the command-line values so cache keys agree
+    combinations = parameter_grid({name: [int(v) if name in INT_PARAMS else float(v) for v in getattr(args, name)]
+                                   for name in STPD_PARAMS})
+    source_sha1 = read_meta(stack_dir)['sha1']
+    ids_sha1 = hashlib.sha1('\n'.join(stack.ids[rows]).encode()).hexdigest()
+    keys = [combination_key(source_sha1, ids_sha1, params) for params in combinations]
+
+    sweep_dir = args.cache_dir or os.path.join(stack_dir, 'sweep')
+    os.makedirs(sweep_dir, exist_ok=True)
+    cached = {}
+    if not args.no_cache:
+        for c, key in enumerate(keys):
+            result = read_cached(sweep_dir, key)
+            if result is not None:
+                cached[c] = dict(result, cached=True)
+    print(f"{len(combinations)} combinations, {len(cached)} cached")
+
+    # Turning-point dates are not part of the results, only needed by turning_point_rows
+    deformation_dates = generate_dates(start_month=5, start_year=2011, num_months=len(stack.times))
+    start = time.perf_counter()
+    results = run_sweep(stack.times, stack.values, combinations, deformation_dates, rows=rows, workers=args.workers,
+                        block_size=args.block_size, cached=cached,
+                        on_result=lambda c, result: cache_result(sweep_dir, keys[c], result))
+    print(f"Sweep finished in {time.perf_counter() - start:.1f} s")
+
+    table = results_table(combinations, results)
+    table.to_csv(args.output, index=False)
+    print(table[list(STPD_PARAMS) + ['Points_with_TP', 'TPs', 'Seconds']].to_string(index=False))
+    print(f"Sweep results saved to {args.output}")
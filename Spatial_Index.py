@@ -0,0 +1,322 @@
+"""
+Persistent spatial index over point coordinates for area-of-interest queries.
+
+The points of a deformation stack (or the rows of a turning-point table) are
+put in a KD-tree on the unit sphere, so radius and k-nearest queries use
+true great-circle distances, and a latitude-sorted order serves bounding-box
+queries by binary search. The index is built once and saved next to the
+data: in <cache>/spatial_index for a stack (tied to the cache build, like
+ID_Index.py) or in <table>.spatial for a turning-point table. Query results
+are row numbers that feed STPD_Batch.py, Plot_Render.py and the histograms.
+density_grid counts points per lat/lon cell with one bincount.
+
+Usage:
+    python Spatial_Index.py DESC_CLIP.csv --bbox 41.95 42.00 14.95 15.02 --output aoi_ids.txt
+    python Spatial_Index.py DESC_CLIP.csv --near 41.98 14.99 --radius 500
+    python Spatial_Index.py DESC_CLIP.csv --near 41.98 14.99 --nearest 10
+    python Spatial_Index.py DESC_filtered_turning_points.csv --table --density 0.005 --output DESC_tp_density.csv
+"""
+import argparse
+import os
+import pickle
+import shutil
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from Deformation_Stack import (cache_dir_for, load_stack, read_meta, write_meta, source_info,
+                               source_unchanged, scan_file, point_columns)
+from Table_IO import read_table, is_parquet
+
+INDEX_VERSION = 1
+EARTH_RADIUS = 6371008.8  # Mean Earth radius (m)
+
+# rows: data row of every tree point (points without coordinates are left out)
+SpatialIndex = namedtuple('SpatialIndex', ['tree', 'rows', 'latitudes', 'longitudes', 'lat_order', 'lat_sorted'])
+
+
+def to_xyz(latitudes, longitudes):
+    """Unit-sphere Cartesian coordinates of lat/lon degrees, as an (N x 3) array."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_metres(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def metres_to_chord(distance):
+    return 2 * np.sin(np.minimum(np.asarray(distance, dtype=float), np.pi * EARTH_RADIUS) / (2 * EARTH_RADIUS))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres, vectorized."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def build_spatial_index(latitudes, longitudes, index_dir, meta):
+    """Build the KD-tree and latitude order of a set of points and save them in index_dir."""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    rows = np.flatnonzero(~np.isnan(latitudes) & ~np.isnan(longitudes))
+    tree = cKDTree(to_xyz(latitudes[rows], longitudes[rows]))
+
+    tmp_dir = index_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, 'tree.pkl'), 'wb') as f:
+        pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+    np.save(os.path.join(tmp_dir, 'rows.npy'), rows)
+    np.save(os.path.join(tmp_dir, 'lat.npy'), latitudes)
+    np.save(os.path.join(tmp_dir, 'lon.npy'), longitudes)
+    lat_order = rows[np.argsort(latitudes[rows], kind='stable')]
+    np.save(os.path.join(tmp_dir, 'lat_order.npy'), lat_order)
+    np.save(os.path.join(tmp_dir, 'lat_sorted.npy'), latitudes[lat_order])
+    write_meta(tmp_dir, dict(meta, version=INDEX_VERSION, n_points=len(rows)))
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+
+
+def open_spatial_index(index_dir):
+    """Load a saved spatial index (coordinate arrays are memory-mapped)."""
+    with open(os.path.join(index_dir, 'tree.pkl'), 'rb') as f:
+        tree = pickle.load(f)
+    return SpatialIndex(tree=tree,
+                        rows=np.load(os.path.join(index_dir, 'rows.npy')),
+                        latitudes=np.load(os.path.join(index_dir, 'lat.npy'), mmap_mode='r'),
+                        longitudes=np.load(os.path.join(index_dir, 'lon.npy'), mmap_mode='r'),
+                        lat_order=np.load(os.path.join(index_dir, 'lat_order.npy'), mmap_mode='r'),
+                        lat_sorted=np.load(os.path.join(index_dir, 'lat_sorted.npy'), mmap_mode='r'))
+
+
+def stack_spatial_index(csvpath, cache_dir=None, dtype='float32'):
+    """Open a deformation stack and the spatial index of its points, building either if needed.
+
+    Returns (stack, index); index rows are rows of the stack.
+    """
+    cache_dir = cache_dir or (csvpath if os.path.isdir(csvpath) else cache_dir_for(csvpath))
+    stack = load_stack(csvpath, cache_dir, dtype)
+    index_dir = os.path.join(cache_dir, 'spatial_index')
+
+    cache_sha1 = read_meta(cache_dir)['sha1']
+    meta = read_meta(index_dir)
+    if meta is None or meta.get('version') != INDEX_VERSION or meta.get('cache_sha1') != cache_sha1:
+        build_spatial_index(stack.latitudes, stack.longitudes, index_dir, {'cache_sha1': cache_sha1})
+    return stack, open_spatial_index(index_dir)
+
+
+def table_coordinates(path):
+    """(latitudes, longitudes) of the rows of a turning-point table, reading only those columns."""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        header = pq.ParquetFile(path).schema_arrow.names
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+    _, lat_col, lon_col = point_columns(list(header))
+    if lat_col is None or lon_col is None:
+        raise ValueError(f"No latitude/longitude columns in {path}")
+    table = read_table(path, columns=[lat_col, lon_col])
+    return table[lat_col].to_numpy(dtype=float), table[lon_col].to_numpy(dtype=float)
+
+
+def table_spatial_index(path, index_dir=None):
+    """Open the spatial index of a turning-point table (rows of the table), rebuilding it if the table changed."""
+    index_dir = index_dir or path + '.spatial'
+    meta = read_meta(index_dir)
+    if meta is None or meta.get('version') != INDEX_VERSION or not source_unchanged(path, index_dir, meta):
+        sha1, _ = scan_file(path)
+        build_spatial_index(*table_coordinates(path), index_dir, dict(source_info(path), sha1=sha1))
+    return open_spatial_index(index_dir)
+
+
+def query_bbox(index, lat_min, lat_max, lon_min, lon_max):
+    """Rows inside a lat/lon bounding box (inclusive), in ascending order."""
+    start = np.searchsorted(index.lat_sorted, lat_min, side='left')
+    stop = np.searchsorted(index.lat_sorted, lat_max, side='right')
+    band = np.asarray(index.lat_order[start:stop])
+    lon = index.longitudes[band]
+    return np.sort(band[(lon >= lon_min) & (lon <= lon_max)])
+
+
+def query_radius(index, lat, lon, radius):
+    """Rows within radius metres of a point, in ascending order."""
+    hits = index.tree.query_ball_point(to_xyz([lat], [lon])[0], metres_to_chord(radius))
+    return np.sort(index.rows[np.asarray(hits, dtype=int)])
+
+
+def query_nearest(index, latitudes, longitudes, k=1, max_distance=np.inf):
+    """k nearest points of each query point, vectorized over the queries.
+
+    Returns (distances in metres, rows) with one entry per query point (and
+    a trailing k axis when k > 1). Missing neighbours (beyond max_distance or
+    fewer than k points) have distance inf and row -1.
+    """
+    queries = to_xyz(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+    upper = metres_to_chord(max_distance) if np.isfinite(max_distance) else np.inf
+    chord, hits = index.tree.query(queries, k=k, distance_upper_bound=upper)
+    found = hits < len(index.rows)
+    rows = np.where(found, index.rows[np.minimum(hits, len(index.rows) - 1)], -1)
+    distances = np.where(found, chord_to_metres(np.where(found, chord, 0.0)), np.inf)
+    return distances, rows
+
+
+def check_area(near=None, radius=None, nearest=None):
+    """Raise ValueError when `near` comes without `radius` / `nearest`, or they come without `near`."""
+    if near is None and (radius is not None or nearest is not None):
+        raise ValueError("radius and nearest need a centre point (near)")
+    if near is not None and radius is None and nearest is None:
+        raise ValueError("near needs a radius or a number of nearest points")
+
+
+def in_area(latitudes, longitudes, bbox=None, near=None, radius=None):
+    """Vectorized mask of points inside a bounding box and/or within radius metres of `near`.
+
+    For streaming data (e.g. table chunks) where no index is built.
+    """
+    check_area(near, radius)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    mask = np.ones(len(latitudes), dtype=bool)
+    if bbox is not None:
+        lat_min, lat_max, lon_min, lon_max = bbox
+        mask &= (latitudes >= lat_min) & (latitudes <= lat_max) & (longitudes >= lon_min) & (longitudes <= lon_max)
+    if near is not None and radius is not None:
+        mask &= haversine(near[0], near[1], latitudes, longitudes) <= radius
+    return mask
+
+
+def select_rows(index, bbox=None, near=None, radius=None, nearest=None):
+    """Rows of an area of interest: bounding box, radius around `near`, or the `nearest` k points.
+
+    Criteria given together are intersected. Returns None when no criterion
+    is given (all rows).
+    """
+    check_area(near, radius, nearest)
+    selections = []
+    if bbox is not None:
+        selections.append(query_bbox(index, *bbox))
+    if near is not None and radius is not None:
+        selections.append(query_radius(index, near[0], near[1], radius))
+    if near is not None and nearest is not None:
+        _, rows = query_nearest(index, near[0], near[1], k=nearest)
+        rows = np.ravel(rows)
+        selections.append(np.sort(rows[rows >= 0]))
+    if not selections:
+        return None
+    rows = selections[0]
+    for other in selections[1:]:
+        rows = np.intersect1d(rows, other)
+    return rows
+
+
+def add_area_arguments(parser, nearest=True):
+    """Add the --bbox / --near / --radius (/ --nearest) area-of-interest options to a parser."""
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help="Only points inside this bounding box")
+    parser.add_argument('--near', type=float, nargs=2, metavar=('LAT', 'LON'),
+                        help="Centre for --radius / --nearest")
+    parser.add_argument('--radius', type=float, help="Only points within this distance of --near (m)")
+    if nearest:
+        parser.add_argument('--nearest', type=int, help="Only the k points nearest to --near")
+
+
+def area_options(args, parser=None):
+    """The area-of-interest keyword arguments given on a command line (see add_area_arguments).
+
+    An incomplete --near / --radius / --nearest combination is reported with
+    parser.error (ValueError without a parser).
+    """
+    options = {'bbox': args.bbox, 'near': args.near, 'radius': args.radius}
+    if hasattr(args, 'nearest'):
+        options['nearest'] = args.nearest
+    try:
+        check_area(options['near'], options['radius'], options.get('nearest'))
+    except ValueError:
+        if parser is None:
+            raise
+        flags = "--radius or --nearest" if 'nearest' in options else "--radius"
+        parser.error(f"--near must be given with {flags}, and {flags} with --near")
+    return options
+
+
+def density_grid(latitudes, longitudes, cell_size, bounds=None, weights=None):
+    """Count (or sum weights of) points per lat/lon cell of cell_size degrees.
+
+    bounds = (lat_min, lat_max, lon_min, lon_max) defaults to the data extent.
+    Returns (grid, lat_edges, lon_edges) with grid[i, j] for latitude cell i
+    and longitude cell j. Points outside the bounds are ignored.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    valid = ~np.isnan(latitudes) & ~np.isnan(longitudes)
+    if bounds is None:
+        bounds = (latitudes[valid].min(), latitudes[valid].max(), longitudes[valid].min(), longitudes[valid].max())
+    lat_min, lat_max, lon_min, lon_max = bounds
+    n_lat = max(int(np.ceil((lat_max - lat_min) / cell_size)), 1)
+    n_lon = max(int(np.ceil((lon_max - lon_min) / cell_size)), 1)
+    lat_edges = lat_min + cell_size * np.arange(n_lat + 1)
+    lon_edges = lon_min + cell_size * np.arange(n_lon + 1)
+
+    i = np.floor((latitudes - lat_min) / cell_size)
+    j = np.floor((longitudes - lon_min) / cell_size)
+    # Points on the upper bound belong to the last cell
+    i = np.where(latitudes == lat_max, n_lat - 1, i)
+    j = np.where(longitudes == lon_max, n_lon - 1, j)
+    inside = valid & (i >= 0) & (i < n_lat) & (j >= 0) & (j < n_lon)
+    cells = (i[inside] * n_lon + j[inside]).astype(np.int64)
+    w = None if weights is None else np.asarray(weights, dtype=float)[inside]
+    grid = np.bincount(cells, weights=w, minlength=n_lat * n_lon).reshape(n_lat, n_lon)
+    return grid, lat_edges, lon_edges
+
+
+def grid_to_frame(grid, lat_edges, lon_edges, name='Count'):
+    """Non-empty cells of a density grid as a long table of cell centres."""
+    i, j = np.nonzero(grid)
+    return pd.DataFrame({
+        'Latitude': (lat_edges[i] + lat_edges[i + 1]) / 2,
+        'Longitude': (lon_edges[j] + lon_edges[j + 1]) / 2,
+        name: grid[i, j],
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Area-of-interest queries and point density on a spatial index.")
+    parser.add_argument('path', help="Deformation CSV / Parquet / stack directory, or a turning-point table with --table")
+    parser.add_argument('--table', action='store_true', help="Index the rows of a turning-point table")
+    add_area_arguments(parser)
+    parser.add_argument('--density', type=float, metavar='CELL_DEG', help="Write a point density grid with this cell size")
+    parser.add_argument('--output', help="Selected IDs (one per line) or density CSV")
+    args = parser.parse_args()
+
+    if args.table:
+        index = table_spatial_index(args.path)
+        ids = None
+    else:
+        stack, index = stack_spatial_index(args.path)
+        ids = stack.ids
+
+    rows = select_rows(index, **area_options(args, parser))
+    if rows is None:
+        rows = index.rows
+    print(f"{len(rows)} of {len(index.latitudes)} points selected")
+
+    if args.density is not None:
+        grid, lat_edges, lon_edges = density_grid(index.latitudes[rows], index.longitudes[rows], args.density,
+                                                  bounds=tuple(args.bbox) if args.bbox else None)
+        density = grid_to_frame(grid, lat_edges, lon_edges)
+        print(f"{grid.shape[0]} x {grid.shape[1]} cells, {len(density)} non-empty, max {int(grid.max())} points")
+        if args.output:
+            density.to_csv(args.output, index=False)
+            print(f"Density grid saved to {args.output}")
+    elif args.output:
+        with open(args.output, 'w') as f:
+            f.writelines(f"{ids[i] if ids is not None else i}\n" for i in rows)
+        print(f"Selected {'IDs' if ids is not None else 'rows'} saved to {args.output}")
+    else:
+        for i in rows[:20]:
+            print(ids[i] if ids is not None else i, index.latitudes[i], index.longitudes[i])
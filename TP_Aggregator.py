@@ -0,0 +1,227 @@
+"""
+Out-of-core aggregation of turning-point tables for TP_Histogram.py and DIR_Histogram.py.
+
+A *_filtered_turning_points table is read once, in pieces, and only the
+ID, Date, Direction and Slope columns are parsed. Each piece is reduced to
+integer counts with np.bincount: turning points per month, and direction
+bin x slope sign. Partial counts merge by addition, so the pieces (line-
+aligned byte ranges of a CSV, row groups of a Parquet file) are counted in
+parallel and the ASC and DESC histograms come out of one read per file.
+CSV byte ranges assume no quoted newlines, as in the tables written by the
+STPD scripts.
+
+Usage:
+    python TP_Aggregator.py --desc DESC_filtered_turning_points.csv --asc ASC_filtered_turning_points.csv --output TP_counts
+"""
+import argparse
+import csv
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from Date_Parser import parse_dates
+from Table_IO import is_parquet
+from Spatial_Index import in_area, add_area_arguments, area_options
+
+ID_COLUMN, DATE_COLUMN, DIRECTION_COLUMN, SLOPE_COLUMN = 'ID', 'Date (mm/yyyy)', 'Direction', 'Slope'
+COLUMNS = [ID_COLUMN, DATE_COLUMN, DIRECTION_COLUMN, SLOPE_COLUMN]
+LAT_COLUMN, LON_COLUMN = 'Latitude', 'Longitude'
+
+# Turning-point dates are written as e.g. 'May-11' (or '11-May')
+DATE_FORMATS = ['%y-%b', '%b-%y']
+
+# Direction bins (mm/year), left-closed like pd.cut(..., right=False)
+DIRECTION_BINS = [-np.inf, -10, -8, -6, -4, -2, 2, 4, 6, 8, 10, np.inf]
+DIRECTION_LABELS = ["< -10", "[-10 -8)", "[-8 -6)", "[-6 -4)", "[-4 -2)", "[-2 2)",
+                    "[2 4)", "[4 6)", "[6 8)", "[8 10)", "> 10"]
+
+# Slope sign rows of TPCounts.direction
+NEGATIVE, POSITIVE, NO_SLOPE = 0, 1, 2
+
+# first_month: month code (months since 1970-01) of monthly[0]
+# direction: (slope sign x direction bin) counts, rows NEGATIVE / POSITIVE / NO_SLOPE
+TPCounts = namedtuple('TPCounts', ['first_month', 'monthly', 'direction', 'rows', 'missing_dates'])
+
+
+def empty_counts():
+    return TPCounts(0, np.zeros(0, dtype=np.int64), np.zeros((3, len(DIRECTION_LABELS)), dtype=np.int64), 0, 0)
+
+
+def parse_tp_dates(values):
+    """Turning-point dates as datetime64, with two-digit years in the 2000s."""
+    if np.issubdtype(np.asarray(values).dtype, np.datetime64):
+        return np.asarray(values, dtype='datetime64[ns]')
+    return parse_dates(values, formats=DATE_FORMATS, min_year=2000).to_numpy()
+
+
+def direction_bins(direction):
+    """Index of the DIRECTION_BINS interval of every value; -1 for NaN and +inf."""
+    direction = np.asarray(direction, dtype=float)
+    index = np.searchsorted(np.asarray(DIRECTION_BINS[1:-1]), direction, side='right')
+    return np.where(np.isnan(direction) | (direction == np.inf), -1, index)
+
+
+def needed_columns(area=None):
+    """Columns to read: the coordinates are only needed to filter an area of interest."""
+    return COLUMNS + [LAT_COLUMN, LON_COLUMN] if area else COLUMNS
+
+
+def count_frame(frame, area=None):
+    """Reduce a piece of a turning-point table to TPCounts.
+
+    area (bbox / near / radius keywords of Spatial_Index.in_area) keeps only
+    the turning points inside an area of interest.
+    """
+    if area:
+        frame = frame[in_area(frame[LAT_COLUMN], frame[LON_COLUMN], **area)]
+    dates = parse_tp_dates(frame[DATE_COLUMN])
+    valid_date = ~np.isnat(dates)
+    # Same rows as groupby(date)['ID'].count(): a valid date and an ID
+    counted = valid_date & frame[ID_COLUMN].notna().to_numpy()
+    codes = dates[counted].astype('datetime64[M]').astype(np.int64)
+    if len(codes):
+        first = int(codes.min())
+        monthly = np.bincount(codes - first)
+    else:
+        first, monthly = 0, np.zeros(0, dtype=np.int64)
+
+    n_bins = len(DIRECTION_LABELS)
+    bins = direction_bins(frame[DIRECTION_COLUMN].to_numpy(dtype=float))
+    slope = frame[SLOPE_COLUMN].to_numpy(dtype=float)
+    sign = np.where(np.isnan(slope), NO_SLOPE, np.where(slope >= 0, POSITIVE, NEGATIVE))
+    in_bin = bins >= 0
+    direction = np.bincount(sign[in_bin] * n_bins + bins[in_bin], minlength=3 * n_bins).reshape(3, n_bins)
+
+    return TPCounts(first, monthly.astype(np.int64), direction.astype(np.int64),
+                    len(frame), int((~valid_date).sum()))
+
+
+def merge_counts(a, b):
+    """Sum of two TPCounts."""
+    if len(a.monthly) == 0 or len(b.monthly) == 0:
+        first, monthly = (b.first_month, b.monthly) if len(a.monthly) == 0 else (a.first_month, a.monthly)
+    else:
+        first = min(a.first_month, b.first_month)
+        last = max(a.first_month + len(a.monthly), b.first_month + len(b.monthly))
+        monthly = np.zeros(last - first, dtype=np.int64)
+        for part in (a, b):
+            monthly[part.first_month - first:part.first_month - first + len(part.monthly)] += part.monthly
+    return TPCounts(first, monthly, a.direction + b.direction, a.rows + b.rows, a.missing_dates + b.missing_dates)
+
+
+def read_header(path):
+    """Column names of a CSV file."""
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader(f, skipinitialspace=True))
+
+
+def byte_ranges(path, block_bytes):
+    """Split a CSV after its header into line-aligned (start, stop) byte ranges of about block_bytes."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()
+        bounds = [f.tell()]
+        while bounds[-1] + block_bytes < size:
+            f.seek(bounds[-1] + block_bytes)
+            f.readline()  # Move to the start of the next line
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def count_csv_range(path, start, stop, header, area=None):
+    """Count the lines of a CSV byte range."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    frame = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=needed_columns(area),
+                        skipinitialspace=True, dtype={DATE_COLUMN: str})
+    return count_frame(frame, area)
+
+
+def count_parquet_group(path, group, area=None):
+    """Count one row group of a Parquet file."""
+    import pyarrow.parquet as pq
+    table = pq.ParquetFile(path).read_row_group(group, columns=needed_columns(area))
+    return count_frame(table.to_pandas(), area)
+
+
+def _tasks(path, block_bytes, area=None):
+    """(function, args) of every piece of a turning-point table."""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        return [(count_parquet_group, (path, group, area)) for group in range(pq.ParquetFile(path).num_row_groups)]
+    header = read_header(path)
+    return [(count_csv_range, (path, start, stop, header, area)) for start, stop in byte_ranges(path, block_bytes)]
+
+
+def _run(task):
+    function, args = task
+    return function(*args)
+
+
+def aggregate_files(paths, workers=None, block_bytes=64 * 2**20, area=None):
+    """Count several turning-point tables in one pass each.
+
+    paths maps a name (e.g. 'Descending Orbit') to a CSV or Parquet file.
+    All pieces of all files share one process pool. area restricts the
+    counts to an area of interest (see count_frame). Returns {name: TPCounts}.
+    """
+    area = {key: value for key, value in (area or {}).items() if value is not None} or None
+    tasks = [(name, task) for name, path in paths.items() for task in _tasks(path, block_bytes, area)]
+    workers = workers or os.cpu_count() or 1
+    results = {name: empty_counts() for name in paths}
+    if workers == 1 or len(tasks) <= 1:
+        for name, task in tasks:
+            results[name] = merge_counts(results[name], _run(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (name, _), part in zip(tasks, pool.map(_run, [task for _, task in tasks])):
+                results[name] = merge_counts(results[name], part)
+    return results
+
+
+def monthly_series(counts, name=None):
+    """Turning points per month as a Series on a monthly PeriodIndex (months with none dropped)."""
+    months = pd.period_range(pd.Period(np.datetime64(counts.first_month, 'M'), 'M'),
+                             periods=len(counts.monthly), freq='M')
+    series = pd.Series(counts.monthly, index=months, name=name)
+    return series[series > 0]
+
+
+def direction_table(counts):
+    """Direction-bin counts as a DataFrame with All, Negative and Positive columns."""
+    return pd.DataFrame({
+        'All': counts.direction.sum(axis=0),
+        'Negative': counts.direction[NEGATIVE],
+        'Positive': counts.direction[POSITIVE],
+    }, index=pd.Index(DIRECTION_LABELS, name='Direction_Bin'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly and direction histograms of turning-point tables.")
+    parser.add_argument('--desc', help="Descending orbit turning-point table (CSV or Parquet)")
+    parser.add_argument('--asc', help="Ascending orbit turning-point table (CSV or Parquet)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--block-mb', type=int, default=64, help="CSV bytes per task (MB)")
+    parser.add_argument('--output', default='TP_counts', help="Output prefix")
+    add_area_arguments(parser, nearest=False)
+    args = parser.parse_args()
+
+    paths = {name: path for name, path in (('Descending Orbit', args.desc), ('Ascending Orbit', args.asc)) if path}
+    results = aggregate_files(paths, workers=args.workers, block_bytes=args.block_mb * 2**20,
+                              area=area_options(args, parser))
+
+    monthly = pd.concat([monthly_series(counts, name) for name, counts in results.items()], axis=1).fillna(0).astype(int)
+    monthly.index = monthly.index.to_timestamp()
+    monthly.sort_index().to_csv(args.output + '_monthly.csv', index_label='Date')
+    directions = pd.concat({name: direction_table(counts) for name, counts in results.items()}, axis=1)
+    directions.columns = [f"{name} {sign}" for name, sign in directions.columns]
+    directions.to_csv(args.output + '_direction.csv')
+    for name, counts in results.items():
+        print(f"{name}: {counts.rows} rows, {counts.missing_dates} without a valid date")
+    print(f"Histograms saved to {args.output}_monthly.csv and {args.output}_direction.csv")
@@ -0,0 +1,240 @@
+"""
+Scene-wide coincidence of turning points with high antecedent API.
+
+For every turning point the API of the months before it is summarised over
+one or more windows (e.g. the 1, 3 and 6 months up to the turning-point
+month): mean API, number of high-API months (API > threshold) and whether
+any month was high. Window sums come from prefix sums over the monthly API
+series, so every window of every month costs O(1), and a turning point only
+needs the row of its month.
+
+The coincidence rate is the share of turning points with at least one
+high-API month in the window. Its null distribution shuffles the turning-
+point dates: each permutation reassigns the monthly turning-point counts to
+randomly permuted months of the observation period, which keeps how many
+turning points share a date but breaks their timing relative to rainfall.
+Permutations are drawn in blocks, each evaluated as one gather and matrix
+product, and blocks are spread over worker processes with one SeedSequence
+child each, so results do not depend on the number of workers.
+
+Usage:
+    python TP_Coincidence.py Output_API_mean.csv --desc DESC_filtered_turning_points.csv --asc ASC_filtered_turning_points.csv --windows 1 3 6 --threshold 90
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from API_Engine import month_codes, monthly_mean
+from API_Spells import read_api_table
+from Spatial_Index import in_area, add_area_arguments, area_options
+from Table_IO import is_parquet
+from TP_Aggregator import aggregate_files, parse_tp_dates, needed_columns, ID_COLUMN, DATE_COLUMN, LAT_COLUMN, LON_COLUMN
+
+# first_month: month code (months since 1970-01) of row 0; arrays are (month x window)
+WindowStats = namedtuple('WindowStats', ['first_month', 'windows', 'mean', 'high_months', 'complete'])
+
+# rate / mean_api / p-values are (table x window); the null arrays add a leading permutation axis
+CoincidenceTest = namedtuple('CoincidenceTest', ['n_tps', 'rate', 'mean_api', 'null_rate', 'null_mean_api',
+                                                 'p_value', 'p_value_api'])
+
+
+def monthly_api(dates, values):
+    """(first month code, monthly mean API) on a gap-free monthly axis; daily or monthly input."""
+    months, means = monthly_mean(dates, values)
+    first = int(month_codes(months[:1])[0]) if len(months) else 0
+    return first, means
+
+
+def window_statistics(first_month, api, windows, threshold, offset=0):
+    """API statistics of the windows ending at every month, from prefix sums.
+
+    The window of length w for month m covers months m-offset-w+1 .. m-offset
+    (offset=0 includes the turning-point month, offset=1 only the months
+    strictly before it). complete is False where the window leaves the API
+    series or contains a missing month.
+    """
+    api = np.asarray(api, dtype=float)
+    windows = np.asarray(windows, dtype=np.int64)
+    valid = ~np.isnan(api)
+    with np.errstate(invalid='ignore'):
+        high = api > threshold
+    # Prefix sums with a leading zero: sum over [a, b) = S[b] - S[a]
+    sums = np.r_[0.0, np.cumsum(np.where(valid, api, 0.0))]
+    counts = np.r_[0, np.cumsum(valid)]
+    highs = np.r_[0, np.cumsum(high)]
+
+    stop = np.arange(len(api))[:, None] - offset + 1
+    start = stop - windows
+    inside = (start >= 0) & (stop <= len(api))
+    a, b = np.clip(start, 0, len(api)), np.clip(stop, 0, len(api))
+    n_valid = counts[b] - counts[a]
+    complete = inside & (n_valid == windows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(complete, (sums[b] - sums[a]) / n_valid, np.nan)
+    high_months = np.where(complete, highs[b] - highs[a], 0)
+    return WindowStats(first_month, windows, mean, high_months, complete)
+
+
+def counts_on_axis(tp_counts, first_month, n_months):
+    """Monthly turning-point counts of TPCounts moved onto the API month axis (months outside dropped)."""
+    column = np.zeros(n_months, dtype=np.int64)
+    months = tp_counts.first_month + np.arange(len(tp_counts.monthly)) - first_month
+    inside = (months >= 0) & (months < n_months)
+    column[months[inside]] = tp_counts.monthly[inside]
+    return column
+
+
+def eligible_months(stats, counts):
+    """Months that can hold a (shuffled) turning point: complete windows, within the observed TP period."""
+    complete = stats.complete.all(axis=1)
+    seen = np.flatnonzero(counts.sum(axis=1) > 0)
+    period = np.zeros(len(complete), dtype=bool)
+    if len(seen):
+        period[seen[0]:seen[-1] + 1] = True
+    return np.flatnonzero(complete & period)
+
+
+def _rates(counts, hit, mean, n_tps):
+    """Coincidence rates and mean window API (table x window) of month counts (..., month x table)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = np.einsum('...mt,mw->...tw', counts, hit) / n_tps[:, None]
+        mean_api = np.einsum('...mt,mw->...tw', counts, mean) / n_tps[:, None]
+    return rate, mean_api
+
+
+# Per-process state, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(counts, hit, mean):
+    """Keep the month counts and window statistics in the worker process."""
+    _worker.update(counts=counts, hit=hit, mean=mean, n_tps=counts.sum(axis=0).astype(float))
+
+
+def _run_block(seed, n_permutations):
+    """Null rates of one block: the month counts gathered through a (permutation x month) matrix."""
+    rng = np.random.default_rng(seed)
+    counts = _worker['counts']
+    permutations = np.argsort(rng.random((n_permutations, len(counts))), axis=1)
+    return _rates(counts[permutations], _worker['hit'], _worker['mean'], _worker['n_tps'])
+
+
+def coincidence_test(stats, counts, n_permutations=10000, seed=0, block_size=500, workers=None):
+    """Observed coincidence rates with a permutation null of shuffled turning-point dates.
+
+    counts is a (month x table) array of turning points per month on the
+    axis of stats. Only eligible months (see eligible_months) take part, in
+    the observation and in the permutations. p-values are one-sided,
+    (1 + #{null >= observed}) / (1 + n_permutations).
+    """
+    months = eligible_months(stats, counts)
+    counts = np.asarray(counts, dtype=np.int64)[months]
+    hit = (stats.high_months[months] > 0).astype(float)
+    mean = stats.mean[months]
+    n_tps = counts.sum(axis=0)
+    rate, mean_api = _rates(counts, hit, mean, n_tps.astype(float))
+
+    sizes = [min(block_size, n_permutations - start) for start in range(0, n_permutations, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(sizes) <= 1:
+        _init_worker(counts, hit, mean)
+        results = [_run_block(s, size) for s, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(counts, hit, mean)) as pool:
+            results = list(pool.map(_run_block, seeds, sizes))
+
+    shape = (0,) + rate.shape
+    null_rate = np.concatenate([r for r, _ in results]) if results else np.empty(shape)
+    null_mean_api = np.concatenate([m for _, m in results]) if results else np.empty(shape)
+    p_value = (1 + (null_rate >= rate - 1e-12).sum(axis=0)) / (1 + n_permutations)
+    p_value_api = (1 + (null_mean_api >= mean_api - 1e-9).sum(axis=0)) / (1 + n_permutations)
+    return CoincidenceTest(n_tps, rate, mean_api, null_rate, null_mean_api, p_value, p_value_api)
+
+
+def summary_table(names, stats, test, confidence=0.95):
+    """One row per (table, window) with observed and null statistics."""
+    tail = (1 - confidence) / 2 * 100
+    null_low, null_high = np.percentile(test.null_rate, [tail, 100 - tail], axis=0)
+    rows = []
+    for t, name in enumerate(names):
+        for w, window in enumerate(stats.windows):
+            rows.append({
+                'Table': name, 'Window': int(window), 'TPs': int(test.n_tps[t]),
+                'Coincidence_Rate': test.rate[t, w], 'Null_Rate': test.null_rate[:, t, w].mean(),
+                'Null_Low': null_low[t, w], 'Null_High': null_high[t, w], 'p_value': test.p_value[t, w],
+                'Mean_API': test.mean_api[t, w], 'Null_Mean_API': test.null_mean_api[:, t, w].mean(),
+                'p_value_API': test.p_value_api[t, w],
+            })
+    return pd.DataFrame(rows)
+
+
+def tp_window_table(path, stats, area=None):
+    """Antecedent API statistics of every turning point of a table (one O(1) lookup per turning point)."""
+    if is_parquet(path):
+        frame = pd.read_parquet(path, columns=needed_columns(area))
+    else:
+        frame = pd.read_csv(path, usecols=needed_columns(area), skipinitialspace=True, dtype={DATE_COLUMN: str})
+    if area:
+        frame = frame[in_area(frame[LAT_COLUMN], frame[LON_COLUMN], **area)]
+    dates = parse_tp_dates(frame[DATE_COLUMN])
+    keep = ~np.isnat(dates) & frame[ID_COLUMN].notna().to_numpy()
+    frame, dates = frame[keep], dates[keep]
+
+    row = dates.astype('datetime64[M]').astype(np.int64) - stats.first_month
+    inside = (row >= 0) & (row < len(stats.mean))
+    row = np.where(inside, row, 0)
+    table = pd.DataFrame({'ID': frame[ID_COLUMN].to_numpy(), 'Date': dates.astype('datetime64[M]')})
+    for w, window in enumerate(stats.windows):
+        complete = inside & stats.complete[row, w]
+        table[f'API_mean_{window}m'] = np.where(complete, stats.mean[row, w], np.nan)
+        table[f'High_months_{window}m'] = np.where(complete, stats.high_months[row, w], -1)
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coincidence of turning points with high antecedent API.")
+    parser.add_argument('api', help="API table: Date column followed by an API column (daily or monthly)")
+    parser.add_argument('--desc', help="Descending orbit turning-point table (CSV or Parquet)")
+    parser.add_argument('--asc', help="Ascending orbit turning-point table (CSV or Parquet)")
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 2, 3, 6], help="Window lengths (months)")
+    parser.add_argument('--offset', type=int, default=0, help="Months between the window end and the TP month")
+    parser.add_argument('--threshold', type=float, default=80, help="High API threshold (mm)")
+    parser.add_argument('--permutations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--block-size', type=int, default=500, help="Permutations per task")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--per-tp', action='store_true', help="Also write the window statistics of every turning point")
+    parser.add_argument('--output', default='TP_coincidence', help="Output prefix")
+    add_area_arguments(parser, nearest=False)
+    args = parser.parse_args()
+
+    paths = {name: path for name, path in (('Descending Orbit', args.desc), ('Ascending Orbit', args.asc)) if path}
+    if not paths:
+        parser.error("at least one of --desc / --asc is required")
+    area = {key: value for key, value in area_options(args, parser).items() if value is not None} or None
+
+    api_table = read_api_table(args.api)
+    first_month, api = monthly_api(api_table.index, api_table.iloc[:, 0].to_numpy(dtype=float))
+    stats = window_statistics(first_month, api, args.windows, args.threshold, args.offset)
+    tp_counts = aggregate_files(paths, workers=args.workers, area=area)
+    counts = np.column_stack([counts_on_axis(c, first_month, len(api)) for c in tp_counts.values()])
+
+    start = time.perf_counter()
+    test = coincidence_test(stats, counts, args.permutations, args.seed, args.block_size, args.workers)
+    print(f"{args.permutations} permutations x {len(paths)} table(s) x {len(args.windows)} windows "
+          f"in {time.perf_counter() - start:.2f} s")
+
+    summary = summary_table(list(paths), stats, test)
+    summary.to_csv(args.output + '_summary.csv', index=False)
+    print(summary.to_string(index=False))
+    print(f"Coincidence summary saved to {args.output}_summary.csv")
+
+    if args.per_tp:
+        for name, path in paths.items():
+            out = f"{args.output}_{name.split()[0].lower()}_per_tp.csv"
+            tp_window_table(path, stats, area).to_csv(out, index=False)
+            print(f"Per turning point window statistics saved to {out}")
@@ -0,0 +1,27 @@
+"""
+Reading and writing of result tables (e.g. turning-point tables) as CSV or Parquet.
+
+The format follows the file extension: '.parquet' is columnar binary (needs
+pyarrow), anything else is CSV as before.
+"""
+import pandas as pd
+
+
+def is_parquet(path):
+    """True if a path names a Parquet file."""
+    return str(path).lower().endswith('.parquet')
+
+
+def read_table(path, columns=None):
+    """Read a CSV or Parquet table, optionally only the given columns."""
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_table(df, path):
+    """Write a table as CSV or Parquet depending on the file extension."""
+    if is_parquet(path):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
@@ -0,0 +1,92 @@
+"""
+Benchmark: load time and file size of a monthly deformation stack as CSV,
+as a memory-mapped stack directory and as Parquet.
+
+The synthetic stack has the ID,lat,lon,t1..tN layout read by
+RunMe_API_STPD_ID.py. CSV is loaded with read_time_series, the stack
+directory with Deformation_Stack.load_stack (full read and one-row access)
+and Parquet with pandas.
+
+Run from the repository root:
+    python benchmarks/bench_stack_formats.py [--points 100000] [--epochs 140]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Deformation_Stack import StackWriter, load_stack
+
+
+def size_of(path):
+    """Size in MB of a file or of all files in a directory."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+    return os.path.getsize(path) / 1e6
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--epochs', type=int, default=140)
+    args = parser.parse_args()
+
+    # Importing RunMe_API_STPD_ID needs the STPD package; fall back to pandas if it is missing
+    try:
+        from RunMe_API_STPD_ID import read_time_series
+    except ImportError:
+        read_time_series = None
+
+    rng = np.random.default_rng(0)
+    times = np.arange(args.epochs) / 12
+    values = np.round(np.cumsum(rng.normal(0, 1.5, (args.points, args.epochs)), axis=1), 2)
+    values[rng.random(values.shape) < 0.01] = np.nan
+    ids = np.arange(args.points).astype(str)
+    latitudes = 41.9 + rng.random(args.points) * 0.1
+    longitudes = 14.9 + rng.random(args.points) * 0.1
+    frame = pd.DataFrame(values, columns=[repr(float(t)) for t in times])
+    frame.insert(0, 'lon', longitudes)
+    frame.insert(0, 'lat', latitudes)
+    frame.insert(0, 'ID', ids)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(workdir, 'stack.csv')
+        stack_path = os.path.join(workdir, 'stack.stack')
+        parquet_path = os.path.join(workdir, 'stack.parquet')
+
+        frame.to_csv(csv_path, index=False)
+        writer = StackWriter(stack_path, args.points, times, 'float32')
+        writer.write(ids, latitudes, longitudes, values)
+        writer.close()
+        frame.astype({col: 'float32' for col in frame.columns[3:]}).to_parquet(parquet_path, index=False)
+
+        print(f"Stack: {args.points} points x {args.epochs} epochs")
+        print(f"{'format':<28}{'size (MB)':>12}{'load (s)':>12}")
+
+        if read_time_series is not None:
+            _, elapsed = timed(lambda: read_time_series(csv_path))
+            print(f"{'CSV (read_time_series)':<28}{size_of(csv_path):>12.1f}{elapsed:>12.3f}")
+        _, elapsed = timed(lambda: pd.read_csv(csv_path))
+        print(f"{'CSV (pandas)':<28}{size_of(csv_path):>12.1f}{elapsed:>12.3f}")
+
+        _, elapsed = timed(lambda: np.array(load_stack(stack_path).values))
+        print(f"{'stack dir (full read)':<28}{size_of(stack_path):>12.1f}{elapsed:>12.3f}")
+        _, elapsed = timed(lambda: np.array(load_stack(stack_path).values[args.points // 2]))
+        print(f"{'stack dir (open + 1 row)':<28}{size_of(stack_path):>12.1f}{elapsed:>12.4f}")
+
+        _, elapsed = timed(lambda: pd.read_parquet(parquet_path))
+        print(f"{'Parquet (pandas)':<28}{size_of(parquet_path):>12.1f}{elapsed:>12.3f}")
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,278 @@
+"""
+Benchmark suite: every pipeline stage on synthetic data at several scales.
+
+Inputs are generated by benchmarks/synthetic.py in the real file layouts,
+once per scale, into a scratch directory, and are not part of the timings.
+A scale is a number of points, read per stage as:
+
+    api_read     station-days of Pdata_*.txt files read by read_precipitation_table
+    api          station-days of rain run through compute_api_frame
+    resample     shapefile points (120 acquisitions) through Conversion_resample.convert to a stack
+    csv_load     deformation CSV points (140 epochs) loaded by Deformation_Stack.load_stack (cache build)
+    date_filter  API dates matched to 140 monthly epochs by Date_Alignment.match_within
+    stpd_batch   points through STPD_Batch.run_batch (capped by --stpd-max-points)
+    histogram    turning-point rows counted by TP_Aggregator.aggregate_files
+    correlation  GPM grid cells x 5 stations x 7 lags: read_gpm_table + lagged_correlation (capped at 10^5 cells)
+
+Each case reports the best wall time of --repeat runs and the peak traced
+allocation (Python and NumPy, via tracemalloc) of one more run; allocations
+of worker processes are not traced. Stages whose dependencies are missing
+(geopandas, STPD) are recorded as skipped. Results go to a JSON file with
+the commit and environment, and --compare prints the time and memory ratios
+against an earlier results file.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py --scales 1000 10000 100000 --output bench_results.json
+    python benchmarks/run_benchmarks.py --stages histogram csv_load --scales 1000000 --compare bench_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import synthetic
+
+# Synthetic layout sizes
+DAYS_PER_STATION = 4383  # 2011-2022
+EPOCHS = 140
+ACQUISITIONS = 120
+GPM_MONTHS = 144
+GPM_STATIONS = 5
+CORRELATION_LAGS = range(-3, 4)
+CORRELATION_MAX_CELLS = 10**5
+
+# setup(n, workdir, rng, args) -> (function to time, points actually used)
+Stage = namedtuple('Stage', ['name', 'setup'])
+
+
+def _cached(path, make):
+    """Generate a synthetic input once per scale."""
+    if not os.path.exists(path):
+        make(path)
+    return path
+
+
+def _gauge_layout(n):
+    n_days = min(n, DAYS_PER_STATION)
+    return n_days, -(-n // n_days)
+
+
+def setup_api_read(n, workdir, rng, args):
+    from API_Engine import read_precipitation_table
+    n_days, n_stations = _gauge_layout(n)
+    directory = os.path.join(workdir, f'pdata_{n}')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        synthetic.write_precipitation_files(directory, n_days, n_stations, rng)
+    paths = [os.path.join(directory, f"Pdata_S{i}.txt") for i in range(n_stations)]
+    return (lambda: read_precipitation_table(paths, start=None, end=None)), n_days * n_stations
+
+
+def setup_api(n, workdir, rng, args):
+    from API_Engine import compute_api_frame
+    n_days, n_stations = _gauge_layout(n)
+    table = pd.DataFrame(synthetic.daily_rain(n_days, n_stations, rng),
+                         index=pd.date_range('2011-01-01', periods=n_days, freq='D'))
+    return (lambda: compute_api_frame(table, k=0.85)), n_days * n_stations
+
+
+def setup_resample(n, workdir, rng, args):
+    from Conversion_resample import convert
+    path = _cached(os.path.join(workdir, f'points_{n}.shp'),
+                   lambda p: synthetic.write_shapefile(p, n, ACQUISITIONS, rng))
+    output = os.path.join(workdir, f'points_{n}.stack')
+    return (lambda: convert(path, output, workers=args.workers, output_format='stack')), n
+
+
+def setup_csv_load(n, workdir, rng, args):
+    from Deformation_Stack import load_stack
+    path = _cached(os.path.join(workdir, f'deformation_{n}.csv'),
+                   lambda p: synthetic.write_deformation_csv(p, n, EPOCHS, rng))
+    cache_dir = os.path.join(workdir, f'deformation_{n}.cache')
+    return (lambda: load_stack(path, cache_dir, rebuild=True)), n
+
+
+def setup_date_filter(n, workdir, rng, args):
+    from Date_Alignment import match_within
+    start = np.datetime64('2011-01-01T00:00', 's').astype(np.int64)
+    span = 12 * 365 * 86400
+    api_dates = np.sort(start + rng.integers(0, span, n)).astype('datetime64[s]')
+    epochs = (np.datetime64('2011-05', 'M') + np.arange(EPOCHS)).astype('datetime64[s]')
+    return (lambda: match_within(api_dates, epochs, 30)), n
+
+
+def setup_stpd_batch(n, workdir, rng, args):
+    from STPD_Batch import run_batch
+    from RunMe_API_STPD_ID import generate_dates
+    n = min(n, args.stpd_max_points)
+    frame = synthetic.deformation_frame(n, EPOCHS, rng)
+    ids = frame['ID'].tolist()
+    latitudes, longitudes = frame['lat'].to_numpy(), frame['lon'].to_numpy()
+    times = np.arange(EPOCHS) / 12
+    values = frame.iloc[:, 3:].to_numpy(dtype=float)
+    dates = generate_dates(5, 2011, EPOCHS)
+    output = os.path.join(workdir, f'stpd_{n}_turning_points.csv')
+
+    def run():
+        shutil.rmtree(output + '.parts', ignore_errors=True)
+        run_batch(ids, latitudes, longitudes, times, values, dates, output, workers=args.workers)
+    return run, n
+
+
+def setup_histogram(n, workdir, rng, args):
+    from TP_Aggregator import aggregate_files
+    path = _cached(os.path.join(workdir, f'turning_points_{n}.csv'),
+                   lambda p: synthetic.write_turning_points(p, n, rng))
+    return (lambda: aggregate_files({'Descending Orbit': path}, workers=args.workers)), n
+
+
+def setup_correlation(n, workdir, rng, args):
+    from Correlation_Engine import read_gpm_table, align_monthly, lagged_correlation
+    n = min(n, CORRELATION_MAX_CELLS)
+    path = _cached(os.path.join(workdir, f'gpm_{n}.csv'),
+                   lambda p: synthetic.write_gpm(p, synthetic.gpm_frame(GPM_MONTHS, n, rng)))
+    stations = synthetic.gpm_frame(GPM_MONTHS, GPM_STATIONS, rng)
+
+    def run():
+        _, S, G = align_monthly(stations, read_gpm_table(path))
+        return lagged_correlation(S, G, CORRELATION_LAGS)
+    return run, n
+
+
+STAGES = [
+    Stage('api_read', setup_api_read),
+    Stage('api', setup_api),
+    Stage('resample', setup_resample),
+    Stage('csv_load', setup_csv_load),
+    Stage('date_filter', setup_date_filter),
+    Stage('stpd_batch', setup_stpd_batch),
+    Stage('histogram', setup_histogram),
+    Stage('correlation', setup_correlation),
+]
+
+
+def measure(function, repeat):
+    """(best wall time in s, peak traced allocation in MB) of a function, its output silenced."""
+    best = np.inf
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def environment():
+    """Commit and versions the results were measured with."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suite(stages, scales, repeat=1, seed=0, args=None, workdir=None):
+    """Run every stage at every scale; returns a list of result dicts."""
+    results = []
+    own_dir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='stpd_bench_')
+    try:
+        for stage in stages:
+            for n in scales:
+                result = {'stage': stage.name, 'scale': n}
+                try:
+                    function, points = stage.setup(n, workdir, np.random.default_rng(seed), args)
+                except ImportError as error:
+                    result.update(status=f'skipped: {error}')
+                else:
+                    seconds, peak_mb = measure(function, repeat)
+                    result.update(status='ok', points=points, seconds=seconds, peak_mb=peak_mb,
+                                  points_per_s=points / seconds if seconds > 0 else None)
+                results.append(result)
+                print(format_result(result), flush=True)
+    finally:
+        if own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_result(result):
+    label = f"{result['stage']:<12}{result['scale']:>10}"
+    if result['status'] != 'ok':
+        return f"{label}  {result['status']}"
+    return f"{label}{result['points']:>10}{result['seconds']:>11.3f} s{result['peak_mb']:>10.1f} MB"
+
+
+def compare(results, baseline):
+    """Print time and memory ratios (current / baseline) of the cases present in both runs."""
+    old = {(r['stage'], r['scale']): r for r in baseline['results'] if r['status'] == 'ok'}
+    print(f"\nAgainst {baseline['environment'].get('commit')}:")
+    print(f"{'stage':<12}{'scale':>10}{'time':>10}{'memory':>10}")
+    for result in results:
+        before = old.get((result['stage'], result['scale']))
+        if result['status'] != 'ok' or before is None:
+            continue
+        time_ratio = result['seconds'] / before['seconds'] if before['seconds'] > 0 else np.nan
+        memory_ratio = result['peak_mb'] / before['peak_mb'] if before['peak_mb'] > 0 else np.nan
+        print(f"{result['stage']:<12}{result['scale']:>10}{time_ratio:>9.2f}x{memory_ratio:>9.2f}x")
+
+
+if __name__ == "__main__":
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument('--stages', nargs='+', choices=names, default=names)
+    parser.add_argument('--scales', type=int, nargs='+', default=[10**3, 10**4, 10**5],
+                        help="Points per case (10^6 runs take minutes and several GB)")
+    parser.add_argument('--repeat', type=int, default=1, help="Timed runs per case (best is kept)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes of the parallel stages")
+    parser.add_argument('--stpd-max-points', type=int, default=1000, help="Cap of the STPD batch scale")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Keep the synthetic inputs here (default: a temporary directory)")
+    parser.add_argument('--output', default='bench_results.json', help="Results JSON")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    stages = [stage for stage in STAGES if stage.name in args.stages]
+    print(f"{'stage':<12}{'scale':>10}{'points':>10}{'time':>13}{'peak':>13}")
+    results = run_suite(stages, args.scales, args.repeat, args.seed, args, args.workdir)
+
+    report = {'environment': environment(), 'settings': {'repeat': args.repeat, 'workers': args.workers,
+                                                         'seed': args.seed}, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,129 @@
+"""
+Synthetic inputs in the layouts read by the pipeline scripts.
+
+    precipitation   Pdata_<station>.txt: whitespace 'dd/mm/yyyy value', daily
+    deformation     ID,lat,lon,t1..tN CSV with decimal-year columns from 0
+    shapefile       point features with DYYYYMMDD attribute columns (needs geopandas)
+    gpm             headerless 'date,value' GPM.csv, or a wide date x cell grid with a header
+    turning points  *_filtered_turning_points.csv of STPD_Batch.py
+
+Every generator takes a numpy Generator so the data are reproducible, and
+values follow the rough shape of the real data (wet-day gamma rain, random-
+walk displacement, 'May-11' turning-point months).
+"""
+import os
+import numpy as np
+import pandas as pd
+
+# Scene extent of the synthetic points (degrees)
+LAT_RANGE = (41.9, 42.0)
+LON_RANGE = (14.9, 15.0)
+
+TP_COLUMNS = ['ID', 'Latitude', 'Longitude', 'Date (mm/yyyy)', 'Direction', 'NDRI', 'Slope']
+
+
+def coordinates(n_points, rng):
+    latitudes = LAT_RANGE[0] + rng.random(n_points) * (LAT_RANGE[1] - LAT_RANGE[0])
+    longitudes = LON_RANGE[0] + rng.random(n_points) * (LON_RANGE[1] - LON_RANGE[0])
+    return latitudes, longitudes
+
+
+def daily_rain(n_days, n_stations, rng, wet_fraction=0.3):
+    """(day x station) rain in mm with one decimal, dry days zero."""
+    wet = rng.random((n_days, n_stations)) < wet_fraction
+    return np.round(np.where(wet, rng.gamma(0.8, 8.0, size=wet.shape), 0.0), 1)
+
+
+def write_precipitation(path, rain, start='2011-01-01'):
+    """Write one gauge series as a whitespace 'dd/mm/yyyy value' file."""
+    dates = pd.date_range(start, periods=len(rain), freq='D')
+    frame = pd.DataFrame({'Date': dates.strftime('%d/%m/%Y'), 'Precipitation': rain})
+    frame.to_csv(path, sep=' ', header=False, index=False)
+    return path
+
+
+def write_precipitation_files(directory, n_days, n_stations, rng, start='2011-01-01'):
+    """Write Pdata_S<i>.txt gauge files; returns their paths."""
+    rain = daily_rain(n_days, n_stations, rng)
+    return [write_precipitation(os.path.join(directory, f"Pdata_S{i}.txt"), rain[:, i], start)
+            for i in range(n_stations)]
+
+
+def deformation_frame(n_points, n_epochs, rng, missing=0.01):
+    """ID,lat,lon,t1..tN frame of monthly random-walk displacement (mm), a share of values missing."""
+    times = np.arange(n_epochs) / 12
+    values = np.round(np.cumsum(rng.normal(0, 1.5, (n_points, n_epochs)), axis=1), 2)
+    values[rng.random(values.shape) < missing] = np.nan
+    latitudes, longitudes = coordinates(n_points, rng)
+    frame = pd.DataFrame(values, columns=[repr(float(t)) for t in times])
+    frame.insert(0, 'lon', longitudes)
+    frame.insert(0, 'lat', latitudes)
+    frame.insert(0, 'ID', np.arange(n_points).astype(str))
+    return frame
+
+
+def write_deformation_csv(path, n_points, n_epochs, rng):
+    deformation_frame(n_points, n_epochs, rng).to_csv(path, index=False)
+    return path
+
+
+def acquisition_dates(n_acquisitions, start='2016-01-03', revisit_days=12):
+    return pd.date_range(start, periods=n_acquisitions, freq=f'{revisit_days}D')
+
+
+def write_shapefile(path, n_points, n_acquisitions, rng):
+    """Point shapefile with ID and DYYYYMMDD columns, as read by Conversion_resample.py.
+
+    Shapefile attribute tables hold at most 255 fields, so n_acquisitions
+    must stay below that.
+    """
+    import geopandas as gpd
+    dates = acquisition_dates(n_acquisitions)
+    values = np.round(np.cumsum(rng.normal(0, 1.0, (n_points, n_acquisitions)), axis=1), 2)
+    latitudes, longitudes = coordinates(n_points, rng)
+    attributes = pd.DataFrame(values, columns=[f"D{d:%Y%m%d}" for d in dates])
+    attributes.insert(0, 'ID', np.arange(n_points))
+    gdf = gpd.GeoDataFrame(attributes, geometry=gpd.points_from_xy(longitudes, latitudes), crs='EPSG:4326')
+    gdf.to_file(path)
+    return path
+
+
+def gpm_frame(n_months, n_cells, rng, start='2011-01-01'):
+    """(month x cell) GPM monthly precipitation with a shared seasonal signal."""
+    months = pd.date_range(start, periods=n_months, freq='MS')
+    season = 4 + 3 * np.cos(2 * np.pi * (months.month.to_numpy() - 1) / 12)
+    values = np.maximum(season[:, None] + rng.normal(0, 1.5, (n_months, n_cells)), 0)
+    return pd.DataFrame(values, index=pd.Index(months, name='date'),
+                        columns=[f"c{i}" for i in range(n_cells)])
+
+
+def write_gpm(path, frame):
+    """Headerless two-column GPM.csv for one cell, a wide grid with a header row otherwise."""
+    if frame.shape[1] == 1:
+        frame.to_csv(path, header=False, date_format='%Y-%m-%d')
+    else:
+        frame.to_csv(path, date_format='%Y-%m-%d')
+    return path
+
+
+def turning_point_frame(n_rows, rng, start='2011-05', n_months=140, missing=0.01):
+    """Turning-point table rows with 'May-11' dates; a share of rows has no turning point (blank fields)."""
+    months = pd.period_range(start, periods=n_months, freq='M').strftime('%b-%y').to_numpy()
+    latitudes, longitudes = coordinates(n_rows, rng)
+    frame = pd.DataFrame({
+        'ID': rng.integers(0, 10**6, n_rows).astype(float),
+        'Latitude': latitudes,
+        'Longitude': longitudes,
+        'Date (mm/yyyy)': months[rng.integers(0, n_months, n_rows)],
+        'Direction': np.round(rng.normal(0, 6, n_rows), 2),
+        'NDRI': rng.random(n_rows),
+        'Slope': np.round(rng.normal(0, 2, n_rows), 3),
+    }, columns=TP_COLUMNS)
+    blank = rng.random(n_rows) < missing
+    frame.loc[blank, ['ID', 'Date (mm/yyyy)', 'Direction', 'Slope']] = np.nan
+    return frame
+
+
+def write_turning_points(path, n_rows, rng):
+    turning_point_frame(n_rows, rng).to_csv(path, index=False)
+    return path
@@ -0,0 +1,79 @@
+"""API_Engine: the linear-filter API against the original row-by-row recursion, and the k sweep."""
+import numpy as np
+import pandas as pd
+import pytest
+from API_Engine import compute_api, compute_api_frame, compute_api_sweep, api_sweep_summary
+
+
+def original_loop(precipitation, k):
+    """API[0] = 0, then API[i] = P[i] + k * API[i-1], as API_Calculation.py did with iloc."""
+    api = np.zeros(len(precipitation))
+    for i in range(1, len(precipitation)):
+        api[i] = precipitation[i] + k * api[i - 1]
+    return api
+
+
+def rain(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random(shape) < 0.3, rng.gamma(0.8, 12.0, shape), 0.0)
+
+
+@pytest.mark.parametrize('k', [0.5, 0.85, 0.99])
+def test_filter_equals_loop(k):
+    P = rain(3000)
+    np.testing.assert_array_equal(compute_api(P, k), original_loop(P, k))
+
+
+def test_stations_are_filtered_independently():
+    P = rain((1000, 4), seed=1)
+    api = compute_api(P, 0.85)
+    for s in range(P.shape[1]):
+        np.testing.assert_array_equal(api[:, s], original_loop(P[:, s], 0.85))
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_short_series(n):
+    P = rain(n)
+    np.testing.assert_array_equal(compute_api(P, 0.85), original_loop(P, 0.85))
+
+
+def test_frame_fills_missing_days_as_dry():
+    P = rain((200, 2), seed=2)
+    P[[10, 50], 0] = np.nan
+    frame = pd.DataFrame(P, columns=['A', 'B'])
+    api = compute_api_frame(frame, 0.85)
+    np.testing.assert_array_equal(api['A'].to_numpy(), original_loop(np.nan_to_num(P[:, 0]), 0.85))
+    assert list(api.columns) == ['A', 'B']
+
+
+K_GRID = [0.5, 0.8, 0.85, 0.9, 0.99]
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 1000, 1025])
+def test_prefix_scan_sweep_matches_compute_api(n):
+    P = rain(n, seed=3)
+    api = compute_api_sweep(P, K_GRID)
+    assert api.shape == (n, len(K_GRID))
+    for j, k in enumerate(K_GRID):
+        np.testing.assert_allclose(api[:, j], compute_api(P, k), rtol=1e-12, atol=1e-9)
+
+
+def test_sweep_of_stations_adds_a_k_axis():
+    P = rain((500, 3), seed=4)
+    api = compute_api_sweep(P, K_GRID)
+    assert api.shape == (500, 3, len(K_GRID))
+    for j, k in enumerate(K_GRID):
+        np.testing.assert_allclose(api[..., j], compute_api(P, k), rtol=1e-12, atol=1e-9)
+
+
+def test_sweep_summary_counts_exceedances():
+    dates = pd.date_range('2011-01-01', periods=730, freq='D')
+    P = rain(len(dates), seed=5)
+    summary = api_sweep_summary(dates, P, K_GRID, [20, 60])
+    for j, k in enumerate(K_GRID):
+        daily = pd.Series(compute_api(P, k), index=dates)
+        monthly = daily.groupby(daily.index.to_period('M')).mean()
+        np.testing.assert_allclose(summary['monthly_mean'][:, j], monthly.to_numpy(), rtol=1e-12)
+        for t, threshold in enumerate([20, 60]):
+            assert summary['exceedance_days'][j, t] == (daily > threshold).sum()
+            assert summary['exceedance_months'][j, t] == (monthly > threshold).sum()
@@ -0,0 +1,114 @@
+"""API_Incremental: appended rows and resumed runs against a full recompute."""
+import numpy as np
+import pandas as pd
+from API_Engine import compute_api
+from API_Incremental import update, load_state
+
+
+def write_rows(path, dates, values, mode='w'):
+    with open(path, mode) as f:
+        for date, value in zip(dates, values):
+            f.write(f"{date:%d/%m/%Y} {value}\n")
+
+
+def rain(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.round(np.where(rng.random(n) < 0.3, rng.gamma(0.8, 12.0, n), 0.0), 1)
+
+
+def full_monthly_mean(dates, values, k=0.85):
+    """Monthly mean API of the whole series, as API_Calculation.py computes it."""
+    api = pd.Series(compute_api(np.asarray(values, dtype=float), k), index=pd.DatetimeIndex(dates))
+    return api.resample('ME').mean()
+
+
+def read_output(path):
+    output = pd.read_csv(path, parse_dates=['Date'])
+    return output.set_index('Date')['API']
+
+
+def check_output(path, dates, values):
+    output = read_output(path)
+    expected = full_monthly_mean(dates, values)
+    assert list(output.index) == list(expected.index)
+    np.testing.assert_allclose(output.to_numpy(), expected.to_numpy(), rtol=1e-12, equal_nan=True)
+
+
+def test_first_run_equals_full_compute(tmp_path):
+    dates = pd.date_range('2011-01-01', periods=400, freq='D')
+    values = rain(len(dates))
+    source, output, state = (str(tmp_path / name) for name in ('P.txt', 'API.csv', 'P.json'))
+    write_rows(source, dates, values)
+
+    rows, _ = update(source, output, state)
+    assert rows == len(dates)
+    check_output(output, dates, values)
+
+
+def test_appends_equal_full_compute(tmp_path):
+    dates = pd.date_range('2011-01-01', periods=900, freq='D')
+    values = rain(len(dates), seed=1)
+    source, output, state = (str(tmp_path / name) for name in ('P.txt', 'API.csv', 'P.json'))
+
+    # Appends inside a month, across month ends and one spanning several months
+    cuts = [0, 300, 310, 334, 335, 500, 899, 900]
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        write_rows(source, dates[a:b], values[a:b], mode='w' if a == 0 else 'a')
+        rows, saved = update(source, output, state)
+        assert rows == b - a
+        check_output(output, dates[:b], values[:b])
+
+    assert load_state(state)['last_date'] == f"{dates[-1]:%Y-%m-%d}"
+    assert update(source, output, state)[0] == 0
+
+
+def test_gap_months_get_empty_rows(tmp_path):
+    dates = pd.DatetimeIndex(list(pd.date_range('2011-01-01', '2011-02-10')) +
+                             list(pd.date_range('2011-06-01', '2011-06-20')))
+    values = rain(len(dates), seed=2)
+    source, output, state = (str(tmp_path / name) for name in ('P.txt', 'API.csv', 'P.json'))
+    write_rows(source, dates[:30], values[:30])
+    update(source, output, state)
+    write_rows(source, dates[30:], values[30:], mode='a')
+    update(source, output, state)
+
+    output_api = read_output(output)
+    assert len(output_api) == 6
+    assert output_api.isna().sum() == 3
+    # The API keeps decaying through the gap, so only compare the months with data
+    api = compute_api(values.astype(float), 0.85)
+    expected = pd.Series(api, index=dates).resample('ME').mean().dropna()
+    np.testing.assert_allclose(output_api.dropna().to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+
+def test_partial_last_line_waits_for_its_newline(tmp_path):
+    dates = pd.date_range('2011-01-01', periods=60, freq='D')
+    values = rain(len(dates), seed=3)
+    source, output, state = (str(tmp_path / name) for name in ('P.txt', 'API.csv', 'P.json'))
+    write_rows(source, dates[:40], values[:40])
+    update(source, output, state)
+
+    with open(source, 'a') as f:
+        f.write(f"{dates[40]:%d/%m/%Y} ")
+    assert update(source, output, state)[0] == 0
+    with open(source, 'a') as f:
+        f.write(f"{values[40]}\n")
+    write_rows(source, dates[41:], values[41:], mode='a')
+
+    assert update(source, output, state)[0] == 20
+    check_output(output, dates, values)
+
+
+def test_changed_parameters_or_truncated_source_rebuild(tmp_path):
+    dates = pd.date_range('2011-01-01', periods=200, freq='D')
+    values = rain(len(dates), seed=4)
+    source, output, state = (str(tmp_path / name) for name in ('P.txt', 'API.csv', 'P.json'))
+    write_rows(source, dates, values)
+    update(source, output, state)
+
+    assert update(source, output, state, k=0.9)[0] == len(dates)
+    assert load_state(state)['k'] == 0.9
+
+    write_rows(source, dates[:100], values[:100])
+    assert update(source, output, state)[0] == 100
+    check_output(output, dates[:100], values[:100])
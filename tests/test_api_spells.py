@@ -0,0 +1,114 @@
+"""API_Spells: run-length spell extraction and spell lookup against plain Python loops."""
+import numpy as np
+import pandas as pd
+import pytest
+from API_Engine import compute_api
+from API_Spells import SPELL_COLUMNS, run_bounds, extract_spells, spells_from_frame, spell_index
+
+
+def loop_spells(dates, api, threshold, station, inclusive=False, min_duration=1):
+    """Spells of one series by walking it sample by sample."""
+    rows, run = [], []
+
+    def close():
+        if len(run) >= min_duration:
+            values = [api[i] for i in run]
+            peak = max(values)
+            rows.append((station, dates[run[0]], dates[run[-1]], len(run), peak,
+                         dates[run[values.index(peak)]], sum(v - threshold for v in values)))
+
+    for i, value in enumerate(api):
+        if not np.isnan(value) and (value >= threshold if inclusive else value > threshold):
+            run.append(i)
+        else:
+            close()
+            run = []
+    close()
+    return rows
+
+
+def daily_api(n_days, n_stations, seed=0):
+    rng = np.random.default_rng(seed)
+    rain = np.where(rng.random((n_days, n_stations)) < 0.3, rng.gamma(0.8, 14.0, (n_days, n_stations)), 0.0)
+    api = compute_api(rain, 0.85)
+    api[rng.random(api.shape) < 0.01] = np.nan
+    return pd.date_range('2011-01-01', periods=n_days, freq='D'), api
+
+
+def check_against_loop(spells, dates, api, threshold, stations, **options):
+    expected = [row for s, station in enumerate(stations)
+                for row in loop_spells(dates, api[:, s], threshold, station, **options)]
+    assert len(spells) == len(expected)
+    if not expected:
+        return
+    expected = pd.DataFrame(expected, columns=SPELL_COLUMNS)
+    for col in ('Station', 'Start', 'End', 'Duration', 'Peak', 'Peak_Date'):
+        assert spells[col].tolist() == expected[col].tolist()
+    np.testing.assert_allclose(spells['Excess'], expected['Excess'], rtol=1e-9)
+
+
+@pytest.mark.parametrize('inclusive', [False, True])
+@pytest.mark.parametrize('min_duration', [1, 3])
+def test_spells_equal_loop(inclusive, min_duration):
+    dates, api = daily_api(2000, 4)
+    threshold = 40.0
+    api[100:110, 1] = threshold   # Only high with inclusive
+    api[-5:, 2] = threshold + 1   # Spell running to the last sample
+    stations = np.array(['A', 'B', 'C', 'D'])
+    spells = extract_spells(dates, api, threshold, stations=stations, inclusive=inclusive,
+                            min_duration=min_duration)
+    check_against_loop(spells, dates, api, threshold, stations, inclusive=inclusive, min_duration=min_duration)
+
+
+def test_one_series_and_frame_input():
+    dates, api = daily_api(800, 2, seed=1)
+    spells = extract_spells(dates, api[:, 0], 30.0, stations=['Petacciato'])
+    check_against_loop(spells, dates, api[:, :1], 30.0, ['Petacciato'])
+
+    frame = pd.DataFrame(api, index=dates, columns=['Petacciato', 'Termoli'])
+    check_against_loop(spells_from_frame(frame, 30.0), dates, api, 30.0, ['Petacciato', 'Termoli'])
+
+
+def test_no_spells():
+    dates, api = daily_api(100, 2, seed=2)
+    spells = extract_spells(dates, api, 1e6)
+    assert list(spells.columns) == SPELL_COLUMNS
+    assert len(spells) == 0
+
+
+def test_run_bounds_equal_loop():
+    mask = np.random.default_rng(3).random((50, 3)) < 0.5
+    expected = []
+    for s in range(3):
+        start = None
+        for t, high in enumerate(list(mask[:, s]) + [False]):
+            if high and start is None:
+                start = t
+            elif not high and start is not None:
+                expected.append((s, start, t))
+                start = None
+    station, start, stop = run_bounds(mask)
+    assert list(zip(station.tolist(), start.tolist(), stop.tolist())) == expected
+
+
+@pytest.mark.parametrize('freq', [None, 'M'])
+def test_spell_index_equals_loop(freq):
+    dates, api = daily_api(1500, 3, seed=4)
+    stations = np.array(['A', 'B', 'C'])
+    spells = extract_spells(dates, api, 35.0, stations=stations)
+
+    rng = np.random.default_rng(5)
+    query_dates = np.array(dates[rng.integers(0, len(dates), 400)])
+    query_dates[:3] = np.datetime64('NaT')
+    query_stations = stations[rng.integers(0, 3, 400)]
+    rows = spell_index(spells, query_dates, query_stations, freq=freq)
+
+    def month(d):
+        return d.astype('datetime64[M]') if freq == 'M' else d
+
+    spell_stations = spells['Station'].to_numpy()
+    starts, ends = month(spells['Start'].to_numpy()), month(spells['End'].to_numpy())
+    for row, date, station in zip(rows, query_dates, query_stations):
+        matches = np.flatnonzero((spell_stations == station) & (starts <= month(date)) & (month(date) <= ends))
+        # By month, a date can fall in several spells of one station
+        assert (row in matches) if len(matches) else row == -1
@@ -0,0 +1,91 @@
+"""Conversion_resample: chunked monthly means against the original resample('M').mean() script."""
+import numpy as np
+import pandas as pd
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+from Conversion_resample import convert, month_layout
+from Deformation_Stack import load_stack
+
+
+def original_resample(gdf):
+    """Monthly means with decimal-year columns, as the original script computed them."""
+    time_series_cols = [col for col in gdf.columns if col.startswith('D')]
+    time_series_df = gdf[time_series_cols].transpose()
+    time_series_df.index = pd.to_datetime(time_series_df.index, format='D%Y%m%d')
+    monthly_resampled = time_series_df.resample('ME').mean().transpose()
+    first_date = monthly_resampled.columns[0]
+    monthly_resampled.columns = [(date.year - first_date.year) + (date.month - first_date.month) / 12
+                                 for date in monthly_resampled.columns]
+    return pd.concat([gdf.drop(columns=time_series_cols), monthly_resampled], axis=1)
+
+
+def shapefile(path, n_points=23, seed=0):
+    """Points with irregular acquisitions, a month without any and missing values."""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2016-11-03', '2018-02-20', freq='6D')
+    days = days[(days.year != 2017) | (days.month != 3)]
+    values = rng.normal(0, 5, (n_points, len(days)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[4, :12] = np.nan
+
+    gdf = gpd.GeoDataFrame(
+        {'CODE': [f"PS{i:03d}" for i in range(n_points)],
+         'VEL': rng.normal(0, 2, n_points),
+         # Empty in the first chunk of seven features
+         'NOTE': [None] * 10 + ['checked'] * (n_points - 10)},
+        geometry=gpd.points_from_xy(14.9 + rng.random(n_points) / 10, 41.9 + rng.random(n_points) / 10),
+        crs='EPSG:4326')
+    series = pd.DataFrame(values, columns=[f"D{day:%Y%m%d}" for day in days])
+    pd.concat([gdf, series], axis=1).to_file(path)
+    return gpd.read_file(path)
+
+
+def test_month_layout_covers_every_month():
+    columns = ['CODE', 'D20161103', 'D20161130', 'D20170215', 'D20170301', 'geometry']
+    time_series_cols, indicator, decimal_years = month_layout(columns)
+    assert time_series_cols == columns[1:5]
+    assert indicator.shape == (4, 5)
+    assert indicator.argmax(axis=1).tolist() == [0, 0, 3, 4]
+    np.testing.assert_allclose(decimal_years, [0, 1 / 12, 2 / 12, 3 / 12, 4 / 12])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_csv_equals_original(tmp_path, workers):
+    gdf = shapefile(str(tmp_path / 'ASC.shp'))
+    expected = original_resample(gdf)
+    output_path = str(tmp_path / 'ASC.csv')
+
+    assert convert(str(tmp_path / 'ASC.shp'), output_path, chunk_size=7, workers=workers) == len(gdf)
+
+    output = pd.read_csv(output_path)
+    assert list(output.columns) == [str(col) for col in expected.columns]
+    assert list(output['CODE']) == list(expected['CODE'])
+    years = [col for col in expected.columns if isinstance(col, float)]
+    np.testing.assert_allclose(output[[str(year) for year in years]].to_numpy(),
+                               expected[years].to_numpy(dtype=float), rtol=1e-12, equal_nan=True)
+
+
+def test_parquet_and_stack_equal_original(tmp_path):
+    gdf = shapefile(str(tmp_path / 'ASC.shp'), seed=1)
+    expected = original_resample(gdf)
+    years = [col for col in expected.columns if isinstance(col, float)]
+    monthly = expected[years].to_numpy(dtype=float)
+
+    parquet_path = str(tmp_path / 'ASC.parquet')
+    convert(str(tmp_path / 'ASC.shp'), parquet_path, chunk_size=7, workers=1, output_format='parquet',
+            dtype='float64')
+    table = pd.read_parquet(parquet_path)
+    np.testing.assert_allclose(table[[str(year) for year in years]].to_numpy(), monthly, rtol=1e-12,
+                               equal_nan=True)
+    assert table['NOTE'].isna().sum() == 10
+    np.testing.assert_allclose(table['lat'], gdf.geometry.y)
+
+    stack_path = str(tmp_path / 'ASC.stack')
+    convert(str(tmp_path / 'ASC.shp'), stack_path, chunk_size=7, workers=1, output_format='stack')
+    stack = load_stack(stack_path)
+    assert list(stack.ids) == list(gdf['CODE'])
+    np.testing.assert_allclose(stack.times, years)
+    np.testing.assert_allclose(stack.latitudes, gdf.geometry.y)
+    np.testing.assert_allclose(stack.longitudes, gdf.geometry.x)
+    np.testing.assert_allclose(stack.values, monthly, rtol=1e-6, atol=1e-6, equal_nan=True)
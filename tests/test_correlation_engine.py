@@ -0,0 +1,106 @@
+"""Correlation_Engine: batched lagged correlations against Series.corr of shifted series."""
+import numpy as np
+import pandas as pd
+import pytest
+from Correlation_Engine import (station_monthly_table, read_gpm_table, align_monthly, lagged_correlation,
+                                best_lag_summary)
+
+
+def series_corr(x, y, lag, min_periods):
+    """Series.corr of the gauge at month t and GPM at month t + lag, pairwise-complete."""
+    x, y = pd.Series(x), pd.Series(y).shift(-lag)
+    n = int((x.notna() & y.notna()).sum())
+    return x.corr(y) if n >= min_periods else np.nan, n
+
+
+def monthly(n_months, n_series, seed=0, gaps=0.1):
+    rng = np.random.default_rng(seed)
+    base = rng.gamma(2.0, 30.0, (n_months, 1))
+    X = base + rng.normal(0, 20, (n_months, n_series))
+    X[rng.random(X.shape) < gaps] = np.nan
+    return X
+
+
+@pytest.mark.parametrize('gaps', [0.0, 0.15])
+def test_lagged_correlation_equals_series_corr(gaps):
+    S, G = monthly(60, 3, seed=1, gaps=gaps), monthly(60, 7, seed=1, gaps=gaps)
+    G[:, 2] = np.nan
+    G[:57, 3] = np.nan   # Too few pairs for min_periods at any lag
+    lags = [-3, -1, 0, 2, 5]
+    r, counts = lagged_correlation(S, G, lags, min_periods=5, block_size=3)
+
+    assert r.shape == counts.shape == (3, 7, 5)
+    for s in range(3):
+        for c in range(7):
+            for j, lag in enumerate(lags):
+                expected, n = series_corr(S[:, s], G[:, c], lag, 5)
+                assert counts[s, c, j] == n
+                np.testing.assert_allclose(r[s, c, j], expected, rtol=1e-5, atol=1e-6)
+
+
+def test_lag_beyond_the_series_is_empty():
+    r, counts = lagged_correlation(monthly(10, 2), monthly(10, 2), [12, -12])
+    assert np.isnan(r).all() and (counts == 0).all()
+
+
+def test_pearson_script_correlation(tmp_path):
+    """Lag 0 of one gauge against the headerless GPM.csv, as Pearson_Correlation_Precipitation_data.py computes it."""
+    rng = np.random.default_rng(2)
+    days = pd.date_range('2010-06-01', '2013-12-31', freq='D')
+    rain = np.round(rng.gamma(0.5, 8.0, len(days)), 1)
+    gauge_path = str(tmp_path / 'Pdata_Petacciato.txt')
+    with open(gauge_path, 'w') as f:
+        for day, value in zip(days, rain):
+            f.write(f"{day:%d/%m/%Y} {value}\n")
+
+    months = pd.date_range('2011-03-01', '2014-06-01', freq='MS')
+    gpm_values = rng.gamma(2.0, 40.0, len(months))
+    gpm_path = str(tmp_path / 'GPM.csv')
+    pd.DataFrame({'date': months.strftime('%Y-%m-%d'), 'p': gpm_values}).to_csv(gpm_path, header=False, index=False)
+
+    # The original script
+    pdata = pd.read_csv(gauge_path, sep=r'\s+', header=None, names=['Date', 'Precipitation'])
+    pdata['Date'] = pd.to_datetime(pdata['Date'], format='%d/%m/%Y')
+    pdata = pdata[(pdata['Date'] >= '2011-01-01') & (pdata['Date'] <= '2022-12-31')].set_index('Date')
+    gpm = pd.read_csv(gpm_path, header=None, names=['date', 'mean_precipitation'])
+    gpm['date'] = pd.to_datetime(gpm['date'])
+    merged = pdata.resample('MS').mean().join(gpm.set_index('date'), how='inner').dropna()
+    expected = merged['Precipitation'].corr(merged['mean_precipitation'])
+
+    stations = station_monthly_table([gauge_path])
+    gpm_table = read_gpm_table(gpm_path)
+    assert list(stations.columns) == ['Petacciato']
+    assert list(gpm_table.columns) == ['mean_precipitation']
+    _, station_matrix, gpm_matrix = align_monthly(stations, gpm_table)
+    r, counts = lagged_correlation(station_matrix, gpm_matrix, [0])
+    assert counts[0, 0, 0] == len(merged)
+    np.testing.assert_allclose(r[0, 0, 0], expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize('header', [True, False])
+def test_wide_gpm_table(tmp_path, header):
+    months = pd.date_range('2015-01-01', periods=12, freq='MS')
+    values = np.arange(36, dtype=float).reshape(12, 3)
+    table = pd.DataFrame(values, columns=['c7', 'c8', 'c9'])
+    table.insert(0, 'date', months.strftime('%Y-%m-%d'))
+    path = str(tmp_path / 'GPM_grid.csv')
+    table.to_csv(path, header=header, index=False)
+
+    gpm = read_gpm_table(path)
+    assert list(gpm.columns) == (['c7', 'c8', 'c9'] if header else ['cell_1', 'cell_2', 'cell_3'])
+    assert (gpm.index == months).all()
+    np.testing.assert_array_equal(gpm.to_numpy(), values)
+
+
+def test_best_lag_summary():
+    lags = [-1, 0, 1]
+    r = np.array([[[0.1, 0.5, 0.3], [np.nan, np.nan, np.nan]],
+                  [[0.2, 0.1, 0.9], [0.4, np.nan, 0.0]]], dtype=np.float32)
+    counts = np.full(r.shape, 10, dtype=np.int32)
+    summary = best_lag_summary(r, counts, lags, ['A', 'B'], ['g1', 'g2'])
+
+    assert list(zip(summary['Station'], summary['Cell'])) == [('A', 'g1'), ('A', 'g2'), ('B', 'g1'), ('B', 'g2')]
+    np.testing.assert_array_equal(summary['Best_Lag'], [0, np.nan, 1, -1])
+    np.testing.assert_allclose(summary['r_best'], [0.5, np.nan, 0.9, 0.4])
+    np.testing.assert_allclose(summary['r_lag0'], [0.5, np.nan, 0.1, np.nan])
+    assert list(best_lag_summary(r, counts, lags, ['A', 'B'], ['g1', 'g2'], top=1)['Cell']) == ['g1', 'g1']
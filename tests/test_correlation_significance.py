@@ -0,0 +1,102 @@
+"""Correlation_Significance: bulk resamples against per-resample np.corrcoef loops."""
+import numpy as np
+import pandas as pd
+from Correlation_Significance import (pair_matrices, group_pairs, bootstrap_block, permutation_block,
+                                      correlation_significance, PERMUTATION_CHUNK)
+
+
+def corrcoef(x, y):
+    return np.corrcoef(x, y)[0, 1]
+
+
+def paired(n_months, n_stations, seed=0, gaps=0.1):
+    rng = np.random.default_rng(seed)
+    x = rng.gamma(2.0, 30.0, (n_months, n_stations))
+    y = 0.6 * x + rng.normal(0, 25, x.shape)
+    x[rng.random(x.shape) < gaps] = np.nan
+    y[rng.random(y.shape) < gaps] = np.nan
+    return x, y
+
+
+def test_observed_r_equals_corrcoef():
+    x, y = paired(80, 6)
+    x[:, 4] = 12.5           # Constant gauge
+    y[:78, 5] = np.nan       # Fewer than 3 complete months
+    result = correlation_significance(x, y, n_resamples=50, workers=1)
+
+    for j in range(4):
+        valid = ~np.isnan(x[:, j]) & ~np.isnan(y[:, j])
+        assert result.n[j] == valid.sum()
+        np.testing.assert_allclose(result.r[j], corrcoef(x[valid, j], y[valid, j]), rtol=1e-12)
+    for j in (4, 5):
+        assert np.isnan([result.r[j], result.ci_low[j], result.ci_high[j], result.p_value[j]]).all()
+
+
+def test_bootstrap_block_equals_loop():
+    x, y = paired(40, 3, seed=1, gaps=0.0)
+    (_, X, Y), = group_pairs(x, y)
+    boot = bootstrap_block(np.random.default_rng(5), X, Y, 20)
+
+    draws = np.random.default_rng(5).integers(0, len(X), size=(20, len(X)))
+    for b in range(20):
+        for k in range(3):
+            np.testing.assert_allclose(boot[b, k], corrcoef(X[draws[b], k], Y[draws[b], k]), rtol=1e-9)
+
+
+def test_permutation_block_equals_loop():
+    x, y = paired(30, 3, seed=2, gaps=0.0)
+    x[:, 2] = np.random.default_rng(3).normal(size=30)   # Uncorrelated pair
+    (_, X, Y), = group_pairs(x, y)
+    r_observed = (X * Y).mean(axis=0)
+    n_resamples = PERMUTATION_CHUNK + 9
+    exceed = permutation_block(np.random.default_rng(7), X, Y, r_observed, n_resamples)
+
+    rng = np.random.default_rng(7)
+    expected = np.zeros(3, dtype=int)
+    for start in range(0, n_resamples, PERMUTATION_CHUNK):
+        size = min(PERMUTATION_CHUNK, n_resamples - start)
+        for permutation in np.argsort(rng.random((size, len(X))), axis=1):
+            for k in range(3):
+                expected[k] += abs(corrcoef(X[:, k], Y[permutation, k])) >= abs(r_observed[k]) - 1e-12
+    assert exceed.tolist() == expected.tolist()
+    assert 0 < exceed[2] < n_resamples
+
+
+def test_results_do_not_depend_on_workers():
+    x, y = paired(60, 5, seed=4)
+    one = correlation_significance(x, y, n_resamples=300, block_size=50, workers=1)
+    pool = correlation_significance(x, y, n_resamples=300, block_size=50, workers=3)
+    for a, b in zip(one, pool):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_interval_and_p_value():
+    x, y = paired(120, 2, seed=5, gaps=0.0)
+    y[:, 1] = np.random.default_rng(6).normal(size=120)
+    result = correlation_significance(x, y, n_resamples=2000, workers=1)
+
+    assert result.bootstrap.shape == (2000, 2)
+    assert (result.ci_low < result.r).all() and (result.r < result.ci_high).all()
+    assert result.p_value[0] == 1 / 2001
+    assert result.p_value[1] > 0.01
+
+
+def test_pair_matrices_follow_the_summary():
+    months = pd.date_range('2015-01-01', periods=24, freq='MS')
+    rng = np.random.default_rng(8)
+    stations = pd.DataFrame(rng.random((24, 3)), index=months, columns=['A', 'B', 'C'])
+    gpm = pd.DataFrame(rng.random((24, 2)), index=months, columns=['g1', 'g2'])
+    summary = pd.DataFrame({'Station': ['A', 'A', 'B'], 'Cell': ['g2', 'g1', 'g1'],
+                            'Best_Lag': [2, 0, -1], 'r_best': [0.9, 0.5, 0.4]})
+
+    cells, lags, x, y = pair_matrices(stations, gpm, summary)
+    assert cells == ['g2', 'g1', None]
+    assert lags == [2, -1, None]
+    np.testing.assert_array_equal(x, stations.to_numpy())
+    np.testing.assert_array_equal(y[:, 0], gpm['g2'].shift(-2).to_numpy())
+    np.testing.assert_array_equal(y[:, 1], gpm['g1'].shift(1).to_numpy())
+    assert np.isnan(y[:, 2]).all()
+
+    cells, lags, _, y = pair_matrices(stations, gpm)
+    assert cells == ['g1'] * 3 and lags == [0] * 3
+    np.testing.assert_array_equal(y, np.repeat(gpm[['g1']].to_numpy(), 3, axis=1))
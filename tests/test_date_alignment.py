@@ -0,0 +1,53 @@
+"""Date_Alignment: sorted search against the O(N * M) min() scan of filter_api_dates."""
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from Date_Alignment import nearest_index, match_within, window_bounds
+
+
+def original_filter(api_dates, deformation_dates, threshold_days=30):
+    """Indices of the API dates kept by the original filter_api_dates loop."""
+    kept = []
+    for i, api_date in enumerate(api_dates):
+        closest = min(deformation_dates, key=lambda d: abs(d - api_date))
+        if abs((closest - api_date).days) <= threshold_days:
+            kept.append(i)
+    return kept
+
+
+def random_dates(n, seed, hours=False):
+    rng = np.random.default_rng(seed)
+    start = datetime(2011, 1, 1)
+    offsets = rng.integers(0, 12 * 365 * (24 if hours else 1), n)
+    return [start + (timedelta(hours=int(o)) if hours else timedelta(days=int(o))) for o in offsets]
+
+
+@pytest.mark.parametrize('hours', [False, True])
+@pytest.mark.parametrize('threshold_days', [0, 5, 30])
+def test_match_within_equals_min_scan(hours, threshold_days):
+    api_dates = sorted(random_dates(400, seed=1, hours=hours))
+    # Unsorted, sparser deformation dates, with gaps wider than the threshold
+    deformation_dates = random_dates(60, seed=2, hours=hours)
+
+    keep, index = match_within(api_dates, deformation_dates, threshold_days)
+
+    assert keep.tolist() == original_filter(api_dates, deformation_dates, threshold_days)
+    for i, j in zip(keep, index):
+        best = min(abs(d - api_dates[i]) for d in deformation_dates)
+        assert abs(deformation_dates[j] - api_dates[i]) == best
+
+
+def test_ties_go_to_the_earlier_date():
+    targets = [datetime(2020, 1, 11), datetime(2020, 1, 1)]
+    index, offset = nearest_index([datetime(2020, 1, 6)], targets)
+    assert index.tolist() == [1]
+    assert offset[0] == np.timedelta64(5, 'D')
+
+
+def test_window_bounds_equal_brute_force():
+    source = np.array(sorted(random_dates(300, seed=3)), dtype='datetime64[ns]')
+    target = np.array(random_dates(40, seed=4), dtype='datetime64[ns]')
+    start, stop = window_bounds(source, target, threshold_days=30)
+    for t, a, b in zip(target, start, stop):
+        inside = np.flatnonzero(np.abs(source - t) <= np.timedelta64(30, 'D'))
+        assert list(range(a, b)) == inside.tolist()
@@ -0,0 +1,67 @@
+"""Date_Parser: format detection and parsing against pd.to_datetime."""
+import numpy as np
+import pandas as pd
+import pytest
+from Date_Parser import parse_dates, detect_format, fix_century, parse_date
+
+
+def test_ambiguous_dates_are_month_first_like_pandas():
+    strings = ['1/1/2011', '2/1/2011', '3/1/2011', '12/1/2011']
+    parsed = parse_dates(strings)
+    expected = pd.DatetimeIndex([pd.to_datetime(s) for s in strings])
+    assert (parsed == expected).all()
+    assert list(parsed.month) == [1, 2, 3, 12]
+
+
+def test_day_first_when_a_day_is_above_12():
+    strings = ['1/2/2011', '13/2/2011', '28/2/2011']
+    parsed = parse_dates(strings)
+    assert detect_format(strings) == '%d/%m/%Y'
+    assert list(parsed.day) == [1, 13, 28]
+    assert list(parsed.month) == [2, 2, 2]
+
+
+def test_day_first_table_does_not_leak_to_the_next_one():
+    parse_dates(['13/1/2011', '14/1/2011'])
+    parsed = parse_dates(['1/2/2011', '1/3/2011'])
+    assert list(parsed.month) == [1, 1]
+    assert list(parsed.day) == [2, 3]
+
+
+@pytest.mark.parametrize('strings', [
+    ['2011-01-31', '2011-02-28', '2011-03-31'],
+    ['2011-01-31 00:00:00', '2011-02-28 12:30:00'],
+    ['1/31/2011', '2/28/2011', '3/31/2011'],
+    ['2011-01', '2011-02'],
+])
+def test_matches_pd_to_datetime(strings):
+    parsed = parse_dates(strings)
+    expected = pd.DatetimeIndex([pd.to_datetime(s) for s in strings])
+    assert (parsed == expected).all()
+
+
+def test_repeated_values_missing_and_index_are_kept():
+    values = pd.Series(['1/31/2011', None, '1/31/2011', 'junk', '2/28/2011'], index=[10, 11, 12, 13, 14],
+                       name='date')
+    parsed = parse_dates(values)
+    assert list(parsed.index) == [10, 11, 12, 13, 14]
+    assert parsed.name == 'date'
+    assert parsed[10] == parsed[12] == pd.Timestamp('2011-01-31')
+    assert pd.isna(parsed[11]) and pd.isna(parsed[13])
+
+
+def test_explicit_format_wins():
+    parsed = parse_dates(['1/2/2011', '3/2/2011'], formats=['%d/%m/%Y'])
+    assert list(parsed.month) == [2, 2]
+
+
+def test_two_digit_years_are_moved_to_the_2000s():
+    parsed = parse_dates(['Jan-15', 'Dec-99'], formats=['%b-%y'], min_year=2000)
+    assert list(parsed.year) == [2015, 2099]
+    moved = fix_century(np.array(['1969-03-15T06:00'], dtype='datetime64[ns]'))
+    assert moved[0] == np.datetime64('2069-03-15T06:00', 'ns')
+
+
+def test_parse_date():
+    assert parse_date('02/01/2011').month == 2
+    assert parse_date('13/01/2011') is None
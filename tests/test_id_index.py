@@ -0,0 +1,71 @@
+"""ID_Index: FNV-1a hashing and the open-addressing table against a dict."""
+import os
+import numpy as np
+from ID_Index import (hash_ids, build_index, open_index, lookup, IDIndex, open_row_index, find_row,
+                      read_csv_row)
+
+
+def fnv1a(text):
+    """Scalar 64-bit FNV-1a of the UTF-8 bytes (0 mapped to 1, like hash_ids)."""
+    h = 0xcbf29ce484222325
+    for byte in text.encode('utf-8'):
+        h = ((h ^ byte) * 0x100000001b3) & 0xFFFFFFFFFFFFFFFF
+    return h or 1
+
+
+def test_hash_ids_equals_scalar_fnv1a():
+    ids = ['1', '1021', 'PS_000123', 'Petacciato', 'città', '', 'x' * 40]
+    assert hash_ids(ids).tolist() == [fnv1a(id_) for id_ in ids]
+
+
+def test_lookup_equals_dict(tmp_path):
+    rng = np.random.default_rng(0)
+    ids = [str(i) for i in rng.choice(10 ** 6, 5000, replace=False)]
+    ids += ids[:50]  # Duplicates: the first occurrence wins
+    expected = {}
+    for row, id_ in enumerate(ids):
+        expected.setdefault(id_, row)
+
+    index_dir = str(tmp_path / 'index')
+    build_index(ids, np.arange(len(ids)), index_dir, {})
+    index = open_index(index_dir)
+
+    assert (index.hashes != 0).sum() == len(expected)
+    for id_, row in expected.items():
+        assert lookup(index, id_) == row
+    for id_ in ('-1', 'missing', '1000000'):
+        assert lookup(index, id_) is None
+
+
+def test_probing_continues_past_a_rejected_match():
+    # Two keys with the same hash in adjacent slots, as after a 64-bit collision
+    key = int(hash_ids(['a'])[0])
+    size = 8
+    hashes = np.zeros(size, dtype=np.uint64)
+    values = np.full(size, -1, dtype=np.int64)
+    home = key & (size - 1)
+    hashes[home] = hashes[(home + 1) % size] = key
+    values[home], values[(home + 1) % size] = 10, 20
+    index = IDIndex(hashes, values)
+
+    assert lookup(index, 'a') == 10
+    assert lookup(index, 'a', verify=lambda value: value == 20) == 20
+    assert lookup(index, 'a', verify=lambda value: False) is None
+
+
+def test_row_and_offset_indexes_of_a_csv(tmp_path):
+    path = str(tmp_path / 'stack.csv')
+    with open(path, 'w') as f:
+        f.write('ID,lat,lon,0.0,0.08333333333333333,0.16666666666666666\n')
+        for i in range(30):
+            f.write(f'P{i},{42 + i / 100},{15 + i / 100},{i},,{2 * i}\n')
+
+    stack, index = open_row_index(path)
+    assert [find_row(stack, index, f'P{i}') for i in range(30)] == list(range(30))
+    assert find_row(stack, index, 'P30') is None
+    assert os.path.isdir(os.path.join(path + '.cache', 'id_index'))
+
+    id_, lat, lon, times, values = read_csv_row(path, 'P17')
+    assert (id_, lat, lon) == ('P17', 42.17, 15.17)
+    np.testing.assert_array_equal(values, [17.0, np.nan, 34.0])
+    assert read_csv_row(path, 'P99') is None
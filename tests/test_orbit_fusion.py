@@ -0,0 +1,133 @@
+"""Orbit_Fusion: LOS inversion of a synthetic east/vertical field, and pairing against a brute-force scan."""
+import numpy as np
+import pandas as pd
+import pytest
+from Orbit_Fusion import (ASC_INCIDENCE, ASC_HEADING, DESC_INCIDENCE, DESC_HEADING, los_matrix, decompose,
+                          match_pairs, fuse)
+from Deformation_Stack import load_stack
+from Spatial_Index import haversine, stack_spatial_index
+
+
+def los(east, up, incidence, heading):
+    """LOS displacement of east/up motion, written out per orbit as in the module docstring."""
+    inc, head = np.radians(incidence), np.radians(heading)
+    return -np.sin(inc) * np.cos(head) * east + np.cos(inc) * up
+
+
+def write_stack(path, ids, latitudes, longitudes, values):
+    frame = pd.DataFrame(values, columns=[str(m / 12) for m in range(values.shape[1])])
+    frame.insert(0, 'lon', longitudes)
+    frame.insert(0, 'lat', latitudes)
+    frame.insert(0, 'ID', ids)
+    frame.to_csv(path, index=False)
+
+
+def field(n_points, n_months, seed=0):
+    """East and vertical displacement (mm) of n_points over n_months, starting at 0."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_months) / 12
+    east = rng.normal(0, 3, (n_points, 1)) * t + rng.normal(0, 0.5, (n_points, n_months))
+    up = rng.normal(-8, 4, (n_points, 1)) * t + rng.normal(0, 0.5, (n_points, n_months))
+    return east - east[:, [0]], up - up[:, [0]]
+
+
+def test_decompose_inverts_the_los_projection():
+    east, up = field(30, 40)
+    G = los_matrix(ASC_INCIDENCE, ASC_HEADING, DESC_INCIDENCE, DESC_HEADING)
+    los_asc = los(east, up, ASC_INCIDENCE, ASC_HEADING)
+    los_desc = los(east, up, DESC_INCIDENCE, DESC_HEADING)
+    los_desc[3, 7] = np.nan
+
+    e, u = decompose(los_asc, los_desc, G)
+    assert np.isnan(e[3, 7]) and np.isnan(u[3, 7])
+    mask = ~np.isnan(e)
+    np.testing.assert_allclose(e[mask], east[mask], atol=1e-9)
+    np.testing.assert_allclose(u[mask], up[mask], atol=1e-9)
+
+
+def test_per_pair_geometry_equals_solve_loop():
+    rng = np.random.default_rng(1)
+    los_asc, los_desc = rng.normal(size=(2, 20, 12))
+    inc_a, inc_d = rng.uniform(30, 45, (2, 20))
+    G = los_matrix(inc_a, ASC_HEADING, inc_d, DESC_HEADING)
+    assert G.shape == (20, 2, 2)
+
+    e, u = decompose(los_asc, los_desc, G)
+    for p in range(20):
+        expected = np.linalg.solve(G[p], np.vstack([los_asc[p], los_desc[p]]))
+        np.testing.assert_allclose(e[p], expected[0], rtol=1e-12)
+        np.testing.assert_allclose(u[p], expected[1], rtol=1e-12)
+
+
+def synthetic_orbits(tmp_path, n_points=60, seed=2):
+    """ASC/DESC CSV stacks of one east/up field; ASC starts two months earlier and has one extra point."""
+    rng = np.random.default_rng(seed)
+    east, up = field(n_points, 48, seed=seed)
+    desc_lat = 41.9 + rng.random(n_points) / 10
+    desc_lon = 14.9 + rng.random(n_points) / 10
+    # ASC scatterers a few metres away from the DESC ones, the last one too far to pair
+    asc_lat = desc_lat + rng.normal(0, 1e-4, n_points)
+    asc_lon = desc_lon + rng.normal(0, 1e-4, n_points)
+    asc_lat[-1] += 0.01
+
+    # ASC epochs: 2011-03 .. ; DESC epochs: 2011-05 ..; 46 common months
+    asc_values = np.full((n_points, 48), np.nan)
+    asc_values[:, 2:] = los(east[:, :46], up[:, :46], ASC_INCIDENCE, ASC_HEADING) + 5.0
+    desc_values = los(east, up, DESC_INCIDENCE, DESC_HEADING) - 3.0
+    asc_values[0, 10] = np.nan
+
+    write_stack(str(tmp_path / 'ASC.csv'), [f"A{i}" for i in range(n_points)], asc_lat, asc_lon, asc_values)
+    write_stack(str(tmp_path / 'DESC.csv'), [f"D{i}" for i in range(n_points)], desc_lat, desc_lon, desc_values)
+    return east[:, :46], up[:, :46]
+
+
+@pytest.mark.parametrize('output_format', ['stack', 'csv'])
+def test_fused_field_equals_synthetic_motion(tmp_path, output_format):
+    east, up = synthetic_orbits(tmp_path)
+    prefix = str(tmp_path / 'FUSED')
+    n_pairs = fuse(str(tmp_path / 'ASC.csv'), str(tmp_path / 'DESC.csv'), prefix, asc_start='2011-03',
+                   desc_start='2011-05', output_format=output_format, block_size=16, dtype='float64')
+    assert n_pairs == 59
+
+    pairs = pd.read_csv(prefix + '_pairs.csv')
+    assert list(pairs['ASC_ID']) == [f"A{i}" for i in range(59)]
+    assert list(pairs['DESC_ID']) == [f"D{i}" for i in range(59)]
+
+    suffix = '.csv' if output_format == 'csv' else ''
+    vertical = load_stack(prefix + '_vertical' + suffix)
+    east_stack = load_stack(prefix + '_east' + suffix)
+    assert list(vertical.ids) == list(pairs['ID'])
+    np.testing.assert_allclose(vertical.times, np.arange(46) / 12)
+    # The input stacks are read through their float32 binary caches
+    np.testing.assert_allclose(np.delete(vertical.values[0], 8), np.delete(up[0], 8), atol=1e-4)
+    assert np.isnan(vertical.values[0, 8]) and np.isnan(east_stack.values[0, 8])
+    np.testing.assert_allclose(vertical.values[1:], up[1:59], atol=1e-4)
+    np.testing.assert_allclose(east_stack.values[1:], east[1:59], atol=1e-4)
+
+
+def test_match_pairs_equals_brute_force(tmp_path):
+    synthetic_orbits(tmp_path, seed=3)
+    asc = load_stack(str(tmp_path / 'ASC.csv'))
+    desc, desc_index = stack_spatial_index(str(tmp_path / 'DESC.csv'))
+    # A second ASC point close to DESC point 0, farther than A0
+    asc = asc._replace(latitudes=np.r_[asc.latitudes, desc.latitudes[0] + 2e-4],
+                       longitudes=np.r_[asc.longitudes, desc.longitudes[0]])
+
+    asc_rows, desc_rows, distances = match_pairs(asc, desc_index, max_distance=50.0)
+
+    expected = {}
+    for a, (lat, lon) in enumerate(zip(asc.latitudes, asc.longitudes)):
+        d = haversine(lat, lon, desc.latitudes, desc.longitudes)
+        nearest = int(np.argmin(d))
+        if d[nearest] <= 50.0 and (nearest not in expected or d[nearest] < expected[nearest][1]):
+            expected[nearest] = (a, d[nearest])
+    assert desc_rows.tolist() == sorted(expected)
+    assert asc_rows.tolist() == [expected[d][0] for d in sorted(expected)]
+    np.testing.assert_allclose(distances, [expected[d][1] for d in sorted(expected)], rtol=1e-9)
+
+
+def test_parallel_geometries_are_rejected(tmp_path):
+    synthetic_orbits(tmp_path, n_points=5)
+    with pytest.raises(ValueError):
+        fuse(str(tmp_path / 'ASC.csv'), str(tmp_path / 'DESC.csv'), str(tmp_path / 'FUSED'),
+             asc_geometry=(39.0, -12.0), desc_geometry=(39.0, -12.0))
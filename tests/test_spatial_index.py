@@ -0,0 +1,114 @@
+"""Spatial_Index: bounding-box, radius and nearest queries against brute-force scans."""
+import numpy as np
+import pandas as pd
+import pytest
+from Spatial_Index import (haversine, build_spatial_index, open_spatial_index, query_bbox, query_radius,
+                           query_nearest, select_rows, check_area, in_area, density_grid, table_spatial_index)
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2, radius=6371008.8):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(a))
+
+
+def points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = 41.9 + rng.random(n) / 10
+    longitudes = 14.9 + rng.random(n) / 10
+    latitudes[rng.random(n) < 0.02] = np.nan
+    return latitudes, longitudes
+
+
+@pytest.fixture
+def index(tmp_path):
+    latitudes, longitudes = points(4000)
+    build_spatial_index(latitudes, longitudes, str(tmp_path / 'spatial_index'), {})
+    return open_spatial_index(str(tmp_path / 'spatial_index'))
+
+
+def test_haversine_equals_scalar_formula():
+    latitudes, longitudes = points(50, seed=1)
+    latitudes = np.nan_to_num(latitudes, nan=42.0)
+    distances = haversine(41.95, 14.95, latitudes, longitudes)
+    for d, lat, lon in zip(distances, latitudes, longitudes):
+        assert d == pytest.approx(scalar_haversine(41.95, 14.95, lat, lon), rel=1e-12)
+
+
+@pytest.mark.parametrize('bbox', [(41.92, 41.97, 14.91, 14.95), (41.0, 43.0, 14.0, 16.0), (42.5, 43.0, 14.9, 15.0)])
+def test_bbox_equals_brute_force(index, bbox):
+    lat_min, lat_max, lon_min, lon_max = bbox
+    lat, lon = np.asarray(index.latitudes), np.asarray(index.longitudes)
+    inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+    assert query_bbox(index, *bbox).tolist() == np.flatnonzero(inside).tolist()
+
+
+def test_bbox_edges_are_inclusive(index):
+    row = int(index.rows[10])
+    lat, lon = float(index.latitudes[row]), float(index.longitudes[row])
+    assert row in query_bbox(index, lat, lat, lon, lon)
+
+
+@pytest.mark.parametrize('radius', [0.0, 250.0, 1500.0, 50000.0])
+def test_radius_equals_brute_force(index, radius):
+    centre = (41.95, 14.95)
+    lat, lon = np.asarray(index.latitudes), np.asarray(index.longitudes)
+    distances = np.array([scalar_haversine(*centre, a, b) for a, b in zip(lat, lon)])
+    rows = query_radius(index, *centre, radius)
+    # Points within a micrometre of the radius may fall either way
+    certain = np.flatnonzero(distances <= radius - 1e-6)
+    possible = np.flatnonzero(distances <= radius + 1e-6)
+    assert set(certain) <= set(rows.tolist()) <= set(possible)
+    assert in_area(lat, lon, near=centre, radius=radius)[certain].all()
+
+
+def test_nearest_equals_sorted_distances(index):
+    lat, lon = np.asarray(index.latitudes), np.asarray(index.longitudes)
+    queries = [(41.91, 14.99), (41.95, 14.95), (41.999, 14.901)]
+    distances, rows = query_nearest(index, [q[0] for q in queries], [q[1] for q in queries], k=5)
+    for q, (d, r) in enumerate(zip(distances, rows)):
+        brute = np.array([scalar_haversine(*queries[q], a, b) for a, b in zip(lat, lon)])
+        order = np.argsort(np.where(np.isnan(brute), np.inf, brute), kind='stable')[:5]
+        assert r.tolist() == order.tolist()
+        np.testing.assert_allclose(d, brute[order], rtol=1e-9)
+
+    distances, rows = query_nearest(index, 41.95, 14.95, k=3, max_distance=1.0)
+    assert np.isinf(distances).sum() == (rows == -1).sum() >= 2
+
+
+def test_select_rows_intersects_criteria(index):
+    bbox = (41.92, 41.97, 14.91, 14.97)
+    rows = select_rows(index, bbox=bbox, near=(41.95, 14.95), radius=2000.0)
+    lat, lon = np.asarray(index.latitudes), np.asarray(index.longitudes)
+    expected = np.flatnonzero(in_area(lat, lon, bbox=bbox, near=(41.95, 14.95), radius=2000.0))
+    assert rows.tolist() == expected.tolist()
+    assert select_rows(index) is None
+    assert len(select_rows(index, near=(41.95, 14.95), nearest=7)) == 7
+
+
+@pytest.mark.parametrize('options', [{'radius': 100.0}, {'nearest': 3}, {'near': (41.9, 14.9)}])
+def test_incomplete_area_is_rejected(options):
+    with pytest.raises(ValueError):
+        check_area(**options)
+
+
+def test_table_index_rebuilds_when_the_table_changes(tmp_path):
+    latitudes, longitudes = points(300, seed=2)
+    path = str(tmp_path / 'TP.csv')
+    pd.DataFrame({'ID': range(300), 'Latitude': latitudes, 'Longitude': longitudes}).to_csv(path, index=False)
+    assert len(table_spatial_index(path).rows) == np.sum(~np.isnan(latitudes))
+
+    pd.DataFrame({'ID': range(10), 'Latitude': latitudes[:10] * 0 + 42.0,
+                  'Longitude': longitudes[:10]}).to_csv(path, index=False)
+    index = table_spatial_index(path)
+    assert len(index.latitudes) == 10
+    assert query_bbox(index, 42.0, 42.0, 14.0, 16.0).tolist() == list(range(10))
+
+
+def test_density_grid_equals_histogram2d():
+    latitudes, longitudes = points(2000, seed=3)
+    valid = ~np.isnan(latitudes)
+    bounds = (41.9, 42.0, 14.9, 15.0)
+    grid, lat_edges, lon_edges = density_grid(latitudes, longitudes, 0.01, bounds=bounds)
+    expected, _, _ = np.histogram2d(latitudes[valid], longitudes[valid], bins=[lat_edges, lon_edges])
+    np.testing.assert_array_equal(grid, expected)
@@ -0,0 +1,142 @@
+"""STPD_Batch: checkpointed, resumed runs against an uninterrupted one, with a stub STPD/TPTR."""
+import os
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def stub_stpd(t, f, size=60, step=12, SNR=1, NDRI=0.3, dir_th=0, tp_th=1, margin=12, alpha=0.01):
+    """One turning point at the largest jump away from the margins, none below tp_th."""
+    if np.isnan(f).all():
+        raise ValueError("all nan")
+    jumps = np.abs(np.diff(np.nan_to_num(f)))
+    i = int(np.argmax(jumps[margin:-margin])) + margin
+    return [i] if jumps[i] > tp_th else []
+
+
+def stub_tptr(t, f, TPs):
+    """Straight-line fit of each segment; stats rows as TPTR lays them out."""
+    f = np.nan_to_num(f)
+    bounds = [0] + [int(tp) for tp in TPs] + [len(t)]
+    y, slopes = np.empty_like(f), []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        p = np.polyfit(t[a:b], f[a:b], 1)
+        y[a:b] = np.polyval(p, t[a:b])
+        slopes.append(p[0])
+    stats = [[t[int(tp)], slopes[j], slopes[j + 1] - slopes[j], 0.0, 0.5] for j, tp in enumerate(TPs)]
+    return stats, y
+
+
+# STPD/TPTR are an external package; the batch only needs their call signature
+for name, function in (('STPD', stub_stpd), ('TPTR', stub_tptr)):
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.ModuleType(name)
+        setattr(sys.modules[name], name, function)
+
+import STPD_Batch
+from STPD_Batch import run_batch, failed_ids_path, TP_COLUMNS
+from RunMe_API_STPD_ID import generate_dates
+
+
+class Interrupt(BaseException):
+    """Stands in for a KeyboardInterrupt/kill in the middle of a run."""
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Use the stubs and count the series STPD is run on; calls['stop'] interrupts the run there."""
+    calls = {'n': 0, 'stop': None}
+
+    def counting_stpd(t, f, **params):
+        if calls['n'] == calls['stop']:
+            raise Interrupt()
+        calls['n'] += 1
+        return stub_stpd(t, f, **params)
+
+    monkeypatch.setattr(STPD_Batch, 'STPD', counting_stpd)
+    monkeypatch.setattr(STPD_Batch, 'TPTR', stub_tptr)
+    return calls
+
+
+def dataset(n_ids=45, n_times=96, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.arange(n_times) / 12
+    values = np.cumsum(rng.normal(0, 0.3, (n_ids, n_times)), axis=1)
+    steps = rng.integers(20, n_times - 20, n_ids)
+    values[np.arange(n_times) >= steps[:, None]] -= 10
+    values[3] = np.nan     # STPD raises on these two
+    values[31] = np.nan
+    ids = [f"P{i}" for i in range(n_ids)]
+    latitudes = list(41.9 + rng.random(n_ids) / 10)
+    longitudes = list(14.9 + rng.random(n_ids) / 10)
+    deformation_dates = generate_dates(start_month=5, start_year=2011, num_months=n_times)
+    return ids, latitudes, longitudes, times, values, deformation_dates
+
+
+def run(output_path, data, **kwargs):
+    run_batch(*data, str(output_path), workers=1, chunk_size=10, **kwargs)
+    return pd.read_csv(output_path, dtype={'ID': str})
+
+
+def test_turning_points_of_every_id(tmp_path, calls):
+    data = dataset()
+    table = run(tmp_path / 'TP.csv', data)
+    ids, _, _, times, values, dates = data
+
+    assert list(table.columns) == TP_COLUMNS
+    expected = []
+    for id_, f in zip(ids, values):
+        if not np.isnan(f).all():
+            expected += [(id_, dates[tp].strftime('%b-%y')) for tp in stub_stpd(times, f)]
+    assert list(zip(table['ID'], table['Date (mm/yyyy)'])) == expected
+
+    failed = pd.read_csv(failed_ids_path(str(tmp_path / 'TP.csv')))
+    assert list(failed['ID']) == ['P3', 'P31']
+    assert failed['Error'].str.startswith('ValueError').all()
+    assert not os.path.exists(str(tmp_path / 'TP.csv') + '.parts')
+
+
+def test_resumed_run_equals_uninterrupted_run(tmp_path, calls):
+    data = dataset(seed=1)
+    expected = run(tmp_path / 'full.csv', data)
+
+    # Interrupted in the third chunk: the two finished chunks are kept
+    calls.update(n=0, stop=25)
+    with pytest.raises(Interrupt):
+        run(tmp_path / 'TP.csv', data)
+    parts = sorted(os.listdir(str(tmp_path / 'TP.csv') + '.parts'))
+    assert parts == ['chunk_000000.csv', 'chunk_000000_failed.csv', 'chunk_000001.csv', 'manifest.json']
+
+    calls.update(n=0, stop=None)
+    resumed = run(tmp_path / 'TP.csv', data)
+    assert calls['n'] == 25   # Chunks 2-4
+    pd.testing.assert_frame_equal(resumed, expected)
+    assert list(pd.read_csv(failed_ids_path(str(tmp_path / 'TP.csv')))['ID']) == ['P3', 'P31']
+
+
+def test_checkpoints_of_a_different_run_are_discarded(tmp_path, calls):
+    data = dataset(seed=2)
+    source = tmp_path / 'DESC.csv'
+    source.write_text('ID,lat,lon\n')
+    calls['stop'] = 25
+    with pytest.raises(Interrupt):
+        run(tmp_path / 'TP.csv', data, source=str(source))
+
+    # The source file changed in place: its checkpoints no longer apply
+    source.write_text('ID,lat,lon,0.0\n')
+    calls.update(n=0, stop=None)
+    table = run(tmp_path / 'TP.csv', data, source=str(source))
+    assert calls['n'] == 45
+    pd.testing.assert_frame_equal(table, run(tmp_path / 'full.csv', data))
+
+    # So do other STPD parameters
+    calls.update(n=0, stop=25)
+    with pytest.raises(Interrupt):
+        run(tmp_path / 'TP.csv', data, source=str(source))
+    calls.update(n=0, stop=None)
+    run(tmp_path / 'TP.csv', data, source=str(source), params=dict(STPD_Batch.STPD_PARAMS, tp_th=2))
+    assert calls['n'] == 45
@@ -0,0 +1,101 @@
+"""TP_Aggregator: streamed counts against the groupby / pd.cut + value_counts of the histogram scripts."""
+import numpy as np
+import pandas as pd
+import pytest
+from TP_Aggregator import (DIRECTION_BINS, DIRECTION_LABELS, count_frame, aggregate_files, monthly_series,
+                           direction_table)
+from Spatial_Index import in_area
+
+
+def original_parse_dates(date_series):
+    """TP_Histogram.parse_dates before vectorization: first format that parses anything, then 19xx -> 20xx."""
+    date_series = date_series.astype(str).str.strip()
+    for fmt in ['%y-%b', '%b-%y']:
+        parsed_dates = pd.to_datetime(date_series, errors='coerce', format=fmt)
+        if parsed_dates.notna().sum() > 0:
+            break
+    parsed_dates = parsed_dates.apply(lambda x: x.replace(year=x.year + 100) if pd.notnull(x) and x.year < 2000 else x)
+    return parsed_dates.dt.to_period('M')
+
+
+def original_monthly(df):
+    """Turning points per month as TP_Histogram.py counts them (months whose rows all lack an ID count 0)."""
+    dates = original_parse_dates(df['Date (mm/yyyy)'])
+    return df.assign(**{'Date (mm/yyyy)': dates}).dropna(subset=['Date (mm/yyyy)']).groupby(
+        'Date (mm/yyyy)')['ID'].count()
+
+
+def original_direction(df):
+    """All / Negative / Positive counts per bin, as DIR_Histogram.py computes them."""
+    bins = pd.cut(df["Direction"], bins=DIRECTION_BINS, labels=DIRECTION_LABELS, right=False)
+    return pd.DataFrame({
+        'All': bins.value_counts().reindex(DIRECTION_LABELS, fill_value=0),
+        'Negative': bins[df["Slope"] < 0].value_counts().reindex(DIRECTION_LABELS, fill_value=0),
+        'Positive': bins[df["Slope"] >= 0].value_counts().reindex(DIRECTION_LABELS, fill_value=0),
+    })
+
+
+def turning_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2011-05-01', '2022-12-01', freq='MS')
+    dates = months[rng.integers(0, len(months), n)].strftime('%b-%y').to_numpy(dtype=object)
+    dates[rng.random(n) < 0.02] = 'not a date'
+    dates[rng.random(n) < 0.02] = np.nan
+    direction = np.round(rng.normal(0, 7, n), 1)
+    direction[:12] = [-10, -8, -2, 2, 10, -np.inf, np.inf, np.nan, -1e-9, 8, 9.99, -0.0]
+    slope = rng.normal(0, 3, n)
+    slope[rng.random(n) < 0.05] = np.nan
+    slope[12] = 0.0
+    ids = np.arange(n).astype(str).astype(object)
+    ids[rng.random(n) < 0.01] = np.nan
+    return pd.DataFrame({'ID': ids, 'Latitude': 41.9 + rng.random(n) / 10, 'Longitude': 14.9 + rng.random(n) / 10,
+                         'Date (mm/yyyy)': dates, 'Direction': direction, 'NDRI': rng.random(n), 'Slope': slope})
+
+
+def check_counts(counts, df):
+    monthly = monthly_series(counts)
+    expected = original_monthly(df)
+    expected = expected[expected > 0]
+    assert list(monthly.index) == list(expected.index)
+    assert monthly.tolist() == expected.tolist()
+    pd.testing.assert_frame_equal(direction_table(counts), original_direction(df),
+                                  check_names=False, check_dtype=False, check_index_type=False)
+    assert counts.rows == len(df)
+
+
+def test_frame_counts_equal_original_scripts():
+    df = turning_points(3000)
+    check_counts(count_frame(df), df)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_csv_ranges_equal_whole_table(tmp_path, workers):
+    df = turning_points(5000, seed=1)
+    path = str(tmp_path / 'DESC_filtered_turning_points.csv')
+    df.to_csv(path, index=False)
+
+    counts = aggregate_files({'Descending Orbit': path}, workers=workers, block_bytes=20000)
+    check_counts(counts['Descending Orbit'], pd.read_csv(path))
+
+
+def test_parquet_row_groups_and_both_orbits(tmp_path):
+    desc, asc = turning_points(4000, seed=2), turning_points(1500, seed=3)
+    desc_path = str(tmp_path / 'DESC.parquet')
+    asc_path = str(tmp_path / 'ASC.csv')
+    desc.to_parquet(desc_path, index=False, row_group_size=700)
+    asc.to_csv(asc_path, index=False)
+
+    counts = aggregate_files({'Descending Orbit': desc_path, 'Ascending Orbit': asc_path}, workers=1)
+    check_counts(counts['Descending Orbit'], desc)
+    check_counts(counts['Ascending Orbit'], pd.read_csv(asc_path))
+
+
+def test_area_of_interest(tmp_path):
+    df = turning_points(3000, seed=4)
+    path = str(tmp_path / 'TP.csv')
+    df.to_csv(path, index=False)
+    area = {'bbox': (41.92, 41.97, 14.9, 14.95), 'near': (41.95, 14.95), 'radius': 3000.0}
+
+    counts = aggregate_files({'TP': path}, workers=1, block_bytes=30000, area=area)
+    table = pd.read_csv(path)
+    check_counts(counts['TP'], table[in_area(table['Latitude'], table['Longitude'], **area)])
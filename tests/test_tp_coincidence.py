@@ -0,0 +1,59 @@
+"""TP_Coincidence: prefix-sum window statistics and the permutation test."""
+import numpy as np
+import pytest
+from TP_Coincidence import window_statistics, coincidence_test
+
+
+@pytest.mark.parametrize('offset', [0, 1])
+def test_window_statistics_match_direct_slicing(offset):
+    rng = np.random.default_rng(0)
+    api = rng.gamma(2.0, 40.0, 120)
+    api[[5, 40, 41, 90]] = np.nan
+    windows = [1, 3, 6]
+    threshold = 90
+
+    stats = window_statistics(0, api, windows, threshold, offset=offset)
+
+    for m in range(len(api)):
+        for w, window in enumerate(windows):
+            start, stop = m - offset - window + 1, m - offset + 1
+            part = api[max(start, 0):max(stop, 0)]
+            complete = start >= 0 and stop <= len(api) and not np.isnan(part).any()
+            assert stats.complete[m, w] == complete
+            if complete:
+                assert stats.mean[m, w] == pytest.approx(part.mean())
+                assert stats.high_months[m, w] == (part > threshold).sum()
+            else:
+                assert np.isnan(stats.mean[m, w])
+                assert stats.high_months[m, w] == 0
+
+
+def planted_effect():
+    """200 months of low API, high exactly in the 10 months holding all turning points."""
+    api = np.full(200, 10.0)
+    tp_months = np.linspace(0, 199, 10).astype(int)
+    api[tp_months] = 200.0
+    counts = np.zeros((200, 1), dtype=np.int64)
+    counts[tp_months, 0] = 3
+    return window_statistics(0, api, [1], 90), counts
+
+
+def test_planted_effect_has_the_smallest_p_value():
+    stats, counts = planted_effect()
+    n_permutations = 999
+    test = coincidence_test(stats, counts, n_permutations=n_permutations, block_size=250, workers=1)
+
+    assert test.n_tps[0] == 30
+    assert test.rate[0, 0] == 1.0
+    assert test.mean_api[0, 0] == 200.0
+    # No shuffle puts all 10 months back on the high months (odds 1 / C(200, 10))
+    assert test.p_value[0, 0] == 1 / (n_permutations + 1)
+    assert test.p_value_api[0, 0] == 1 / (n_permutations + 1)
+
+
+def test_null_does_not_depend_on_workers():
+    stats, counts = planted_effect()
+    serial = coincidence_test(stats, counts, n_permutations=400, seed=3, block_size=100, workers=1)
+    parallel = coincidence_test(stats, counts, n_permutations=400, seed=3, block_size=100, workers=2)
+    np.testing.assert_array_equal(serial.null_rate, parallel.null_rate)
+    np.testing.assert_array_equal(serial.null_mean_api, parallel.null_mean_api)
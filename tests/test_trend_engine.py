@@ -0,0 +1,67 @@
+"""Trend_Engine: batched (masked) window fits against per-window least squares."""
+import numpy as np
+import pytest
+from Trend_Engine import WindowDesign, fit_windows
+
+
+def lstsq_window(t, y):
+    """(slope, intercept, rss, slope standard error) of one window by np.linalg.lstsq, NaN rows dropped."""
+    valid = ~np.isnan(y)
+    t, y = t[valid], y[valid]
+    if len(y) < 3:
+        return np.nan, np.nan, np.nan, np.nan
+    A = np.column_stack([t, np.ones_like(t)])
+    (slope, intercept), _, _, _ = np.linalg.lstsq(A, y, rcond=None)
+    rss = ((y - A @ [slope, intercept]) ** 2).sum()
+    se = np.sqrt(rss / (len(y) - 2) / ((t - t.mean()) ** 2).sum())
+    return slope, intercept, rss, se
+
+
+def series(n_points, n_times, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.arange(n_times) / 12
+    trend = rng.normal(0, 5, (n_points, 1)) * times + rng.normal(0, 10, (n_points, 1))
+    return times, trend + rng.normal(0, 2, (n_points, n_times))
+
+
+def check_against_lstsq(design, trends, times, values):
+    for i in range(len(values)):
+        for w, start in enumerate(design.starts):
+            window = slice(start, start + design.size)
+            slope, intercept, rss, se = lstsq_window(times[window], values[i, window])
+            np.testing.assert_allclose(
+                [trends.slopes[i, w], trends.intercepts[i, w], trends.rss[i, w], trends.slope_se[i, w]],
+                [slope, intercept, rss, se], rtol=1e-7, atol=1e-7)
+            assert trends.n_valid[i, w] == np.sum(~np.isnan(values[i, window]))
+
+
+def test_complete_windows_match_lstsq():
+    times, values = series(20, 100)
+    design = WindowDesign(times, size=24, step=6)
+    check_against_lstsq(design, design.fit(values), times, values)
+
+
+def test_masked_normal_equations_match_lstsq():
+    times, values = series(20, 100, seed=1)
+    rng = np.random.default_rng(2)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[0, :30] = np.nan   # Windows with fewer than 3 samples
+    values[1, 5:28] = np.nan
+    design = WindowDesign(times, size=24, step=6)
+    trends = design.fit(values)
+    check_against_lstsq(design, trends, times, values)
+    assert np.isnan(trends.slopes[0, 0])
+
+
+def test_row_blocks_do_not_change_the_fit():
+    times, values = series(50, 80, seed=3)
+    values[::7, 10:20] = np.nan
+    _, whole = fit_windows(times, values, size=24, step=12, block_size=1000)
+    _, blocks = fit_windows(times, values, size=24, step=12, block_size=7)
+    for a, b in zip(whole, blocks):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-12)
+
+
+def test_window_longer_than_series():
+    with pytest.raises(ValueError):
+        WindowDesign(np.arange(10), size=12)